@@ -1,43 +1,110 @@
-from flask import Flask, session
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+import logging
+import os
 from os import path
 from flask_login import LoginManager
 from .extensions import db
+from .database import database_url, engine_options, configure_engine
+from .metrics import init_metrics
 
 DB_NAME = "database.db"
 
 def create_app():
+    # No-op if gunicorn or the CLI already set up logging
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     app = Flask(__name__)
     app.config['SESSION_PERMANENT'] = False
-    app.config['SESSION_TYPE'] = "filesystem"
+    app.config['SESSION_TYPE'] = os.environ.get('SESSION_TYPE', "filesystem")  # or "cookie", see sessions.py
     app.config['SECRET_KEY'] = 'hjshjhdjah kjshkjdhjs'
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
+    # DATABASE_URL / DB_POOL_* / SQLITE_* env vars, see database.py
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(f'sqlite:///{DB_NAME}')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    # Recommender: 'exact' scores against every user, 'indexed' only against the top-K neighbour index
+    app.config['RECOMMENDER_MODE'] = os.environ.get('RECOMMENDER_MODE', 'exact')
+    app.config['RECOMMENDER_NEIGHBOURS'] = int(os.environ.get('RECOMMENDER_NEIGHBOURS', 50))
+    app.config['RECOMMENDER_INDEX_REBUILD_EVERY'] = 500  # new ratings before the index is rebuilt
+    # Saved model new workers start from; refreshed by the rebuild-recommender job
+    app.config['RECOMMENDER_SNAPSHOT'] = os.environ.get(
+        'RECOMMENDER_SNAPSHOT', os.path.join(app.instance_path, 'recommender.npz'))
+    app.config['RECOMMENDER_SNAPSHOT_EVERY'] = 1000  # feedback rows between snapshot rebuilds
+    # Recommendation result cache (per process unless RECOMMENDATION_CACHE_URL points at Redis)
+    app.config['RECOMMENDATION_CACHE_SIZE'] = 10000
+    app.config['RECOMMENDATION_CACHE_MAX_BYTES'] = 8 * 1024 * 1024
+    app.config['RECOMMENDATION_CACHE_TTL'] = 300
+    app.config['RECOMMENDATION_CACHE_URL'] = os.environ.get('RECOMMENDATION_CACHE_URL')
+    # Rendered page / fragment cache, per process (see fragments.py)
+    app.config['FRAGMENT_CACHE_SIZE'] = 20000
+    app.config['FRAGMENT_CACHE_MAX_BYTES'] = 16 * 1024 * 1024
+    app.config['FRAGMENT_CACHE_TTL'] = 3600
+    # Logged-in account cache, per process; IDENTITY_CACHE_URL shares its invalidations (see identity.py)
+    app.config['IDENTITY_CACHE_SIZE'] = 10000
+    app.config['IDENTITY_CACHE_MAX_BYTES'] = 8 * 1024 * 1024
+    app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', 30))
+    app.config['IDENTITY_CACHE_URL'] = os.environ.get('IDENTITY_CACHE_URL') or app.config['RECOMMENDATION_CACHE_URL']
+    # Password hashing cost, and throttling of the login / signup forms (see passwords.py, ratelimit.py)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+    app.config['RATELIMIT_URL'] = os.environ.get('RATELIMIT_URL')
+    app.config['RATELIMIT_TRUSTED_PROXIES'] = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+    app.config['RATELIMIT_LOGIN_IP'] = '10/minute'
+    app.config['RATELIMIT_LOGIN_ACCOUNT'] = '5/minute'
+    app.config['RATELIMIT_SIGNUP_IP'] = '5/hour'
+
+    # Werkzeug refuses bigger request bodies with 413 before a view reads them;
+    # the room over MAX_UPLOAD_BYTES is for the other form fields
+    from .images import MAX_UPLOAD_BYTES
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024
     db.init_app(app)
 
+    # Session data on disk, only a signed id in the cookie
+    from .sessions import init_sessions
+    init_sessions(app)
+
     from .views import views
     from .auth import auth
+    from .api import api
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/auth')
+    app.register_blueprint(api, url_prefix='/api/v1')
+
+    from .images import thumbnail_url
+    from .fragments import cached_fragment
+    from .queries import catalog_version
+    app.add_template_global(thumbnail_url)
+    app.add_template_global(cached_fragment)
+    app.add_template_global(catalog_version)
+
+    # Fingerprinted, precompressed static files once `flask build-assets` has run
+    from .assets import init_assets
+    init_assets(app)
+
+    # Streaming CSV / NDJSON / Parquet exports at /admin/export/<name>, behind EXPORT_TOKEN
+    from .exports import init_exports
+    init_exports(app)
+
+    from . import tasks  # Registers the background tasks (see jobs.py)
+
+    from .commands import register_commands
+    register_commands(app)
     
     from .models import User, Service, Provider, ContactMessage
 
+    # Only registers connect hooks; schema work is `flask init-db`, not boot
     with app.app_context():
-        db.create_all()
-        print("✅ Database and tables created successfully!")  # Debugging message
+        configure_engine(db.engine)
+        # Request timing, SQL counts, slow-query log and /metrics
+        init_metrics(app, db.engine)
 
     # Configure Flask-Login
     login_manager = LoginManager()
     login_manager.login_view = 'auth.customer_login'  # Default login page
     login_manager.init_app(app)
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        user_type = session.get("user_type")  # Fetch user type from session
-        if user_type == "customer":
-            return User.query.get(int(user_id))
-        elif user_type == "provider":
-            return Provider.query.get(int(user_id))
-        return None  # If user not found
+    # Customers and providers by 'customer:12' / 'provider:7', cached per process
+    from .identity import load_account
+    login_manager.user_loader(load_account)
 
     return app
@@ -0,0 +1,185 @@
+import hashlib
+from datetime import date, timedelta
+from functools import wraps
+
+from flask import Blueprint, request, jsonify, abort, current_app
+from flask_login import current_user
+
+from . import queries, serializers
+from .search import search_provider_ids, SEARCH_PAGE_SIZE
+from .availability import free_slots, parse_day
+from .models import Provider
+from .pagination import InvalidCursor
+from ..recommendation.recommendation_engine import get_recommendations, get_top_rated_providers
+
+api = Blueprint('api', __name__)
+
+MAX_PAGE_SIZE = 100
+
+
+def api_login_required(view):
+    # Same as flask_login.login_required but answers 401 JSON instead of redirecting
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify(error='authentication required'), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def conditional_json(rows, build, public=True, extra='', single=False):
+    """
+    Respond with build() as JSON, validated by an ETag derived from the
+    (id, version) of `rows`. When the client already has that version we
+    answer 304 without serializing anything.
+
+    Only a `single` resource also gets Last-Modified / If-Modified-Since: a
+    list can change without its newest row changing (a row drops out, or an
+    older one moves in), so there the ETag is the only validator.
+    """
+    versions = [(type(row).__name__, row.id, serializers.row_version(row)) for row in rows]
+    fingerprint = repr((versions, extra)).encode()
+    etag = hashlib.sha1(fingerprint).hexdigest()
+    last_modified = None
+    if single:
+        last_modified = max((version for _, _, version in versions if version), default=None)
+
+    not_modified = request.if_none_match.contains(etag) or (
+        not request.if_none_match
+        and last_modified is not None
+        and request.if_modified_since is not None
+        and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    )
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+        response.vary.add('Cookie')
+    response.cache_control.no_cache = True  # Cache, but revalidate every time
+    return response
+
+
+def _page_size(default):
+    return max(1, min(request.args.get('limit', default, type=int), MAX_PAGE_SIZE))
+
+
+@api.route('/providers')
+def provider_list():
+    try:
+        page = queries.directory_page(
+            request.args.get('service', type=int),
+            request.args.get('sort', 'rating'),
+            request.args.get('min_price', type=float),
+            request.args.get('max_price', type=float),
+            request.args.get('cursor'),
+            per_page=_page_size(queries.DIRECTORY_PAGE_SIZE),
+        )
+    except InvalidCursor:
+        abort(400)
+
+    return conditional_json(page.items, lambda: {
+        'items': [serializers.provider_summary(p) for p in page.items],
+        'next_cursor': page.next_cursor,
+    }, extra=page.next_cursor)
+
+
+@api.route('/search')
+def search():
+    """Ranked, prefix-matching provider search (usable for typeahead)."""
+    text = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    provider_ids, has_next = search_provider_ids(
+        text, request.args.get('service', type=int), page, _page_size(SEARCH_PAGE_SIZE)
+    )
+    providers = queries.providers_by_ids(provider_ids)
+
+    return conditional_json(providers, lambda: {
+        'query': text,
+        'page': page,
+        'has_next': has_next,
+        'items': [serializers.provider_summary(p) for p in providers],
+    }, extra=(text, page, has_next))
+
+
+@api.route('/providers/<int:provider_id>')
+def provider_detail(provider_id):
+    provider = queries.provider_with_service(provider_id)
+    # Phone and email only for signed-in users, like the /provider/<id> page, and never publicly cacheable
+    contact = current_user.is_authenticated
+    response = conditional_json([provider], lambda: serializers.provider_detail(provider, contact),
+                                public=not contact, extra=contact, single=True)
+    response.vary.add('Cookie')  # So a shared cache doesn't hand the public copy to a signed-in user
+    return response
+
+
+@api.route('/providers/<int:provider_id>/slots')
+def provider_slots(provider_id):
+    """Free slots between ?start= and ?end= (ISO dates, at most 31 days)."""
+    today = date.today()
+    start = parse_day(request.args.get('start'), today)
+    end = parse_day(request.args.get('end'), start + timedelta(days=6))
+    slots = free_slots(provider_id, max(start, today), end)
+    response = jsonify({
+        'provider_id': provider_id,
+        'slots': {day.isoformat(): [at.strftime('%H:%M') for at in times] for day, times in slots.items()},
+    })
+    response.cache_control.no_store = True  # Availability changes with every booking
+    return response
+
+
+@api.route('/recommendations')
+@api_login_required
+def recommendations():
+    service_id = request.args.get('service', type=int)
+    if service_id is None:
+        return jsonify(error='service is required'), 400
+
+    source = 'personalized'
+    provider_ids = get_recommendations(current_user.id, service_id) if not isinstance(current_user, Provider) else []
+    if not provider_ids:
+        source = 'top_rated'
+        provider_ids = get_top_rated_providers(service_id, top_n=4)
+    providers = queries.providers_by_ids(provider_ids)
+
+    return conditional_json(providers, lambda: {
+        'source': source,
+        'items': [serializers.provider_summary(p) for p in providers],
+    }, public=False, extra=source)
+
+
+@api.route('/bookings')
+@api_login_required
+def bookings():
+    cursor = request.args.get('cursor')
+    per_page = _page_size(queries.BOOKINGS_PAGE_SIZE)
+    try:
+        if isinstance(current_user, Provider):
+            page = queries.provider_bookings(current_user.id, cursor, per_page)
+            counterpart, feedback_status = 'customer', None
+        else:
+            page, feedback_status = queries.customer_bookings(current_user.id, cursor, per_page)
+            counterpart = 'provider'
+    except InvalidCursor:
+        abort(400)
+
+    def build():
+        items = []
+        for booking in page.items:
+            data = serializers.booking(booking, counterpart)
+            if feedback_status is not None:
+                data['has_feedback'] = feedback_status[booking.id]
+            items.append(data)
+        return {'items': items, 'next_cursor': page.next_cursor}
+
+    # The embedded provider / customer names are part of the payload, so their rows version it too
+    related = [getattr(booking, counterpart) for booking in page.items]
+    extra = (page.next_cursor, sorted(feedback_status.items()) if feedback_status else None)
+    return conditional_json(list(page.items) + related, build, public=False, extra=extra)
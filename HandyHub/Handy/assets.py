@@ -0,0 +1,173 @@
+"""
+Fingerprinted static assets.
+
+`flask build-assets` copies every file under static/ (except user uploads)
+to static/dist/ under a name carrying a hash of its content, and writes
+.gz/.br copies next to the text ones:
+
+    animate.css  ->  dist/animate.8c1e0f3a9b.css  (+ .gz, .br)
+
+plus dist/manifest.json mapping the original names to the built ones. With
+a manifest present, url_for('static', filename='animate.css') points at the
+built file, which is served with a one-year immutable Cache-Control (a
+changed file gets a new name, so it never needs revalidating) and in the
+best encoding the client accepts. Without one (a dev checkout that was
+never built) URLs and serving are Flask's defaults.
+
+The build only writes what's missing, so it is cheap to re-run; the
+gunicorn master runs it before forking (see prefork.py). Old builds are
+left in place for pages still cached with their URLs.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+SKIP_DIRS = {DIST, 'uploads'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.ico'}
+ONE_YEAR = 365 * 24 * 3600
+
+# {name: built name}, loaded once per process
+_manifest = None
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+
+def _write(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _compress(path):
+    """Write .gz (and .br if brotli is installed) copies, when they're smaller."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    encoders = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        encoders.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    except ImportError:
+        pass
+    sizes = {}
+    for suffix, encode in encoders:
+        if os.path.exists(path + suffix):
+            sizes[suffix] = os.path.getsize(path + suffix)
+            continue
+        encoded = encode(data)
+        if len(encoded) < len(data):
+            _write(path + suffix, encoded)
+            sizes[suffix] = len(encoded)
+    return sizes
+
+
+def build_assets(static_folder=None):
+    """
+    Build static/dist/ and its manifest. Returns
+    {name: {'built', 'bytes', '.gz', '.br'}} (compressed sizes when written).
+    """
+    static_folder = static_folder or current_app.static_folder
+    dist = os.path.join(static_folder, DIST)
+    os.makedirs(dist, exist_ok=True)
+
+    results, manifest = {}, {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            stem, ext = os.path.splitext(name)
+            built = f'{stem}.{_hash_file(source)}{ext}'
+            target = os.path.join(dist, built)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(source, 'rb') as f:
+                    _write(target, f.read())
+            manifest[name] = built
+            results[name] = {'built': built, 'bytes': os.path.getsize(target)}
+            if ext.lower() in COMPRESSIBLE:
+                results[name].update(_compress(target))
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    reset_manifest()
+    return results
+
+
+def manifest():
+    """{name: built name} from the last build, or {} if there isn't one."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(current_app.static_folder, DIST, MANIFEST)) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def reset_manifest():
+    global _manifest
+    _manifest = None
+
+
+def _fingerprint_url(endpoint, values):
+    # url_defaults hook: swap the filename for the built one
+    if endpoint == 'static' and current_app.config['STATIC_FINGERPRINT']:
+        built = manifest().get(values.get('filename'))
+        if built:
+            values['filename'] = f'{DIST}/{built}'
+
+
+def _cache_forever(response):
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+
+def serve_static(filename):
+    """The static route: built files get their precompressed copy and immutable caching."""
+    if not filename.startswith(DIST + '/') or filename.endswith('/' + MANIFEST):
+        response = current_app.send_static_file(filename)
+        if filename.startswith('uploads/'):
+            # Named after their content (see images.py), so they never change either
+            _cache_forever(response)
+        return response
+
+    directory = os.path.join(current_app.static_folder, DIST)
+    name = filename[len(DIST) + 1:]
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    encoding = None
+    if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(directory, name + suffix)):
+                encoding = candidate
+                name += suffix
+                break
+
+    response = send_from_directory(directory, name, mimetype=mimetype, max_age=ONE_YEAR)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    return _cache_forever(response)
+
+
+def init_assets(app):
+    app.config.setdefault('STATIC_FINGERPRINT', os.environ.get('STATIC_FINGERPRINT', '1') == '1')
+    app.url_defaults(_fingerprint_url)
+    app.view_functions['static'] = serve_static
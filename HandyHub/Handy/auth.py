@@ -1,14 +1,20 @@
+import logging
 import pprint
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash
 from .models import User, Provider
+from .search import index_provider
+from .geo import set_coordinates
+from .identity import invalidate_account
+from .passwords import needs_rehash
+from .ratelimit import client_ip, throttle, too_many_attempts
 from . import db  
 from werkzeug.security import check_password_hash
 from flask import session
 
 
 auth = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
 
 # ======================= Customer Authentication ======================= #
 
@@ -18,6 +24,11 @@ def customer_login():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        # Before the database and the (expensive) hash check
+        wait = throttle(('RATELIMIT_LOGIN_IP', client_ip()), ('RATELIMIT_LOGIN_ACCOUNT', email))
+        if wait:
+            return too_many_attempts("customer_login.html", wait)
+
         # Check if customer exists in the database
         user = User.query.filter_by(email=email).first()
 
@@ -29,6 +40,10 @@ def customer_login():
         if not user.check_password(password):
             flash('Incorrect password. Please try again.', category='error')
             return redirect(url_for('auth.customer_login'))
+        if needs_rehash(user.password_hash):
+            user.set_password(password)  # PASSWORD_HASH_METHOD changed since this hash was made
+            db.session.commit()
+            invalidate_account(user)
 
         # If authentication is successful, log in the user
         login_user(user, remember=True)
@@ -53,7 +68,9 @@ def customer_signup():
         password = request.form.get('password')
         confirm_password = request.form.get('confirmPassword')
 
-        print("Received Data:", first_name, last_name, email, phone, address, password, confirm_password)
+        wait = throttle(('RATELIMIT_SIGNUP_IP', client_ip()))
+        if wait:
+            return too_many_attempts("customer_register.html", wait, user=current_user)
 
         # Check if the email already exists
         existing_user = User.query.filter_by(email=email).first()
@@ -61,7 +78,7 @@ def customer_signup():
 
         if existing_user:
             flash('<div class="alert alert-danger" role="alert">Email already exists.</div>', category='error')
-            print("User already exists!")
+            logger.info('signup rejected: email already registered')
             return redirect(url_for('auth.customer_signup'))
         if existing_phone:
             flash('<div class="alert alert-danger" role="alert">Phone number already exists.</div>', category='error')
@@ -70,7 +87,6 @@ def customer_signup():
         # Check if passwords match
         if password != confirm_password:
             flash('<div class="alert alert-danger" role="alert">Passwords do not match!</div>', category='error')
-            print("Passwords do not match!")
             return redirect(url_for('auth.customer_signup'))
 
         # Create new user
@@ -82,6 +98,7 @@ def customer_signup():
             address=address,
             role=role  # Store address
         )
+        set_coordinates(new_user, address)
 
         # Ensure password hashing method is available
         if hasattr(new_user, 'set_password'):
@@ -92,7 +109,7 @@ def customer_signup():
 
         db.session.add(new_user)
         db.session.commit()
-        print("User created successfully!")
+        logger.info('customer %s signed up', new_user.id)
 
         # Log in the new user
         login_user(new_user, remember=True)
@@ -109,6 +126,11 @@ def provider_login():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        # Before the database and the (expensive) hash check
+        wait = throttle(('RATELIMIT_LOGIN_IP', client_ip()), ('RATELIMIT_LOGIN_ACCOUNT', email))
+        if wait:
+            return too_many_attempts("provider_login.html", wait)
+
         # Check if provider exists in the database
         provider = Provider.query.filter_by(email=email).first()
 
@@ -120,6 +142,10 @@ def provider_login():
         if not check_password_hash(provider.password_hash, password):
             flash('Incorrect password. Please try again.', category='error')
             return redirect(url_for('auth.provider_login'))
+        if needs_rehash(provider.password_hash):
+            provider.set_password(password)  # PASSWORD_HASH_METHOD changed since this hash was made
+            db.session.commit()
+            invalidate_account(provider)
 
         # If authentication is successful, log in the provider
         login_user(provider, remember=True)
@@ -134,9 +160,10 @@ def provider_login():
 @auth.route('/provider-signup', methods=['GET', 'POST'])
 def provider_signup():
     from .models import Service  # Ensure you import the Service model
+    from .queries import all_services
 
-    # Fetch all available services from the database
-    services = Service.query.all()
+    # Fetch all available services (cached per process)
+    services = all_services()
 
     if request.method == 'POST':
         first_name = request.form.get('firstName')
@@ -149,6 +176,10 @@ def provider_signup():
         password = request.form.get('password')
         confirm_password = request.form.get('confirmPassword')
 
+        wait = throttle(('RATELIMIT_SIGNUP_IP', client_ip()))
+        if wait:
+            return too_many_attempts("provider_register.html", wait, user=current_user, services=services)
+
         # Check if the email already exists
         existing_provider_email = Provider.query.filter_by(email=email).first()
         if existing_provider_email:
@@ -192,6 +223,8 @@ def provider_signup():
 
         # Save to DB
         db.session.add(new_provider)
+        db.session.flush()  # Assigns the id the search index row needs
+        index_provider(new_provider)
         db.session.commit()
 
         # Log in the provider
@@ -206,6 +239,7 @@ def provider_signup():
 @login_required
 def logout():
     # pprint.pprint(dict(session))
+    invalidate_account(current_user)
     logout_user()
     
     # flash('You have been logged out.', category='info')a
@@ -0,0 +1,186 @@
+"""
+Provider availability and slot reservation.
+
+A provider's bookable slots come from their weekly working hours (or
+DEFAULT_WORKING_HOURS until they first save theirs), minus blackout dates,
+minus slots already held in slot_reservation. Reserving a slot is an
+INSERT guarded by a unique (provider_id, slot_date, slot_time) constraint,
+so two workers racing for the same slot can't both win.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import literal, null, union_all
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import Booking, Provider, ProviderAvailability, ProviderBlackout, SlotReservation
+from .rollups import record_booking
+
+# weekday (Monday = 0) -> (start, end); Sundays off
+DEFAULT_WORKING_HOURS = {weekday: (time(9, 0), time(18, 0)) for weekday in range(6)}
+DEFAULT_SLOT_MINUTES = 60
+MAX_RANGE_DAYS = 31
+ACTIVE_STATUSES = ('Pending', 'Confirmed')
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def weekly_schedule(provider_id):
+    """{weekday: (start, end, slot_minutes)} for a provider."""
+    rows = ProviderAvailability.query.filter_by(provider_id=provider_id).all()
+    if not rows and not db.session.query(Provider.hours_configured).filter_by(id=provider_id).scalar():
+        return {day: (start, end, DEFAULT_SLOT_MINUTES) for day, (start, end) in DEFAULT_WORKING_HOURS.items()}
+    return {row.weekday: (row.start_time, row.end_time, row.slot_minutes) for row in rows}
+
+
+def day_slots(schedule, day):
+    """Slot start times on `day` according to a weekly schedule."""
+    hours = schedule.get(day.weekday())
+    if not hours:
+        return []
+    start, end, minutes = hours
+    slots = []
+    current = datetime.combine(day, start)
+    last_start = datetime.combine(day, end) - timedelta(minutes=minutes)
+    while current <= last_start:
+        slots.append(current.time())
+        current += timedelta(minutes=minutes)
+    return slots
+
+
+def occupancy(provider_id, start, end):
+    """
+    Reserved slots and blackout dates between start and end (inclusive),
+    fetched in a single UNION ALL query. Returns (reserved {(date, time)},
+    blackout {date}).
+    """
+    reserved = db.select(
+        literal('r').label('kind'), SlotReservation.slot_date.label('day'), SlotReservation.slot_time.label('at')
+    ).where(
+        SlotReservation.provider_id == provider_id,
+        SlotReservation.slot_date.between(start, end),
+    )
+    blackouts = db.select(
+        literal('b').label('kind'), ProviderBlackout.date.label('day'), null().label('at')
+    ).where(
+        ProviderBlackout.provider_id == provider_id,
+        ProviderBlackout.date.between(start, end),
+    )
+    taken, closed = set(), set()
+    for kind, day, at in db.session.execute(union_all(reserved, blackouts)):
+        if kind == 'r':
+            taken.add((day, at))
+        else:
+            closed.add(day)
+    return taken, closed
+
+
+def free_slots(provider_id, start, end, now=None):
+    """{date: [time, ...]} of bookable slots between start and end (inclusive)."""
+    if end < start:
+        return {}
+    end = min(end, start + timedelta(days=MAX_RANGE_DAYS - 1))
+    now = now or datetime.now()
+    schedule = weekly_schedule(provider_id)
+    taken, closed = occupancy(provider_id, start, end)
+
+    result = {}
+    day = start
+    while day <= end:
+        if day not in closed:
+            slots = [
+                slot for slot in day_slots(schedule, day)
+                if (day, slot) not in taken and datetime.combine(day, slot) > now
+            ]
+            if slots:
+                result[day] = slots
+        day += timedelta(days=1)
+    return result
+
+
+def is_bookable_slot(provider_id, day, at, now=None):
+    """True if `at` on `day` is a slot of the provider's schedule, in the future and not blacked out."""
+    now = now or datetime.now()
+    if datetime.combine(day, at) <= now:
+        return False
+    if at not in day_slots(weekly_schedule(provider_id), day):
+        return False
+    return ProviderBlackout.query.filter_by(provider_id=provider_id, date=day).first() is None
+
+
+def book_slot(customer_id, provider, day, at):
+    """
+    Create a Pending booking and reserve its slot in one transaction.
+    Raises SlotUnavailable if the slot isn't offered or someone else got it first.
+    """
+    if not is_bookable_slot(provider.id, day, at):
+        raise SlotUnavailable('This time is outside the provider\'s available slots.')
+
+    booking = Booking(
+        customer_id=customer_id,
+        provider_id=provider.id,
+        service_id=provider.service_id,
+        booking_date=day,
+        booking_time=at,
+        status="Pending",
+    )
+    db.session.add(booking)
+    try:
+        db.session.flush()
+        db.session.add(SlotReservation(provider_id=provider.id, slot_date=day, slot_time=at, booking_id=booking.id))
+        record_booking(booking)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise SlotUnavailable('Sorry, that slot was just booked. Please pick another time.')
+    return booking
+
+
+def release_slot(booking):
+    """Free a booking's slot (on cancel/reject); part of the caller's transaction."""
+    SlotReservation.query.filter_by(booking_id=booking.id).delete(synchronize_session=False)
+
+
+def backfill_reservations():
+    """
+    Reserve slots for existing active bookings made before reservations
+    existed. Returns (reserved, conflicts) where conflicts are bookings whose
+    slot was already held (pre-existing double bookings).
+    """
+    reserved_ids = {booking_id for (booking_id,) in db.session.query(SlotReservation.booking_id)}
+    held = {
+        (provider_id, day, at)
+        for provider_id, day, at in db.session.query(
+            SlotReservation.provider_id, SlotReservation.slot_date, SlotReservation.slot_time
+        )
+    }
+    reserved, conflicts = 0, []
+    bookings = (
+        Booking.query
+        .filter(Booking.status.in_(ACTIVE_STATUSES))
+        .order_by(Booking.created_at, Booking.id)
+    )
+    for booking in bookings:
+        if booking.id in reserved_ids:
+            continue
+        key = (booking.provider_id, booking.booking_date, booking.booking_time)
+        if key in held:
+            conflicts.append(booking.id)
+            continue
+        held.add(key)
+        db.session.add(SlotReservation(
+            provider_id=booking.provider_id, slot_date=booking.booking_date,
+            slot_time=booking.booking_time, booking_id=booking.id,
+        ))
+        reserved += 1
+    db.session.commit()
+    return reserved, conflicts
+
+
+def parse_day(value, default=None):
+    try:
+        return date.fromisoformat(value) if value else default
+    except ValueError:
+        return default
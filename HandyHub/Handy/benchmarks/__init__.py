@@ -0,0 +1,5 @@
+"""
+Benchmarks run through the flask CLI (see commands.py). Each one measures
+something a deploy can regress and can fail with a non-zero exit code, so
+they double as CI checks.
+"""
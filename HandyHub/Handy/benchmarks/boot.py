@@ -0,0 +1,80 @@
+"""
+Worker boot benchmark.
+
+Boots the app in fresh interpreters, the way a gunicorn worker would, and
+records how long importing + create_app() takes and the resident memory
+afterwards. Heavy numeric modules showing up at boot are reported too,
+since the recommender is supposed to load them on first use.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules that must not be imported just by booting the app
+HEAVY_MODULES = ('numpy', 'scipy', 'pandas', 'sklearn')
+
+PACKAGE_ROOT = Path(__file__).resolve().parents[3]
+
+_CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+from HandyHub.Handy import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_kb = rss / 1024 if sys.platform == 'darwin' else rss  # bytes on macOS, KiB on Linux
+print(json.dumps({
+    'import_seconds': imported - start,
+    'create_app_seconds': done - imported,
+    'boot_seconds': done - start,
+    'rss_mb': rss_kb / 1024,
+    'heavy_modules': [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def boot_once():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(PACKAGE_ROOT), env.get('PYTHONPATH')]))
+    output = subprocess.run(
+        [sys.executable, '-c', _CHILD % (HEAVY_MODULES,)],
+        capture_output=True, text=True, check=True, env=env, cwd=PACKAGE_ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_boot(runs=5):
+    """Median timings and RSS over `runs` fresh boots."""
+    samples = [boot_once() for _ in range(max(1, runs))]
+    result = {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in ('import_seconds', 'create_app_seconds', 'boot_seconds', 'rss_mb')
+    }
+    result['heavy_modules'] = sorted({name for sample in samples for name in sample['heavy_modules']})
+    result['runs'] = len(samples)
+    return result
+
+
+def check_boot(result, max_seconds=None, max_rss_mb=None, baseline=None, tolerance=0.25, record=False):
+    """List of regression messages (empty when everything is within limits)."""
+    problems = []
+    if result['heavy_modules']:
+        problems.append(f"imported at boot: {', '.join(result['heavy_modules'])}")
+    if max_seconds is not None and result['boot_seconds'] > max_seconds:
+        problems.append(f"boot {result['boot_seconds']:.3f}s > {max_seconds:.3f}s")
+    if max_rss_mb is not None and result['rss_mb'] > max_rss_mb:
+        problems.append(f"RSS {result['rss_mb']:.1f} MB > {max_rss_mb:.1f} MB")
+
+    if baseline and record:
+        Path(baseline).write_text(json.dumps(result, indent=2) + '\n')
+    elif baseline and Path(baseline).exists():
+        previous = json.loads(Path(baseline).read_text())
+        for key, unit in (('boot_seconds', 's'), ('rss_mb', ' MB')):
+            limit = previous[key] * (1 + tolerance)
+            if result[key] > limit:
+                problems.append(f"{key} {result[key]:.3f}{unit} > baseline {previous[key]:.3f}{unit} +{tolerance:.0%}")
+    return problems
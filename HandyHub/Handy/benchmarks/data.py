@@ -0,0 +1,215 @@
+"""
+Synthetic data at production-like volume.
+
+`generate()` adds customers, providers, bookings and feedback with the skew
+real traffic has: provider popularity and customer activity both follow a
+Zipf distribution (a few providers get most bookings, a few power users
+make most of them), and each provider has a hidden quality that its ratings
+scatter around, so the recommender has signal to find.
+
+Rows go in with batched executemany inserts and explicit ids, so a million
+bookings take seconds rather than going through the ORM one by one. Every
+generated account shares one password (hashed once). Runs are seeded and
+repeatable; running again on the same database adds another set of rows.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, insert
+
+from ..extensions import db
+from ..models import Booking, Feedback, Provider, Service, SlotReservation, User
+from ..passwords import hash_password
+
+SERVICES = ('Plumbing', 'Electrician', 'Carpentry', 'Gardening')  # Same as add_services.py
+CITIES = ('Springfield', 'Riverton', 'Lakeside', 'Fairview', 'Greenville', 'Centerville', 'Kingston', 'Salem')
+FIRST_NAMES = ('Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn')
+LAST_NAMES = ('Smith', 'Patel', 'Garcia', 'Kim', 'Nguyen', 'Brown', 'Khan', 'Silva', 'Murphy', 'Cohen')
+COMMENTS = (None, None, None, 'Great job', 'On time and tidy', 'Would book again', 'Took longer than quoted')
+EMAIL_DOMAIN = 'bench.handyhub.test'
+DEFAULT_PASSWORD = 'password'
+
+
+def _zipf_cumulative(n, skew):
+    total, cumulative = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** skew
+        cumulative.append(total)
+    return cumulative
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows):
+    if rows:
+        db.session.execute(insert(model), rows)
+        rows.clear()
+
+
+def _services():
+    """{id: name}, adding the standard services if they're missing."""
+    existing = {name: service_id for service_id, name in db.session.query(Service.id, Service.name)}
+    for name in SERVICES:
+        if name not in existing:
+            service = Service(name=name)
+            db.session.add(service)
+            db.session.flush()
+            existing[name] = service.id
+    return {service_id: name for name, service_id in existing.items()}
+
+
+def _working_slot(rng, day):
+    # Default hours are Mon-Sat 9:00-18:00 in hourly slots (see availability.py)
+    while day.weekday() == 6:
+        day += timedelta(days=1)
+    return day, time(rng.randrange(9, 18), 0)
+
+
+def generate(users=1000, providers=100, bookings=10000, completed_rate=0.7, feedback_rate=0.6,
+             skew=1.1, seed=0, password=DEFAULT_PASSWORD, batch_size=5000, today=None):
+    """
+    Insert the rows and commit. completed_rate is the share of bookings in
+    the past and Completed (the rest are Cancelled, or upcoming Pending /
+    Confirmed with their slot reserved); feedback_rate the share of completed
+    bookings that were reviewed. Returns the number of rows of each kind.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    now = datetime.utcnow()
+    password_hash = hash_password(password)
+    services = _services()
+    service_ids = sorted(services)
+
+    first_user, first_provider = _next_id(User), _next_id(Provider)
+    first_booking, first_feedback = _next_id(Booking), _next_id(Feedback)
+
+    rows = []
+    for user_id in range(first_user, first_user + users):
+        rows.append({
+            'id': user_id,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'email': f'user{user_id}@{EMAIL_DOMAIN}',
+            'phone': f'1{user_id:010d}',
+            'address': f'{rng.randrange(1, 999)} Main St, {rng.choice(CITIES)}',
+            'role': 'customer',
+            'image': 'default.png',
+            'password_hash': password_hash,
+            'created_at': now - timedelta(days=rng.randrange(730)),
+        })
+        if len(rows) >= batch_size:
+            _insert(User, rows)
+    _insert(User, rows)
+
+    provider_service, provider_quality = {}, {}
+    for provider_id in range(first_provider, first_provider + providers):
+        service_id = rng.choice(service_ids)
+        provider_service[provider_id] = service_id
+        provider_quality[provider_id] = min(5.0, max(1.0, rng.gauss(3.9, 0.7)))
+        created_at = now - timedelta(days=rng.randrange(730))
+        rows.append({
+            'id': provider_id,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'business_name': f'{rng.choice(LAST_NAMES)} {services[service_id]} Co',
+            'email': f'provider{provider_id}@{EMAIL_DOMAIN}',
+            'phone': f'2{provider_id:010d}',
+            'password_hash': password_hash,
+            'service_id': service_id,
+            'service_price': round(rng.lognormvariate(4.0, 0.5), 2),
+            'experience': rng.randrange(0, 31),
+            'image': 'default.png',
+            'location': rng.choice(CITIES),
+            'role': 'provider',
+            'rating': 0.0,
+            'rating_sum': 0,
+            'rating_count': 0,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        if len(rows) >= batch_size:
+            _insert(Provider, rows)
+    _insert(Provider, rows)
+
+    # Rank -> id is shuffled so popularity isn't tied to signup order
+    customer_ids = list(range(first_user, first_user + users))
+    provider_ids = list(range(first_provider, first_provider + providers))
+    rng.shuffle(customer_ids)
+    rng.shuffle(provider_ids)
+    customer_weights = _zipf_cumulative(users, skew)
+    provider_weights = _zipf_cumulative(providers, skew)
+
+    booking_rows, reservation_rows, feedback_rows = [], [], []
+    held = set()
+    counts = {'users': users, 'providers': providers, 'bookings': bookings, 'feedback': 0, 'reservations': 0}
+    feedback_id = first_feedback
+    for booking_id in range(first_booking, first_booking + bookings):
+        customer_id = rng.choices(customer_ids, cum_weights=customer_weights)[0]
+        provider_id = rng.choices(provider_ids, cum_weights=provider_weights)[0]
+        roll = rng.random()
+        if roll < completed_rate:
+            status = 'Completed'
+        elif roll < completed_rate + (1 - completed_rate) * 0.3:
+            status = 'Cancelled'
+        else:
+            status = None  # Upcoming
+        if status:
+            day, at = _working_slot(rng, today - timedelta(days=rng.randrange(1, 366)))
+        else:
+            status = rng.choice(('Pending', 'Confirmed'))
+            day, at = _working_slot(rng, today + timedelta(days=rng.randrange(1, 29)))
+            if (provider_id, day, at) in held:
+                status = 'Cancelled'  # Popular providers fill up; don't double-book them
+            else:
+                held.add((provider_id, day, at))
+                reservation_rows.append({'provider_id': provider_id, 'slot_date': day, 'slot_time': at,
+                                         'booking_id': booking_id})
+        created_at = datetime.combine(min(day, today), at) - timedelta(days=rng.randrange(1, 15))
+        booking_rows.append({
+            'id': booking_id,
+            'customer_id': customer_id,
+            'provider_id': provider_id,
+            'service_id': provider_service[provider_id],
+            'booking_date': day,
+            'booking_time': at,
+            'status': status,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        if status == 'Completed' and rng.random() < feedback_rate:
+            rating = min(5, max(1, round(rng.gauss(provider_quality[provider_id], 0.8))))
+            feedback_rows.append({
+                'id': feedback_id,
+                'user_id': customer_id,
+                'provider_id': provider_id,
+                'booking_id': booking_id,
+                'rating': rating,
+                'comment': rng.choice(COMMENTS),
+                'created_at': datetime.combine(day, at) + timedelta(hours=rng.randrange(1, 72)),
+            })
+            feedback_id += 1
+        if len(booking_rows) >= batch_size:
+            counts['feedback'] += len(feedback_rows)
+            counts['reservations'] += len(reservation_rows)
+            _insert(Booking, booking_rows)
+            _insert(Feedback, feedback_rows)
+            _insert(SlotReservation, reservation_rows)
+    counts['feedback'] += len(feedback_rows)
+    counts['reservations'] += len(reservation_rows)
+    _insert(Booking, booking_rows)
+    _insert(Feedback, feedback_rows)
+    _insert(SlotReservation, reservation_rows)
+    db.session.commit()
+
+    # Aggregates, rollups and the search index, the same way the backfills do it
+    from ..ratings import rebuild_provider_ratings
+    from ..rollups import rebuild_rollups
+    from ..search import ensure_search_index, rebuild_search_index
+    rebuild_provider_ratings()
+    with db.engine.begin() as conn:
+        rebuild_rollups(conn)
+    ensure_search_index()
+    rebuild_search_index()
+    return counts
@@ -0,0 +1,127 @@
+"""
+Login flood: how much legitimate traffic gets through credential stuffing.
+
+Attacker threads post wrong passwords for real accounts to the customer
+login at `rate` attempts per second in total (0: as fast as they can),
+rotating over `attacker_ips` addresses (only in-process; over HTTP they all
+come from this machine). A fixed rate is what a flood looks like from the
+server: attempts keep arriving whether or not earlier ones were answered. Meanwhile
+logged-in users browse `paths`. Reported per scenario: the users' req/s and
+latency, and how many attempts were hashed versus refused with 429.
+
+In-process the scenarios are no flood, flood with the rate limiter off and
+flood with it on. Against a server the limiter is whatever it runs with,
+so there it's no flood and flood.
+"""
+import random
+import statistics
+import threading
+import time
+
+from .data import DEFAULT_PASSWORD
+from .flows import _HttpSession, _TestClientSession, _fixtures
+from .load import percentile
+
+DEFAULT_PATHS = ('/handyman', '/booking-history')
+
+
+def run_flood(app, base_url=None, duration=10.0, rate=50.0, attackers=8, attacker_ips=16, users=2,
+              paths=DEFAULT_PATHS, password=DEFAULT_PASSWORD, seed=0):
+    """
+    Returns {scenario: {'requests', 'errors', 'rps', 'p50_ms', 'p95_ms',
+    'p99_ms', 'attempts', 'hashed', 'limited'}}; the attempt counts are
+    the attackers', the rest the legitimate users'.
+    """
+    from ..ratelimit import get_backend
+
+    with app.app_context():
+        customers = _fixtures(users, seed)[0]
+
+    def new_session(remote_addr):
+        return _HttpSession(base_url) if base_url else _TestClientSession(app, remote_addr)
+
+    if base_url:
+        scenarios = {'no flood': (0, None), 'flood': (attackers, None)}
+    else:
+        scenarios = {'no flood': (0, False), 'flood, limiter off': (attackers, False),
+                     'flood, limiter on': (attackers, True)}
+
+    enabled = app.config['RATELIMIT_ENABLED']
+    results = {}
+    for scenario, (attacker_count, limiter) in scenarios.items():
+        if limiter is not None:
+            app.config['RATELIMIT_ENABLED'] = limiter
+            with app.app_context():
+                get_backend().clear()
+
+        sessions = []
+        for index in range(users):
+            session = new_session(f'198.51.100.{index + 1}')
+            session.post('/auth/customer-login', {'email': customers[index % len(customers)], 'password': password})
+            sessions.append(session)
+
+        latencies, errors, attempts = [], [0], {'hashed': 0, 'limited': 0, 'other': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def user(index):
+            rng = random.Random(seed * 1000 + index)
+            session = sessions[index]
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = session.get(rng.choice(paths)) == 200
+                except OSError:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        def attacker(index):
+            rng = random.Random(seed * 1000 + 500 + index)
+            interval = attacker_count / rate if rate else 0.0
+            next_at = time.perf_counter() + index * interval / attacker_count
+            attempt = 0
+            while time.perf_counter() < deadline:
+                if interval:
+                    # Keep to the schedule; a slow answer doesn't delay the next attempt
+                    time.sleep(max(0.0, next_at - time.perf_counter()))
+                    next_at += interval
+                session = new_session(f'203.0.113.{(index + attempt * attacker_count) % attacker_ips + 1}')
+                try:
+                    status = session.post('/auth/customer-login', {
+                        'email': rng.choice(customers), 'password': f'guess-{rng.random()}'})
+                except OSError:
+                    status = None
+                # A wrong password redirects back to the form after the hash check
+                outcome = {302: 'hashed', 429: 'limited'}.get(status, 'other')
+                with lock:
+                    attempts[outcome] += 1
+                attempt += 1
+
+        threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+        threads += [threading.Thread(target=attacker, args=(i,)) for i in range(attacker_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        results[scenario] = {
+            'requests': len(latencies) + errors[0],
+            'errors': errors[0],
+            'rps': len(latencies) / wall if wall else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            'attempts': sum(attempts.values()),
+            'hashed': attempts['hashed'],
+            'limited': attempts['limited'],
+        }
+    app.config['RATELIMIT_ENABLED'] = enabled
+    return results
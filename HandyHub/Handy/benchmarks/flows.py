@@ -0,0 +1,213 @@
+"""
+End-to-end benchmark of the main user flows.
+
+Each flow is one request, timed on its own: logging in, the directory with
+and without a service selected, the provider page, booking history,
+booking a slot and leaving feedback. Flows run in-process through the Flask
+test client (no server needed, includes everything but the WSGI server) or
+against a running server over HTTP. Accounts, providers and reviewable
+bookings come from the database, so run `flask gen-data` first.
+
+Results per flow match benchmarks.load.run_load: requests, errors, req/s
+and p50/p95/p99. Each feedback submit needs a fresh login as the booking's
+customer; that login isn't in the latencies but does count against req/s,
+and a failed one counts as an error of the flow.
+
+The flows log the same accounts in many times a minute, which the login
+rate limits would refuse: in-process the limiter is off for the run (and
+every session has its own client address anyway); against a server, run
+it with RATELIMIT_ENABLED=0.
+"""
+import http.cookiejar
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, time as clock, timedelta
+
+from sqlalchemy import func
+
+from ..extensions import db
+from ..models import Booking, Feedback, Provider, Service, User
+from .data import DEFAULT_PASSWORD
+from .load import _NoRedirect, percentile
+
+FLOWS = ('login', 'directory', 'directory_service', 'provider', 'history', 'book', 'feedback')
+
+
+class _TestClientSession:
+    def __init__(self, app, remote_addr=None):
+        self._client = app.test_client()
+        if remote_addr:
+            self._client.environ_base['REMOTE_ADDR'] = remote_addr
+
+    def get(self, path):
+        return self._client.get(path).status_code
+
+    def post(self, path, data):
+        return self._client.post(path, data=data).status_code
+
+
+class _HttpSession:
+    def __init__(self, base_url):
+        self._base_url = base_url.rstrip('/')
+        jar = http.cookiejar.CookieJar()
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), _NoRedirect())
+
+    def _open(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self._opener.open(self._base_url + path, data=body, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code  # Redirects land here too, since they aren't followed
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data):
+        return self._open(path, data)
+
+
+def _fixtures(iterations, seed):
+    """Customers to log in as, providers to visit and bookings to review, from the database."""
+    rng = random.Random(seed)
+    # Customers who have bookings, so history isn't trivially empty
+    customers = [
+        email for (email,) in
+        db.session.query(User.email).join(Booking, Booking.customer_id == User.id)
+        .group_by(User.id).order_by(func.count(Booking.id).desc()).limit(max(50, iterations))
+    ]
+    providers = [provider_id for (provider_id,) in db.session.query(Provider.id).limit(5000)]
+    services = [service_id for (service_id,) in db.session.query(Service.id)]
+    reviewable = (
+        db.session.query(Booking.id, User.email)
+        .join(User, User.id == Booking.customer_id)
+        .outerjoin(Feedback, Feedback.booking_id == Booking.id)
+        .filter(Booking.status == 'Completed', Feedback.id.is_(None))
+        .limit(iterations)
+        .all()
+    )
+    if not customers or not providers:
+        raise RuntimeError('No customers with bookings; run `flask gen-data` first')
+    rng.shuffle(customers)
+    return customers, providers, services, reviewable
+
+
+def run_flows(app, base_url=None, flows=FLOWS, iterations=200, concurrency=4, password=DEFAULT_PASSWORD, seed=0):
+    """
+    Run each flow `iterations` times over `concurrency` threads, in-process
+    unless base_url is given. Returns {flow: {'requests', 'errors', 'rps',
+    'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'}}.
+    """
+    with app.app_context():
+        customers, providers, services, reviewable = _fixtures(iterations, seed)
+
+    def new_session(index):
+        # 198.18.0.0/15 is set aside for benchmarks
+        remote_addr = f'198.18.{index // 256 % 256}.{index % 256}'
+        return _HttpSession(base_url) if base_url else _TestClientSession(app, remote_addr)
+
+    def login(session, email):
+        return session.post('/auth/customer-login', {'email': email, 'password': password})
+
+    def logged_in(index):
+        session = new_session(index)
+        if login(session, customers[index % len(customers)]) != 302:
+            raise RuntimeError(f'could not log in as {customers[index % len(customers)]}')
+        return session
+
+    def book(session, rng):
+        # A random upcoming working-hours slot; a taken one redirects back too, like a real clash
+        day = date.today() + timedelta(days=rng.randrange(1, 29))
+        if day.weekday() == 6:
+            day += timedelta(days=1)
+        return session.post(f'/book/{rng.choice(providers)}', {
+            'booking_date': day.isoformat(),
+            'booking_time': clock(rng.randrange(9, 18), 0).strftime('%H:%M'),
+        })
+
+    # flow -> (expected status, needs a logged-in session, step)
+    steps = {
+        'login': (302, False, lambda session, rng, i: login(session, customers[i % len(customers)])),
+        'directory': (200, True, lambda session, rng, i: session.get('/handyman')),
+        'directory_service': (200, True, lambda session, rng, i: session.get(
+            f'/handyman?serviceCategory={rng.choice(services)}')),
+        'provider': (200, True, lambda session, rng, i: session.get(f'/provider/{rng.choice(providers)}')),
+        'history': (200, True, lambda session, rng, i: session.get('/booking-history')),
+        'book': (302, True, lambda session, rng, i: book(session, rng)),
+    }
+
+    enabled = app.config['RATELIMIT_ENABLED']
+    if not base_url:
+        app.config['RATELIMIT_ENABLED'] = False
+    try:
+        results = {}
+        for flow in flows:
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+            counter = iter(range(iterations))
+
+            def worker(thread_index):
+                rng = random.Random(seed * 1000 + thread_index)
+                session = None
+                while True:
+                    with lock:
+                        index = next(counter, None)
+                    if index is None:
+                        return
+                    if flow == 'feedback':
+                        if index >= len(reviewable):
+                            return
+                        booking_id, email = reviewable[index]
+                        session = new_session(index)
+                        if login(session, email) != 302:  # Untimed; only the submit is measured
+                            with lock:
+                                errors[0] += 1
+                            continue
+                        expected = 302
+                        step = lambda: session.post(f'/submit_feedback?booking_id={booking_id}',
+                                                    {'rating': str(rng.randint(1, 5)), 'comment': ''})
+                    else:
+                        expected, needs_login, fn = steps[flow]
+                        if session is None:
+                            session = logged_in(thread_index) if needs_login else new_session(index)
+                        elif flow == 'login':
+                            session = new_session(index)
+                        step = lambda: fn(session, rng, index)
+                    started = time.perf_counter()
+                    try:
+                        ok = step() == expected
+                    except OSError:
+                        ok = False
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if ok:
+                            latencies.append(elapsed)
+                        else:
+                            errors[0] += 1
+
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+
+            results[flow] = {
+                'requests': len(latencies) + errors[0],
+                'errors': errors[0],
+                'rps': len(latencies) / wall if wall else 0.0,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            }
+    finally:
+        app.config['RATELIMIT_ENABLED'] = enabled
+    return results
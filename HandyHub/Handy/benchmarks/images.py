@@ -0,0 +1,61 @@
+"""
+Image bytes per page.
+
+Renders a page with the test client, collects the profile pictures it
+shows and adds up what a browser would download for them: the full-size
+originals (what the templates used to link), the JPEG/PNG thumbnails and
+the WebP thumbnails. Missing thumbnails are generated first.
+"""
+import os
+import re
+
+from ..images import (
+    PROVIDER_UPLOADS, THUMBNAIL_SIZES, fallback_format, has_variant, make_variants, upload_dir, variant_name,
+)
+
+_UPLOAD_URL = re.compile(r'/static/uploads/providers/([\w.-]+)')
+_VARIANT = re.compile(r'^(?P<stem>.+)_(?P<size>\d+)\.(?P<fmt>\w+)$')
+
+
+def _originals(html, directory):
+    """Original filenames behind every upload URL on the page."""
+    names = set()
+    for name in _UPLOAD_URL.findall(html):
+        match = _VARIANT.match(name)
+        if match and int(match['size']) in THUMBNAIL_SIZES:
+            stem = match['stem']
+            name = next((f for f in os.listdir(directory) if f.rsplit('.', 1)[0] == stem), None)
+        if name and os.path.exists(os.path.join(directory, name)):
+            names.add(name)
+    return names
+
+
+def page_image_bytes(app, path='/handyman', size=THUMBNAIL_SIZES[0], login=None):
+    """
+    Returns {'images', 'original_bytes', 'fallback_bytes', 'webp_bytes'}
+    for the distinct pictures on `path`, logged in as the (email, password)
+    customer if given.
+    """
+    client = app.test_client()
+    if login:
+        email, password = login
+        client.post('/auth/customer-login', data={'email': email, 'password': password})
+    response = client.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} returned {response.status_code}')
+    html = response.get_data(as_text=True)
+
+    with app.app_context():
+        directory = upload_dir(PROVIDER_UPLOADS)
+        names = _originals(html, directory)
+
+        totals = {'images': len(names), 'original_bytes': 0, 'fallback_bytes': 0, 'webp_bytes': 0}
+        for name in names:
+            if not all(has_variant(name, size, fmt) for fmt in ('webp', fallback_format(name))):
+                make_variants(name)
+            totals['original_bytes'] += os.path.getsize(os.path.join(directory, name))
+            for key, fmt in (('fallback_bytes', fallback_format(name)), ('webp_bytes', 'webp')):
+                variant = os.path.join(directory, variant_name(name, size, fmt))
+                if os.path.exists(variant):
+                    totals[key] += os.path.getsize(variant)
+    return totals
@@ -0,0 +1,200 @@
+"""
+HTTP load test, and a comparison of gunicorn configurations.
+
+`run_load` hammers a running server with a fixed number of requests from
+a pool of client threads (each logged in with its own session cookie) and
+reports throughput and latency percentiles per path. `compare_gunicorn`
+starts gunicorn once per configuration (see gunicorn.conf.py for the
+environment knobs), measures the workers' memory, runs the same load and
+shuts it down again.
+"""
+import http.cookiejar
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+HANDYHUB_DIR = Path(__file__).resolve().parents[2]
+
+# The plain directory, the directory with recommendations, and a logged-in list
+DEFAULT_PATHS = ('/handyman', '/handyman?serviceCategory=1', '/booking-history')
+
+# name -> gunicorn.conf.py environment overrides
+DEFAULT_CONFIGS = {
+    'sync, no preload': {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_PRELOAD': '0'},
+    'sync, preload': {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_PRELOAD': '1'},
+    'gthread, preload': {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_PRELOAD': '1'},
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _client(base_url, login=None):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    if login:
+        email, password = login
+        data = urllib.parse.urlencode({'email': email, 'password': password}).encode()
+        # Don't follow the post-login redirect, only the session cookie matters
+        login_opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), _NoRedirect())
+        try:
+            login_opener.open(base_url + '/auth/customer-login', data=data, timeout=30).read()
+        except urllib.error.HTTPError as exc:
+            if exc.code not in (302, 303):
+                raise
+        if not any(cookie.name == 'session' for cookie in jar):
+            raise RuntimeError(f'could not log in as {email}')
+    return opener
+
+
+def run_load(base_url, paths=DEFAULT_PATHS, requests=500, concurrency=8, login=None):
+    """
+    Send `requests` requests per path using `concurrency` threads.
+    Returns {path: {'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'}}.
+    """
+    base_url = base_url.rstrip('/')
+    results = {}
+    for path in paths:
+        latencies, errors = [], [0]
+        remaining = [requests]
+        lock = threading.Lock()
+
+        # Log in up front (one session per thread) so a bad login fails loudly
+        openers = [_client(base_url, login) for _ in range(concurrency)]
+
+        def worker(opener):
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                try:
+                    with opener.open(base_url + path, timeout=30) as response:
+                        response.read()
+                        ok = response.status == 200
+                except OSError:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=worker, args=(opener,)) for opener in openers]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        results[path] = {
+            'requests': requests,
+            'errors': errors[0],
+            'rps': len(latencies) / wall if wall else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        }
+    return results
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kb(pid):
+    """PSS (shared pages split between the processes sharing them) if available, else RSS."""
+    for path, field in ((f'/proc/{pid}/smaps_rollup', 'Pss:'), (f'/proc/{pid}/status', 'VmRSS:')):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {process.returncode}')
+        try:
+            urllib.request.urlopen(base_url + '/about', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not come up')
+
+
+def compare_gunicorn(configs=None, paths=DEFAULT_PATHS, requests=500, concurrency=8, login=None, workers=None):
+    """
+    Run the load test against gunicorn once per configuration. Returns
+    {name: {'memory_mb', 'workers', 'boot_seconds', 'paths': run_load(...)}}.
+    """
+    results = {}
+    for name, overrides in (configs or DEFAULT_CONFIGS).items():
+        port = _free_port()
+        env = dict(os.environ, PORT=str(port), **overrides)
+        if workers:
+            env['WEB_CONCURRENCY'] = str(workers)
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+            cwd=HANDYHUB_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            _wait_until_up(base_url, process)
+            boot = time.perf_counter() - started
+            load = run_load(base_url, paths, requests, concurrency, login)
+            # Measured after the load so every worker has touched what it needs
+            worker_pids = _children(process.pid)
+            memory_kb = _memory_kb(process.pid) + sum(_memory_kb(pid) for pid in worker_pids)
+            results[name] = {
+                'workers': len(worker_pids),
+                'memory_mb': memory_kb / 1024,
+                'boot_seconds': boot,
+                'paths': load,
+            }
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return results
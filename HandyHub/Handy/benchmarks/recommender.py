@@ -0,0 +1,109 @@
+"""
+Recommender micro-benchmarks at 10^3 - 10^6 ratings.
+
+For each size a scratch SQLite database is filled by benchmarks.data
+(every booking completed and reviewed, so bookings == ratings; users and
+providers scale along), then:
+
+  build       first get_recommendations call, i.e. loading the model
+  rec miss    get_recommendations with the result cache emptied each time
+  rec hit     the same call answered from the cache
+  top miss    get_top_rated_providers with the cache emptied each time
+  top hit     the same from the cache
+
+The scratch databases live in a temporary directory and are removed
+afterwards; the app's own database isn't touched.
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from ..extensions import db
+from ..models import Service, User
+from .data import generate
+from .load import percentile
+
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+
+
+@contextmanager
+def _scratch_app(directory):
+    """An app on an empty database in `directory`, with no recommender snapshot."""
+    from .. import create_app
+    from ..migrations import upgrade
+
+    overrides = {
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        'RECOMMENDER_SNAPSHOT': os.path.join(directory, 'missing.npz'),
+    }
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        app = create_app()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    with app.app_context():
+        upgrade()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _time_calls(fn, args_list, before=None):
+    latencies = []
+    for args in args_list:
+        if before:
+            before()
+        started = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - started)
+    return {f'p{pct}_ms': percentile(latencies, pct) * 1000 for pct in (50, 95, 99)}
+
+
+def bench_recommender(sizes=DEFAULT_SIZES, queries=200, seed=0):
+    """Returns {ratings: {'users', 'providers', 'generate_s', 'build_ms', 'rec_miss', ...}}."""
+    from ...recommendation import recommendation_engine as engine
+
+    results = {}
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix='handyhub-bench-')
+        try:
+            with _scratch_app(directory):
+                engine.reset()
+                users, providers = max(50, size // 20), max(20, size // 200)
+                started = time.perf_counter()
+                generate(users=users, providers=providers, bookings=size,
+                         completed_rate=1.0, feedback_rate=1.0, seed=seed)
+                generated = time.perf_counter() - started
+
+                rng = random.Random(seed)
+                user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+                service_ids = [service_id for (service_id,) in db.session.query(Service.id)]
+                calls = [(rng.choice(user_ids), rng.choice(service_ids)) for _ in range(queries)]
+
+                started = time.perf_counter()
+                engine.get_recommendations(*calls[0])
+                build_ms = (time.perf_counter() - started) * 1000
+
+                clear = engine.get_cache().clear
+                results[size] = {
+                    'users': users,
+                    'providers': providers,
+                    'generate_s': generated,
+                    'build_ms': build_ms,
+                    'rec_miss': _time_calls(engine.get_recommendations, calls, before=clear),
+                    'rec_hit': _time_calls(engine.get_recommendations, calls[:1] * queries),
+                    'top_miss': _time_calls(engine.get_top_rated_providers, [c[1:] for c in calls], before=clear),
+                    'top_hit': _time_calls(engine.get_top_rated_providers, [calls[0][1:]] * queries),
+                }
+                engine.reset()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
@@ -0,0 +1,514 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('rebuild-ratings')
+@with_appcontext
+def rebuild_ratings_command():
+    """Backfill / repair the stored provider rating aggregates."""
+    from .ratings import rebuild_provider_ratings
+
+    count = rebuild_provider_ratings()
+    click.echo(f"Rebuilt rating aggregates, {count} providers changed.")
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recompute the provider dashboard rollups from bookings and reviews."""
+    from .extensions import db
+    from .rollups import rebuild_rollups
+
+    with db.engine.begin() as conn:
+        written, changed = rebuild_rollups(conn)
+    click.echo(f"Rebuilt {written} provider-day rollups, {changed} were missing or out of date.")
+
+
+@click.command('compare-recommenders')
+@click.option('--sample', default=200, help='Number of users to sample.')
+@click.option('--top-n', default=5)
+@click.option('-k', default=None, type=int, help='Neighbours per user/provider (defaults to RECOMMENDER_NEIGHBOURS).')
+@with_appcontext
+def compare_recommenders_command(sample, top_n, k):
+    """Compare recall and latency of the exact and indexed recommenders."""
+    from ..recommendation.recommendation_engine import compare_recommenders
+
+    result = compare_recommenders(sample_size=sample, top_n=top_n, k=k)
+    click.echo(
+        f"{result['queries']} queries, k={result['k']}: recall@{top_n}={result['recall']:.3f}, "
+        f"exact {result['exact_ms']:.2f} ms, indexed {result['indexed_ms']:.2f} ms"
+    )
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Repopulate the provider full-text search index."""
+    from .search import rebuild_search_index
+
+    count = rebuild_search_index()
+    click.echo(f"Indexed {count} providers.")
+
+
+@click.command('geocode-backfill')
+@with_appcontext
+def geocode_backfill_command():
+    """Geocode all provider locations and customer addresses."""
+    from .geo import backfill_coordinates
+
+    count = backfill_coordinates()
+    click.echo(f"Geocoded {count} rows.")
+
+
+@click.command('backfill-reservations')
+@with_appcontext
+def backfill_reservations_command():
+    """Reserve slots for active bookings created before slot reservations existed."""
+    from .availability import backfill_reservations
+
+    reserved, conflicts = backfill_reservations()
+    click.echo(f"Reserved {reserved} slots.")
+    if conflicts:
+        click.echo(f"{len(conflicts)} bookings overlap an already reserved slot: {', '.join(map(str, conflicts))}")
+
+
+@click.command('db-info')
+@with_appcontext
+def db_info_command():
+    """Show the database backend, pool status and SQLite pragmas in effect."""
+    from .database import describe
+    from .extensions import db
+
+    for key, value in describe(db.engine).items():
+        click.echo(f"{key}: {value}")
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create / migrate the schema and the search index. Run once per deploy, not on boot."""
+    from .migrations import upgrade, current_version
+    from .search import ensure_search_index
+
+    for version, description in upgrade():
+        click.echo(f"Applied {version}: {description}")
+    ensure_search_index()
+    click.echo(f"Database ready (schema version {current_version()}).")
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    from .migrations import upgrade, current_version
+
+    applied = upgrade()
+    for version, description in applied:
+        click.echo(f"Applied {version}: {description}")
+    click.echo(f"Schema at version {current_version()}.")
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not only failures.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if any hot query's plan falls back to a full table scan (SQLite)."""
+    from .query_plans import check_query_plans
+
+    results = check_query_plans()
+    if not results:
+        click.echo("Query plans are only checked on SQLite.")
+        return
+    failures = 0
+    for name, statement, details, scans in results:
+        if scans or verbose:
+            click.echo(f"{'FULL SCAN' if scans else 'ok'}  {name}")
+            for detail in details:
+                click.echo(f"    {detail}")
+        if scans:
+            failures += 1
+            click.echo(f"    {' '.join(statement.split())[:300]}")
+    click.echo(f"{len(results)} statements checked, {failures} with full scans.")
+    if failures:
+        raise SystemExit(1)
+
+
+@click.command('bench-boot')
+@click.option('--runs', default=5, help='Fresh interpreter boots to measure.')
+@click.option('--max-seconds', default=None, type=float, help='Fail if median boot time exceeds this.')
+@click.option('--max-rss-mb', default=None, type=float, help='Fail if median worker RSS exceeds this.')
+@click.option('--baseline', default=None, type=click.Path(dir_okay=False),
+              help='JSON file with a previous result; fail on regressions beyond --tolerance.')
+@click.option('--tolerance', default=0.25, help='Allowed relative regression against the baseline.')
+@click.option('--record', is_flag=True, help='Write this run to --baseline instead of comparing.')
+def bench_boot_command(runs, max_seconds, max_rss_mb, baseline, tolerance, record):
+    """Measure app boot time and per-worker memory in fresh processes."""
+    from .benchmarks.boot import measure_boot, check_boot
+
+    result = measure_boot(runs)
+    click.echo(f"boot: {result['boot_seconds']:.3f}s median (import {result['import_seconds']:.3f}s, "
+               f"create_app {result['create_app_seconds']:.3f}s), RSS {result['rss_mb']:.1f} MB")
+    if result['heavy_modules']:
+        click.echo(f"heavy modules imported at boot: {', '.join(result['heavy_modules'])}")
+
+    problems = check_boot(result, max_seconds, max_rss_mb, baseline, tolerance, record)
+    for problem in problems:
+        click.echo(f"REGRESSION: {problem}")
+    if problems:
+        raise SystemExit(1)
+
+
+@click.command('jobs-worker')
+@click.option('--poll', default=1.0, help='Seconds to sleep when the queue is empty.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+@click.option('--max-jobs', default=None, type=int, help='Exit after this many jobs.')
+@with_appcontext
+def jobs_worker_command(poll, burst, max_jobs):
+    """Run background jobs until stopped."""
+    import logging
+    from .jobs import work
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    succeeded, failed = work(poll_interval=poll, burst=burst, max_jobs=max_jobs)
+    click.echo(f"{succeeded} jobs succeeded, {failed} failed.")
+
+
+@click.command('jobs-status')
+@click.option('--id', 'job_id', default=None, type=int, help='Show one job.')
+@with_appcontext
+def jobs_status_command(job_id):
+    """Queue size by status and the latest failures."""
+    from .extensions import db
+    from .jobs import queue_stats
+    from .models import Job
+
+    if job_id is not None:
+        job = db.session.get(Job, job_id)
+        if job is None:
+            raise click.ClickException(f"No job {job_id}.")
+        click.echo(f"{job.id} {job.name} {job.status}, attempt {job.attempts}/{job.max_attempts}, "
+                   f"run at {job.run_at}, finished {job.finished_at}")
+        if job.last_error:
+            click.echo(job.last_error)
+        return
+
+    counts, failures = queue_stats()
+    for status in ('queued', 'running', 'done', 'failed'):
+        click.echo(f"{status}: {counts.get(status, 0)}")
+    for job in failures:
+        last_line = (job.last_error or '').strip().splitlines()[-1:] or ['']
+        click.echo(f"  failed {job.id} {job.name} at {job.finished_at}: {last_line[0]}")
+
+
+@click.command('jobs-enqueue')
+@click.argument('name')
+@click.option('--payload', default='{}', help='Task keyword arguments as JSON.')
+@click.option('--delay', default=0, help='Seconds before the job may run.')
+@with_appcontext
+def jobs_enqueue_command(name, payload, delay):
+    """Queue a background task by name (e.g. rebuild-ratings, rebuild-recommender)."""
+    import json
+    from .extensions import db
+    from .jobs import enqueue, TASKS, UnknownTask
+
+    try:
+        job = enqueue(name, delay=delay, **json.loads(payload))
+    except UnknownTask:
+        raise click.ClickException(f"Unknown task {name}. Known: {', '.join(sorted(TASKS))}")
+    db.session.commit()
+    click.echo(f"Queued job {job.id}.")
+
+
+def _print_load(results, indent=''):
+    for path, stats in results.items():
+        click.echo(f"{indent}{path}: {stats['rps']:.1f} req/s, p50 {stats['p50_ms']:.1f} ms, "
+                   f"p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms, {stats['errors']} errors")
+
+
+@click.command('bench-load')
+@click.option('--url', default='http://127.0.0.1:8000', help='Base URL of a running server.')
+@click.option('--path', 'paths', multiple=True, help='Paths to hit (default: see benchmarks/load.py).')
+@click.option('--requests', 'count', default=500, help='Requests per path.')
+@click.option('--concurrency', '-c', default=8)
+@click.option('--email', default=None, help='Customer to log in as (needed for /booking-history).')
+@click.option('--password', default=None)
+def bench_load_command(url, paths, count, concurrency, email, password):
+    """Load-test a running server."""
+    from .benchmarks.load import run_load, DEFAULT_PATHS
+
+    login = (email, password) if email else None
+    _print_load(run_load(url, paths or DEFAULT_PATHS, count, concurrency, login))
+
+
+@click.command('bench-gunicorn')
+@click.option('--path', 'paths', multiple=True, help='Paths to hit (default: see benchmarks/load.py).')
+@click.option('--requests', 'count', default=500, help='Requests per path and configuration.')
+@click.option('--concurrency', '-c', default=8)
+@click.option('--workers', default=None, type=int, help='Force WEB_CONCURRENCY for every configuration.')
+@click.option('--email', default=None, help='Customer to log in as (needed for /booking-history).')
+@click.option('--password', default=None)
+def bench_gunicorn_command(paths, count, concurrency, workers, email, password):
+    """Start gunicorn with each configuration in turn and load-test it."""
+    from .benchmarks.load import compare_gunicorn, DEFAULT_PATHS
+
+    login = (email, password) if email else None
+    results = compare_gunicorn(None, paths or DEFAULT_PATHS, count, concurrency, login, workers)
+    for name, result in results.items():
+        click.echo(f"{name}: {result['workers']} workers, {result['memory_mb']:.1f} MB total, "
+                   f"up in {result['boot_seconds']:.2f}s")
+        _print_load(result['paths'], indent='    ')
+
+
+@click.command('backfill-thumbnails')
+@with_appcontext
+def backfill_thumbnails_command():
+    """Rename stored pictures to their content hash and make missing thumbnails."""
+    from .images import backfill_variants
+
+    pictures, renamed, written = backfill_variants()
+    click.echo(f"{pictures} pictures, {renamed} renamed, {written} thumbnails written.")
+
+
+@click.command('bench-images')
+@click.option('--path', default='/handyman', help='Page to measure.')
+@click.option('--email', default=None, help='Customer to log in as (the directory needs a login).')
+@click.option('--password', default=None)
+def bench_images_command(path, email, password):
+    """Bytes of profile pictures on a page: originals vs thumbnails."""
+    from flask import current_app
+    from .benchmarks.images import page_image_bytes
+
+    login = (email, password) if email else None
+    totals = page_image_bytes(current_app._get_current_object(), path, login=login)
+    original = totals['original_bytes'] or 1
+    click.echo(f"{path}: {totals['images']} pictures")
+    for label, key in (('originals', 'original_bytes'), ('jpeg/png thumbnails', 'fallback_bytes'),
+                       ('webp thumbnails', 'webp_bytes')):
+        click.echo(f"  {label}: {totals[key] / 1024:.1f} KB ({100 * totals[key] / original:.1f}%)")
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the static files into static/dist/."""
+    from .assets import build_assets
+
+    results = build_assets()
+    totals = {'bytes': 0, '.gz': 0, '.br': 0}
+    for name, result in sorted(results.items()):
+        sizes = ', '.join(f"{suffix[1:]} {result[suffix] / 1024:.1f} KB" for suffix in ('.gz', '.br') if suffix in result)
+        click.echo(f"{name} -> {result['built']} ({result['bytes'] / 1024:.1f} KB{', ' + sizes if sizes else ''})")
+        for key in totals:
+            totals[key] += result.get(key, result['bytes'])
+    click.echo(f"{len(results)} files, {totals['bytes'] / 1024:.1f} KB; "
+               f"as served with gzip {totals['.gz'] / 1024:.1f} KB, brotli {totals['.br'] / 1024:.1f} KB.")
+
+
+@click.command('gen-data')
+@click.option('--users', default=1000)
+@click.option('--providers', default=100)
+@click.option('--bookings', default=10000)
+@click.option('--completed-rate', default=0.7, help='Share of bookings in the past and completed.')
+@click.option('--feedback-rate', default=0.6, help='Share of completed bookings with a review.')
+@click.option('--skew', default=1.1, help='Zipf exponent for provider popularity and customer activity.')
+@click.option('--seed', default=0)
+@with_appcontext
+def gen_data_command(users, providers, bookings, completed_rate, feedback_rate, skew, seed):
+    """Fill the database with synthetic customers, providers, bookings and reviews."""
+    import time
+    from .benchmarks.data import generate, DEFAULT_PASSWORD, EMAIL_DOMAIN
+
+    started = time.perf_counter()
+    counts = generate(users, providers, bookings, completed_rate, feedback_rate, skew, seed)
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items())
+               + f' in {time.perf_counter() - started:.1f}s.')
+    click.echo(f"Log in as any user<id>@{EMAIL_DOMAIN} with password '{DEFAULT_PASSWORD}'.")
+
+
+@click.command('bench-flows')
+@click.option('--url', default=None, help='Base URL of a running server (default: in-process test client).')
+@click.option('--flow', 'flows', multiple=True, help='Flows to run (default: all, see benchmarks/flows.py).')
+@click.option('--iterations', '-n', default=200, help='Requests per flow.')
+@click.option('--concurrency', '-c', default=4)
+@click.option('--seed', default=0)
+@with_appcontext
+def bench_flows_command(url, flows, iterations, concurrency, seed):
+    """Time login, directory, provider, history, booking and feedback requests."""
+    from flask import current_app
+    from .benchmarks.flows import run_flows, FLOWS
+
+    app = current_app._get_current_object()
+    _print_load(run_flows(app, url, flows or FLOWS, iterations, concurrency, seed=seed))
+
+
+@click.command('bench-recommender')
+@click.option('--size', 'sizes', multiple=True, type=int, help='Rating counts (default 10^3 to 10^6).')
+@click.option('--queries', default=200, help='Calls timed per measurement.')
+@click.option('--seed', default=0)
+@with_appcontext
+def bench_recommender_command(sizes, queries, seed):
+    """get_recommendations / get_top_rated_providers latency by number of ratings."""
+    from .benchmarks.recommender import bench_recommender, DEFAULT_SIZES
+
+    for size, result in bench_recommender(sizes or DEFAULT_SIZES, queries, seed).items():
+        click.echo(f"{size} ratings ({result['users']} users, {result['providers']} providers, "
+                   f"generated in {result['generate_s']:.1f}s): model build {result['build_ms']:.0f} ms")
+        for key, label in (('rec_miss', 'recommendations, uncached'), ('rec_hit', 'recommendations, cached'),
+                           ('top_miss', 'top rated, uncached'), ('top_hit', 'top rated, cached')):
+            stats = result[key]
+            click.echo(f"    {label}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                       f"p99 {stats['p99_ms']:.2f} ms")
+
+
+@click.command('bench-flood')
+@click.option('--url', default=None, help='Base URL of a running server (default: in-process test client).')
+@click.option('--duration', default=10.0, help='Seconds per scenario.')
+@click.option('--rate', default=50.0, help='Login attempts per second from the attackers (0: unthrottled).')
+@click.option('--attackers', default=8, help='Threads posting wrong passwords.')
+@click.option('--attacker-ips', default=16, help='Addresses the attackers rotate over (in-process only).')
+@click.option('--users', default=2, help='Logged-in users browsing meanwhile.')
+@click.option('--path', 'paths', multiple=True, help='Pages the users browse (default: see benchmarks/flood.py).')
+@click.option('--seed', default=0)
+@with_appcontext
+def bench_flood_command(url, duration, rate, attackers, attacker_ips, users, paths, seed):
+    """Legitimate throughput during a login flood, with and without the rate limiter."""
+    from flask import current_app
+    from .benchmarks.flood import run_flood, DEFAULT_PATHS
+
+    results = run_flood(current_app._get_current_object(), url, duration, rate, attackers, attacker_ips, users,
+                        paths or DEFAULT_PATHS, seed=seed)
+    for scenario, result in results.items():
+        click.echo(f"{scenario}: users {result['rps']:.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+                   f"p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, {result['errors']} errors; "
+                   f"attackers {result['attempts']} attempts, {result['hashed']} hashed, {result['limited']} refused")
+
+
+@click.command('import-accounts')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--kind', type=click.Choice(['provider', 'customer']), required=True)
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Default: from the file extension (.csv, otherwise NDJSON).')
+@click.option('--batch-size', default=1000, help='Rows per insert transaction.')
+@click.option('--workers', default=None, type=int, help='Password hashing processes (default: CPU count, 0: inline).')
+@click.option('--errors', 'errors_path', default=None, type=click.Path(dir_okay=False),
+              help='Write rejected rows (line, error) to this CSV instead of the terminal.')
+@click.option('--dry-run', is_flag=True, help='Only validate.')
+@with_appcontext
+def import_accounts_command(path, kind, fmt, batch_size, workers, errors_path, dry_run):
+    """Bulk-create providers or customers from a CSV or NDJSON file (see onboarding.py)."""
+    import csv
+    import sys
+    from .onboarding import import_accounts
+
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    errors_file = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    writer = csv.writer(errors_file) if errors_file else None
+    if writer:
+        writer.writerow(['line', 'error'])
+
+    def on_error(line, message):
+        if writer:
+            writer.writerow([line, message])
+        else:
+            click.echo(f'line {line}: {message}', err=True)
+
+    try:
+        # newline='' lets the csv module handle line breaks inside quoted fields
+        file = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        with file:
+            result = import_accounts(file, kind, fmt, batch_size, workers, dry_run, on_error)
+    finally:
+        if errors_file:
+            errors_file.close()
+    click.echo(f"{result['read']} rows in {result['seconds']:.1f}s ({result['rows_per_s']:.0f} rows/s): "
+               f"{result['inserted']} {kind}s {'validated' if dry_run else 'created'}, {result['errors']} rejected"
+               f"{f' (see {errors_path})' if errors_path and result['errors'] else ''}.")
+
+
+@click.command('export')
+@click.argument('name', type=click.Choice(['bookings', 'feedback', 'contact-messages']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'parquet']), default='csv')
+@click.option('--output', '-o', default='-', type=click.Path(dir_okay=False, allow_dash=True),
+              help='File to write (default: stdout).')
+@click.option('--since', default=None, help='Only rows created after this ISO date/time.')
+@click.option('--watermark-file', default=None, type=click.Path(dir_okay=False),
+              help='Read --since from this file and store the new watermark in it afterwards.')
+@with_appcontext
+def export_command(name, fmt, output, since, watermark_file):
+    """Stream bookings, feedback or contact messages out as CSV, NDJSON or Parquet."""
+    import os
+    import sys
+    from .exports import ExportError, export_rows, parse_watermark
+
+    if since is None and watermark_file and os.path.exists(watermark_file):
+        with open(watermark_file) as f:
+            since = f.read().strip()
+    try:
+        until, body = export_rows(name, fmt, parse_watermark(since))
+    except ExportError as exc:
+        raise click.ClickException(str(exc))
+
+    size = 0
+    out = sys.stdout.buffer if output == '-' else open(output + '.tmp', 'wb')
+    try:
+        for chunk in body:
+            out.write(chunk)
+            size += len(chunk)
+    except BaseException:
+        if output != '-':
+            out.close()
+            os.remove(output + '.tmp')
+        raise
+    if output != '-':
+        out.close()
+        os.replace(output + '.tmp', output)  # Readers never see a half-written export
+    else:
+        out.flush()
+    if watermark_file:
+        with open(watermark_file, 'w') as f:
+            f.write(until.isoformat())
+    click.echo(f"Exported {name} created {'after ' + since + ' ' if since else ''}up to {until.isoformat()} "
+               f"({size / 1024:.1f} KB); next run: --since {until.isoformat()}", err=True)
+
+
+@click.command('prune-sessions')
+@with_appcontext
+def prune_sessions_command():
+    """Delete server-side sessions older than PERMANENT_SESSION_LIFETIME."""
+    from flask import current_app
+    from .sessions import FileSystemSessionInterface
+
+    interface = current_app.session_interface
+    if not isinstance(interface, FileSystemSessionInterface):
+        click.echo(f"SESSION_TYPE is {current_app.config['SESSION_TYPE']!r}, nothing to prune.")
+        return
+    click.echo(f"Removed {interface.prune()} expired sessions from {interface.directory}.")
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_ratings_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(compare_recommenders_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(geocode_backfill_command)
+    app.cli.add_command(backfill_reservations_command)
+    app.cli.add_command(db_info_command)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(jobs_worker_command)
+    app.cli.add_command(jobs_status_command)
+    app.cli.add_command(jobs_enqueue_command)
+    app.cli.add_command(bench_boot_command)
+    app.cli.add_command(bench_load_command)
+    app.cli.add_command(bench_gunicorn_command)
+    app.cli.add_command(backfill_thumbnails_command)
+    app.cli.add_command(bench_images_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(gen_data_command)
+    app.cli.add_command(bench_flows_command)
+    app.cli.add_command(bench_recommender_command)
+    app.cli.add_command(bench_flood_command)
+    app.cli.add_command(import_accounts_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(prune_sessions_command)
@@ -0,0 +1,99 @@
+"""
+Rendered-HTML cache for whole pages and template fragments.
+
+Pages: @cached_page on routes whose output doesn't depend on the visitor
+(about, services, terms, ...). Only anonymous requests are served from or
+stored in the cache, since the navbar shows the logged-in user.
+
+Fragments: templates wrap markup that is the same for every visitor in
+
+    {% call cached_fragment('card', provider.id, provider.updated_at) %}
+      ...
+    {% endcall %}
+
+and the body is rendered only when that key isn't cached. Keys carry the
+row version (Provider.updated_at, bumped on profile edits, new ratings and
+new thumbnails), so a change simply makes the old entry unreachable and it
+ages out of the LRU; nothing has to be deleted.
+
+The store is per process (recommendation.cache.LocalCacheBackend).
+"""
+import time
+from collections import defaultdict
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+from markupsafe import Markup
+
+from ..recommendation.cache import LocalCacheBackend
+
+_cache = None
+
+
+class FragmentCache:
+    def __init__(self, backend=None, ttl=3600):
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'render_seconds': 0.0})
+
+    def get_or_render(self, kind, key, render):
+        """Cached HTML for (kind, *key), or render(), store and return it."""
+        full_key = (kind, *key)
+        stats = self._stats[kind]
+        html = self.backend.get(full_key)
+        if html is not None:
+            stats['hits'] += 1
+            return html
+        stats['misses'] += 1
+        started = time.perf_counter()
+        html = render()
+        stats['render_seconds'] += time.perf_counter() - started
+        self.backend.set(full_key, html, self.ttl)
+        return html
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """Per kind: hits, misses, hit ratio, mean render time and the render time hits saved."""
+        result = {}
+        for kind, stats in self._stats.items():
+            lookups = stats['hits'] + stats['misses']
+            mean = stats['render_seconds'] / stats['misses'] if stats['misses'] else 0.0
+            result[kind] = {
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'hit_ratio': stats['hits'] / lookups if lookups else 0.0,
+                'mean_render_ms': mean * 1000,
+                'saved_ms': stats['hits'] * mean * 1000,
+            }
+        return {'kinds': result, **self.backend.stats()}
+
+
+def get_fragment_cache():
+    global _cache
+    if _cache is None:
+        config = current_app.config
+        backend = LocalCacheBackend(
+            max_entries=config['FRAGMENT_CACHE_SIZE'],
+            max_bytes=config['FRAGMENT_CACHE_MAX_BYTES'],
+        )
+        _cache = FragmentCache(backend, ttl=config['FRAGMENT_CACHE_TTL'])
+    return _cache
+
+
+def cached_fragment(kind, *key, caller):
+    """Template global, used with {% call %}; see the module docstring."""
+    return Markup(get_fragment_cache().get_or_render(kind, key, lambda: str(caller())))
+
+
+def cached_page(view):
+    """Serve the view's HTML from the cache for anonymous visitors."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Logged-in pages show the user; pending flashes are for one visitor only
+        if current_user.is_authenticated or session.get('_flashes'):
+            return view(*args, **kwargs)
+        return get_fragment_cache().get_or_render('page', (request.full_path,), lambda: view(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,258 @@
+"""
+Coordinates and proximity search for providers.
+
+Addresses and provider locations are free text, so coordinates come from
+`geocode`, an offline stand-in: it understands explicit "lat,lng" strings
+and a small built-in gazetteer of city names. Swap it for a real geocoder
+by replacing `geocode`.
+
+Providers are bucketed by geohash (indexed together with service_id). A
+radius query turns into at most nine indexed prefix range scans around the
+customer's cell, followed by an exact haversine check on the few rows that
+come back, so cost depends on local density, not on the provider count.
+"""
+import math
+import re
+
+from .extensions import db
+from .models import Provider
+from .pagination import InvalidCursor, Page, decode_cursor, encode_cursor
+
+GEOHASH_PRECISION = 7
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 400
+
+# city -> (lat, lng)
+GAZETTEER = {
+    'ahmedabad': (23.0225, 72.5714),
+    'bangalore': (12.9716, 77.5946),
+    'bengaluru': (12.9716, 77.5946),
+    'bhopal': (23.2599, 77.4126),
+    'chandigarh': (30.7333, 76.7794),
+    'chennai': (13.0827, 80.2707),
+    'coimbatore': (11.0168, 76.9558),
+    'delhi': (28.6139, 77.2090),
+    'new delhi': (28.6139, 77.2090),
+    'gurgaon': (28.4595, 77.0266),
+    'gurugram': (28.4595, 77.0266),
+    'guntur': (16.3067, 80.4365),
+    'hyderabad': (17.3850, 78.4867),
+    'secunderabad': (17.4399, 78.4983),
+    'indore': (22.7196, 75.8577),
+    'jaipur': (26.9124, 75.7873),
+    'kochi': (9.9312, 76.2673),
+    'kolkata': (22.5726, 88.3639),
+    'lucknow': (26.8467, 80.9462),
+    'mumbai': (19.0760, 72.8777),
+    'mysore': (12.2958, 76.6394),
+    'nagpur': (21.1458, 79.0882),
+    'noida': (28.5355, 77.3910),
+    'pune': (18.5204, 73.8567),
+    'surat': (21.1702, 72.8311),
+    'thiruvananthapuram': (8.5241, 76.9366),
+    'tirupati': (13.6288, 79.4192),
+    'vijayawada': (16.5062, 80.6480),
+    'visakhapatnam': (17.6868, 83.2185),
+    'vizag': (17.6868, 83.2185),
+    'warangal': (17.9689, 79.5941),
+    'london': (51.5074, -0.1278),
+    'new york': (40.7128, -74.0060),
+    'san francisco': (37.7749, -122.4194),
+    'singapore': (1.3521, 103.8198),
+    'dubai': (25.2048, 55.2708),
+}
+
+_LATLNG = re.compile(r'(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)')
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Approximate geohash cell size (height km, width km at the equator) per precision
+_CELL_KM = {1: (5000, 5000), 2: (625, 1250), 3: (156, 156), 4: (19.5, 39.1),
+            5: (4.89, 4.89), 6: (0.61, 1.22), 7: (0.153, 0.153)}
+
+
+def geocode(text):
+    """(lat, lng) for an address/location string, or None if unknown."""
+    if not text:
+        return None
+    match = _LATLNG.search(text)
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+    lowered = ' ' + re.sub(r'[^a-z]+', ' ', text.lower()) + ' '
+    # Longest name first so "new delhi" wins over "delhi"
+    for name in sorted(GAZETTEER, key=len, reverse=True):
+        if f' {name} ' in lowered:
+            return GAZETTEER[name]
+    return None
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def set_coordinates(obj, text):
+    """Geocode text onto a Provider or User (clears coordinates if unknown)."""
+    coords = geocode(text)
+    if coords:
+        obj.latitude, obj.longitude = coords
+        obj.geohash = geohash_encode(*coords)
+    else:
+        obj.latitude = obj.longitude = obj.geohash = None
+    return coords
+
+
+def _search_cells(lat, lng, radius_km):
+    """Geohash prefixes of the cell containing (lat, lng) and its neighbours."""
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _CELL_KM[p]
+        width *= max(math.cos(math.radians(lat)), 0.01)
+        if min(height, width) >= radius_km:
+            precision = p
+            break
+    height, width = _CELL_KM[precision]
+    dlat = height / 111.32
+    dlng = width / 111.32
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            clat = max(-89.999, min(89.999, lat + i * dlat))
+            clng = (lng + j * dlng + 180) % 360 - 180
+            cells.add(geohash_encode(clat, clng, precision))
+    return cells
+
+
+def nearby_providers(lat, lng, service_id=None, radius_km=DEFAULT_RADIUS_KM, limit=None,
+                     min_price=None, max_price=None):
+    """
+    Providers within radius_km of (lat, lng) as [(provider, distance_km)],
+    nearest first, optionally within a price range.
+    """
+    conditions = []
+    for prefix in _search_cells(lat, lng, radius_km):
+        # Range form of LIKE 'prefix%'; service_id goes inside every OR term so
+        # each one is a separate (service_id, geohash) index range scan
+        term = [Provider.geohash >= prefix, Provider.geohash < prefix + '~']
+        if service_id:
+            term.append(Provider.service_id == service_id)
+        conditions.append(db.and_(*term))
+    query = Provider.query.filter(db.or_(*conditions))
+    if min_price is not None:
+        query = query.filter(Provider.service_price >= min_price)
+    if max_price is not None:
+        query = query.filter(Provider.service_price <= max_price)
+
+    results = []
+    for provider in query:
+        distance = haversine_km(lat, lng, provider.latitude, provider.longitude)
+        if distance <= radius_km:
+            results.append((provider, distance))
+    results.sort(key=lambda item: (item[1], item[0].id))
+    return results[:limit] if limit else results
+
+
+def nearest_providers(lat, lng, service_id=None, k=24, radius_km=5, min_price=None, max_price=None, after=None):
+    """
+    k nearest providers, widening the radius until k are found (or MAX_RADIUS_KM).
+    The price range is part of the search, so filtered-out providers don't
+    use up k. after=(distance_km, id) skips everything up to that row.
+    """
+    if after:
+        radius_km = min(max(radius_km, after[0]), MAX_RADIUS_KM)
+    while True:
+        results = nearby_providers(lat, lng, service_id, radius_km, min_price=min_price, max_price=max_price)
+        if after:
+            results = [item for item in results if (item[1], item[0].id) > after]
+        if len(results) >= k or radius_km >= MAX_RADIUS_KM:
+            return results[:k]
+        radius_km = min(radius_km * 2, MAX_RADIUS_KM)
+
+
+def nearest_page(lat, lng, service_id=None, min_price=None, max_price=None, cursor=None, per_page=24):
+    """
+    One page of [(provider, distance_km)], nearest first; the cursor is the
+    (distance, id) of the page's last row. Raises InvalidCursor.
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, float)
+        if after[0] is None or after[0] < 0:
+            raise InvalidCursor(cursor)
+    results = nearest_providers(lat, lng, service_id, per_page + 1, min_price=min_price, max_price=max_price,
+                                after=after)
+    next_cursor = None
+    if len(results) > per_page:
+        results = results[:per_page]
+        provider, distance = results[-1]
+        next_cursor = encode_cursor(distance, provider.id)
+    return Page(results, next_cursor)
+
+
+def rank_by_distance_and_rating(results, radius_km=DEFAULT_RADIUS_KM, rating_weight=0.5):
+    """
+    Order [(provider, distance_km)] by a blend of closeness (1 at the door,
+    0 at radius_km) and rating (0-5 scaled to 0-1).
+    """
+    def score(item):
+        provider, distance = item
+        closeness = max(0.0, 1 - distance / radius_km)
+        return (1 - rating_weight) * closeness + rating_weight * (provider.rating or 0) / 5
+
+    return sorted(results, key=lambda item: (-score(item), item[1], item[0].id))
+
+
+def rerank_recommendations(providers, lat, lng, radius_km=DEFAULT_RADIUS_KM, distance_weight=0.5):
+    """
+    Re-order an already ranked provider list so nearby providers move up.
+    Providers without coordinates keep their relevance but get no proximity boost.
+    """
+    count = len(providers)
+    scored = []
+    for position, provider in enumerate(providers):
+        relevance = 1 - position / count
+        closeness = 0.0
+        if provider.latitude is not None:
+            provider.distance_km = haversine_km(lat, lng, provider.latitude, provider.longitude)
+            closeness = max(0.0, 1 - provider.distance_km / radius_km)
+        scored.append(((1 - distance_weight) * relevance + distance_weight * closeness, -position, provider))
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [provider for _, _, provider in scored]
+
+
+def backfill_coordinates(batch_size=500):
+    """Geocode every provider location and customer address. Returns rows updated."""
+    from .models import User
+
+    updated = 0
+    for model, field in ((Provider, 'location'), (User, 'address')):
+        for obj in model.query.order_by(model.id).yield_per(batch_size):
+            set_coordinates(obj, getattr(obj, field))
+            updated += 1
+    db.session.commit()
+    return updated
@@ -0,0 +1,147 @@
+"""
+Account lookup for Flask-Login.
+
+Session ids name the kind of account as well as the row ('customer:12',
+'provider:7'; see get_id() on the models), so one loader resolves both and
+a remember-me cookie restores the right one without session['user_type'].
+
+Loaded accounts are kept in a per-process cache for IDENTITY_CACHE_TTL
+seconds, so a warm user's requests run no identity query. What's cached is
+a snapshot of the columns; on a hit it is attached to the request's
+database session without a SELECT, so lazy relationships and edits to
+current_user work as before.
+
+Invalidation is generation based, like the recommendation cache: profile
+updates, password resets, logout and the writers that change accounts in
+bulk (ratings, picture jobs, backfills) bump a counter after committing.
+With IDENTITY_CACHE_URL (default: RECOMMENDATION_CACHE_URL) the counters
+live in Redis, so a bump from any worker or job process is seen by all of
+them on their next hit, at the cost of one Redis read instead of a query.
+Without it the counters are per process and other processes' changes show
+up once the TTL runs out.
+"""
+from flask import current_app, session
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from ..recommendation.cache import LocalCacheBackend, RedisCacheBackend
+from .extensions import db
+from .metrics import IDENTITY_LOOKUPS
+from .models import Provider, User
+
+ACCOUNT_MODELS = {'customer': User, 'provider': Provider}
+
+_cache = None
+
+
+class IdentityCache:
+    """
+    Snapshots in `backend`, generation counters in `versions` (the same
+    backend unless a shared one is given).
+    """
+
+    def __init__(self, backend=None, ttl=30, versions=None):
+        self.backend = backend or LocalCacheBackend()
+        self.versions = versions or self.backend
+        self.ttl = ttl
+
+    def generation(self, kind, row_id):
+        return (self.versions.counter(('gen', 'all')), self.versions.counter(('gen', kind, row_id)))
+
+    def get(self, kind, row_id):
+        cached = self.backend.get((kind, row_id))
+        if cached is not None and cached[0] == self.generation(kind, row_id):
+            return cached[1]
+        return None
+
+    def set(self, kind, row_id, generation, values):
+        self.backend.set((kind, row_id), (generation, values), self.ttl)
+
+    def invalidate(self, kind, row_id):
+        self.versions.incr(('gen', kind, row_id))
+
+    def invalidate_all(self):
+        self.versions.incr(('gen', 'all'))
+
+    def clear(self):
+        # Shared counters stay: resetting them could revive other workers' old snapshots
+        self.backend.clear()
+
+
+def get_identity_cache():
+    global _cache
+    if _cache is None:
+        config = current_app.config
+        backend = LocalCacheBackend(
+            max_entries=config['IDENTITY_CACHE_SIZE'],
+            max_bytes=config['IDENTITY_CACHE_MAX_BYTES'],
+        )
+        url = config['IDENTITY_CACHE_URL']
+        versions = RedisCacheBackend(url, prefix='handyhub:identity:') if url else None
+        _cache = IdentityCache(backend, ttl=config['IDENTITY_CACHE_TTL'], versions=versions)
+    return _cache
+
+
+def account_kind(account):
+    return 'provider' if isinstance(account, Provider) else 'customer'
+
+
+def split_account_id(user_id):
+    """'provider:7' -> ('provider', 7). Plain ids come from sessions made before the prefix."""
+    kind, _, row_id = str(user_id).rpartition(':')
+    return kind or session.get('user_type'), int(row_id)
+
+
+def _snapshot(account):
+    return {attr.key: getattr(account, attr.key) for attr in account.__mapper__.column_attrs}
+
+
+def _attach(model, values):
+    existing = db.session.identity_map.get(identity_key(model, values['id']))
+    if existing is not None:
+        return existing
+    account = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        setattr(account, key, value)
+    make_transient_to_detached(account)  # Marks the values as loaded, not as pending changes
+    db.session.add(account)
+    return account
+
+
+def load_account(user_id):
+    """The user_loader: the User or Provider for a session id, or None."""
+    try:
+        kind, row_id = split_account_id(user_id)
+    except ValueError:
+        return None
+    model = ACCOUNT_MODELS.get(kind)
+    if model is None:
+        return None
+
+    cache = get_identity_cache()
+    values = cache.get(kind, row_id)
+    if values is not None:
+        IDENTITY_LOOKUPS.inc(kind, 'hit')
+        return _attach(model, values)
+
+    IDENTITY_LOOKUPS.inc(kind, 'miss')
+    generation = cache.generation(kind, row_id)  # Read first, so an invalidation during the query wins
+    account = db.session.get(model, row_id)
+    if account is not None:
+        cache.set(kind, row_id, generation, _snapshot(account))
+    return account
+
+
+def invalidate_account(account):
+    """Drop the cached copy of a User or Provider after changing it."""
+    get_identity_cache().invalidate(account_kind(account), account.id)
+
+
+def invalidate_provider(provider_id):
+    """invalidate_account() for a provider that isn't loaded."""
+    get_identity_cache().invalidate('provider', provider_id)
+
+
+def invalidate_all_accounts():
+    """Drop every cached account, after an UPDATE that touched many of them."""
+    get_identity_cache().invalidate_all()
@@ -0,0 +1,274 @@
+"""
+Profile picture storage.
+
+Uploads are streamed to disk in chunks while being hashed, and stored under
+their content hash, so the same picture uploaded twice is kept once.
+The process-image job then renders fixed-size thumbnails for the avatar
+slots, as WebP plus a JPEG/PNG fallback:
+
+    3f2a...e1.png           original
+    3f2a...e1_200.webp      200px square (100px avatar at 2x)
+    3f2a...e1_200.png       same, for browsers without WebP
+
+Templates call thumbnail_url(); until the variants exist (or when Pillow is
+not installed) it falls back to the original.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+
+from flask import current_app, url_for
+
+PROVIDER_UPLOADS = os.path.join('static', 'uploads', 'providers')  # Relative to the app root
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# Stored extension -> the format the content has to be in (Pillow's name, leading bytes)
+IMAGE_FORMATS = {
+    'png': ('PNG', (b'\x89PNG\r\n\x1a\n',)),
+    'jpg': ('JPEG', (b'\xff\xd8\xff',)),
+    'gif': ('GIF', (b'GIF87a', b'GIF89a')),
+    'webp': ('WEBP', (b'RIFF',)),
+}
+THUMBNAIL_SIZES = (200, 400)  # Avatar cards, provider details
+CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Variants seen on disk by this process; they're never modified once written
+_known_variants = set()
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def upload_dir(folder=PROVIDER_UPLOADS):
+    return os.path.join(current_app.root_path, folder)
+
+
+def check_image(path, ext):
+    """
+    Raise InvalidImage unless the file at path is an image in the format its
+    extension names. Pillow parses it when installed; otherwise only the
+    leading bytes are checked.
+    """
+    expected, signatures = IMAGE_FORMATS[ext]
+    try:
+        from PIL import Image
+    except ImportError:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+        if not head.startswith(signatures) or (ext == 'webp' and head[8:12] != b'WEBP'):
+            raise InvalidImage(f'not a {expected} image')
+        return
+    try:
+        with Image.open(path) as image:
+            found = image.format
+            image.verify()
+    except Exception as exc:  # Pillow raises all sorts on bad input, DecompressionBombError included
+        raise InvalidImage(f'not a {expected} image') from exc
+    if found != expected:
+        raise InvalidImage(f'{found} content in a .{ext} file')
+
+
+def store_upload(file, folder=PROVIDER_UPLOADS):
+    """
+    Save an uploaded FileStorage under its content hash and return the
+    filename. The upload is copied in CHUNK_SIZE pieces, never held in
+    memory whole, and must be an image of the type its extension says
+    (InvalidImage otherwise). An identical file that is already stored is
+    reused.
+    """
+    if not file or not allowed_file(file.filename):
+        raise InvalidImage(file.filename if file else None)
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    ext = 'jpg' if ext == 'jpeg' else ext
+    directory = upload_dir(folder)
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise InvalidImage('file too large')
+                digest.update(chunk)
+                out.write(chunk)
+        check_image(tmp_path, ext)
+        filename = f'{digest.hexdigest()[:32]}.{ext}'
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)  # Already have these bytes
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def _stem(filename):
+    return filename.rsplit('.', 1)[0]
+
+
+def fallback_format(filename):
+    # Keep transparency for PNG/GIF originals, JPEG for photos
+    return 'jpg' if filename.rsplit('.', 1)[-1].lower() in ('jpg', 'jpeg') else 'png'
+
+
+def variant_name(filename, size, fmt):
+    return f'{_stem(filename)}_{size}.{fmt}'
+
+
+def make_variants(filename, folder=PROVIDER_UPLOADS, sizes=THUMBNAIL_SIZES):
+    """
+    Write the thumbnail variants of an upload. Returns the variant filenames
+    written, or [] when Pillow isn't installed.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return []
+
+    directory = upload_dir(folder)
+    fallback = fallback_format(filename)
+    written = []
+    with Image.open(os.path.join(directory, filename)) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+        for size in sizes:
+            # Square crop from the centre, same as the round avatar slots show
+            thumb = ImageOps.fit(original, (size, size), Image.LANCZOS)
+            thumb = thumb.convert('RGBA' if has_alpha and fallback == 'png' else 'RGB')
+            for fmt, options in (
+                ('webp', {'quality': WEBP_QUALITY, 'method': 6}),
+                (fallback, {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+                 if fallback == 'jpg' else {'optimize': True}),
+            ):
+                name = variant_name(filename, size, fmt)
+                tmp_path = os.path.join(directory, f'.{name}.tmp')
+                thumb.save(tmp_path, format='JPEG' if fmt == 'jpg' else fmt.upper(), **options)
+                os.replace(tmp_path, os.path.join(directory, name))
+                written.append(name)
+    return written
+
+
+def has_variant(filename, size, fmt, folder=PROVIDER_UPLOADS):
+    name = variant_name(filename, size, fmt)
+    if name in _known_variants:
+        return True
+    if os.path.exists(os.path.join(upload_dir(folder), name)):
+        _known_variants.add(name)
+        return True
+    return False
+
+
+def thumbnail_url(filename, size=THUMBNAIL_SIZES[0], fmt=None, fallback=True, folder='uploads/providers'):
+    """
+    URL of a thumbnail (fmt 'webp', or None for the JPEG/PNG fallback). If
+    the variant hasn't been made yet: the original's URL, or None when
+    fallback is False.
+    """
+    filename = filename or 'default.png'
+    fmt = fmt or fallback_format(filename)
+    if has_variant(filename, size, fmt):
+        return url_for('static', filename=f'{folder}/{variant_name(filename, size, fmt)}')
+    return url_for('static', filename=f'{folder}/{filename}') if fallback else None
+
+
+def content_name(path):
+    """The content-hash filename store_upload() would give the file at path."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    ext = path.rsplit('.', 1)[-1].lower()
+    return f"{digest.hexdigest()[:32]}.{'jpg' if ext == 'jpeg' else ext}"
+
+
+def backfill_variants(folder=PROVIDER_UPLOADS):
+    """
+    Bring pictures stored before this pipeline in line: rename each to its
+    content hash (merging byte-identical copies), point the rows at the new
+    name, make missing thumbnails and delete the now unused old files.
+    Returns (pictures, renamed, thumbnails written).
+    """
+    from .extensions import db
+    from .models import Provider, User
+
+    directory = upload_dir(folder)
+    names = set()
+    for model in (Provider, User):
+        names.update(name for (name,) in db.session.query(model.image).distinct() if name)
+
+    renamed, written, orphans = 0, 0, []
+    for name in sorted(names):
+        path = os.path.join(directory, name)
+        if name == 'default.png' or not os.path.exists(path):
+            continue
+        hashed = content_name(path)
+        if hashed != name:
+            target = os.path.join(directory, hashed)
+            if not os.path.exists(target):
+                os.replace(path, target)
+            for model in (Provider, User):
+                db.session.query(model).filter(model.image == name).update(
+                    {model.image: hashed}, synchronize_session=False)
+            orphans.append(name)
+            renamed += 1
+        if not all(has_variant(hashed, size, fmt, folder)
+                   for size in THUMBNAIL_SIZES for fmt in ('webp', fallback_format(hashed))):
+            variants = make_variants(hashed, folder)
+            if variants:
+                # New row version, so cached directory cards pick up the thumbnail
+                db.session.query(Provider).filter(Provider.image == hashed).update(
+                    {Provider.updated_at: datetime.utcnow()}, synchronize_session=False)
+            written += len(variants)
+    db.session.commit()
+    if renamed or written:
+        from .identity import invalidate_all_accounts
+        invalidate_all_accounts()
+
+    for name in orphans:
+        remove_image(name, folder)
+    return len(names), renamed, written
+
+
+def is_referenced(filename):
+    """True if any provider or customer still uses this stored image."""
+    from .extensions import db
+    from .models import Provider, User
+
+    return (
+        db.session.query(Provider.id).filter(Provider.image == filename).first() is not None
+        or db.session.query(User.id).filter(User.image == filename).first() is not None
+    )
+
+
+def remove_image(filename, folder=PROVIDER_UPLOADS):
+    """Delete an upload and its variants, unless it's shared (or the default)."""
+    if not filename or filename == 'default.png' or is_referenced(filename):
+        return False
+    directory = upload_dir(folder)
+    names = [filename] + [
+        variant_name(filename, size, fmt)
+        for size in THUMBNAIL_SIZES for fmt in ('webp', fallback_format(filename))
+    ]
+    for name in names:
+        _known_variants.discard(name)
+        path = os.path.join(directory, os.path.basename(name))
+        if os.path.exists(path):
+            os.remove(path)
+    return True
@@ -0,0 +1,195 @@
+"""
+Database-backed background jobs.
+
+Request handlers call `enqueue()` and return; the row is written in the
+caller's transaction, so a job only exists if the write that asked for it
+committed. `flask jobs-worker` claims due jobs one at a time and runs them
+in its own process, off the request path.
+
+Claiming is an UPDATE ... WHERE status = 'queued' on a single row, so two
+workers can't take the same job. Failures are retried with exponential
+backoff up to max_attempts, then the job is marked failed with its error.
+A worker that dies mid-job leaves it 'running'; after STALE_AFTER it is
+put back in the queue.
+
+Tasks are plain functions registered with @task (see tasks.py); their
+keyword arguments are stored as JSON.
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from .extensions import db
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+RETRY_BASE_SECONDS = 10
+STALE_AFTER = timedelta(minutes=15)
+
+TASKS = {}
+
+
+class UnknownTask(KeyError):
+    pass
+
+
+def task(name):
+    """Register a function as a background task under `name`."""
+    def register(fn):
+        TASKS[name] = fn
+        return fn
+    return register
+
+
+def enqueue(name, unique_key=None, delay=0, max_attempts=3, **payload):
+    """
+    Add a job in the current transaction (the caller commits). With
+    unique_key, nothing is added if an identical job is already waiting;
+    returns the waiting job in that case.
+    """
+    if name not in TASKS:
+        raise UnknownTask(name)
+    if unique_key is not None:
+        waiting = Job.query.filter_by(unique_key=unique_key, status=QUEUED).first()
+        if waiting is not None:
+            return waiting
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        unique_key=unique_key,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def requeue_stale(now=None):
+    """Put jobs whose worker vanished back in the queue. Returns how many."""
+    now = now or datetime.utcnow()
+    count = (
+        Job.query
+        .filter(Job.status == RUNNING, Job.locked_at < now - STALE_AFTER)
+        .update({Job.status: QUEUED, Job.locked_by: None, Job.locked_at: None}, synchronize_session=False)
+    )
+    db.session.commit()
+    return count
+
+
+def claim(worker_id, now=None):
+    """Take the oldest due job, or return None if there is nothing to do."""
+    now = now or datetime.utcnow()
+    while True:
+        job_id = (
+            db.session.query(Job.id)
+            .filter(Job.status == QUEUED, Job.run_at <= now)
+            .order_by(Job.run_at, Job.id)
+            .limit(1)
+            .scalar()
+        )
+        if job_id is None:
+            db.session.commit()
+            return None
+        claimed = (
+            Job.query
+            .filter(Job.id == job_id, Job.status == QUEUED)
+            .update({
+                Job.status: RUNNING,
+                Job.locked_by: worker_id,
+                Job.locked_at: now,
+                Job.attempts: Job.attempts + 1,
+            }, synchronize_session=False)
+        )
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+        # Another worker got there first; try the next one
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome. Returns True on success."""
+    try:
+        fn = TASKS.get(job.name)
+        if fn is None:
+            raise UnknownTask(job.name)
+        fn(**json.loads(job.payload or '{}'))
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = traceback.format_exc(limit=20)
+        if job.attempts < job.max_attempts and job.name in TASKS:
+            job.status = QUEUED
+            job.run_at = datetime.utcnow() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = FAILED
+            job.finished_at = datetime.utcnow()
+        job.locked_by = job.locked_at = None
+        db.session.commit()
+        logger.warning('job %s (%s) failed on attempt %s', job.id, job.name, job.attempts)
+        return False
+
+    db.session.rollback()  # Whatever the task left uncommitted isn't ours to keep
+    job = db.session.get(Job, job.id)
+    job.status = DONE
+    job.finished_at = datetime.utcnow()
+    job.locked_by = job.locked_at = None
+    db.session.commit()
+    return True
+
+
+def work(poll_interval=1.0, burst=False, max_jobs=None):
+    """
+    Worker loop: run jobs until stopped (SIGTERM/SIGINT finish the current
+    job first). With burst=True, return once the queue is empty.
+    Returns (succeeded, failed).
+    """
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    succeeded = failed = 0
+    last_stale_check = 0.0
+    try:
+        while not stopping and (max_jobs is None or succeeded + failed < max_jobs):
+            if time.monotonic() - last_stale_check > 60:
+                requeue_stale()
+                last_stale_check = time.monotonic()
+            job = claim(worker_id)
+            if job is None:
+                if burst:
+                    break
+                time.sleep(poll_interval)
+                continue
+            started = time.perf_counter()
+            if run_job(job):
+                succeeded += 1
+            else:
+                failed += 1
+            logger.info('job %s (%s) finished in %.2fs', job.id, job.name, time.perf_counter() - started)
+            db.session.remove()  # Fresh identity map per job
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+    return succeeded, failed
+
+
+def queue_stats():
+    """{status: count} plus the most recent failures."""
+    counts = dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status))
+    failures = (
+        Job.query.filter_by(status=FAILED)
+        .order_by(Job.finished_at.desc(), Job.id.desc())
+        .limit(5)
+        .all()
+    )
+    return counts, failures
@@ -0,0 +1,232 @@
+"""
+Request instrumentation.
+
+Per request: latency by endpoint, the number of SQL statements and the time
+spent in them (SQLAlchemy cursor events), template render time, and time in
+the recommender. Everything lands in in-process histograms that /metrics
+exposes in the Prometheus text format; each response also gets a
+Server-Timing header (app, db, templates) for the browser's devtools.
+
+Statements slower than SLOW_QUERY_MS are logged on the
+'HandyHub.Handy.slow_query' logger with the endpoint that ran them.
+
+The registry is per process: under gunicorn every worker has its own and
+a scrape sees whichever worker answered, so scrape each worker (or run one
+per container) for exact totals.
+
+/metrics answers 404 unless METRICS_TOKEN is set, and then wants it as a
+bearer token: endpoint names and SQL timings are not for everyone.
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from flask import Response, abort, current_app, g, has_request_context, request, before_render_template, \
+    template_rendered
+from sqlalchemy import event
+
+slow_query_logger = logging.getLogger('HandyHub.Handy.slow_query')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple."""
+
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        """Decorator recording the wrapped function's duration."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *label_values)
+            return wrapper
+        return decorate
+
+    def series(self):
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, values in sorted(self.series().items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Prometheus-style counter, one series per label tuple."""
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._series.get(label_values, 0)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, value in series:
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = Histogram(
+    'handyhub_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method', 'status'))
+REQUEST_SQL_STATEMENTS = Histogram(
+    'handyhub_request_sql_statements', 'SQL statements per request.', ('endpoint',), COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram(
+    'handyhub_request_sql_seconds', 'Time in SQL statements per request.', ('endpoint',))
+TEMPLATE_RENDER = Histogram(
+    'handyhub_template_render_seconds', 'Template render time.', ('template',))
+RECOMMENDER = Histogram(
+    'handyhub_recommender_seconds', 'Time in the recommendation engine.', ('function',))
+SLOW_QUERIES = Histogram(
+    'handyhub_slow_query_seconds', 'Statements slower than SLOW_QUERY_MS.', ('endpoint',))
+IDENTITY_LOOKUPS = Counter(
+    'handyhub_identity_lookups_total',
+    'Logged-in account loads; result="hit" came from the identity cache, one query saved each.',
+    ('kind', 'result'))
+RATE_LIMITED = Counter(
+    'handyhub_rate_limited_total', 'Login / signup attempts refused before hashing, by limit.', ('rule',))
+
+REGISTRY = (REQUEST_LATENCY, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS, TEMPLATE_RENDER, RECOMMENDER, SLOW_QUERIES,
+            IDENTITY_LOOKUPS, RATE_LIMITED)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+    g.template_seconds = 0.0
+
+
+def _after_request(response):
+    if 'metrics_started' not in g:
+        return response
+    g.metrics_status = response.status_code
+    response.headers['Server-Timing'] = ', '.join((
+        f'app;dur={(time.perf_counter() - g.metrics_started) * 1000:.1f}',
+        f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_statements} statements"',
+        f'tpl;dur={g.template_seconds * 1000:.1f}',
+    ))
+    return response
+
+
+def _teardown_request(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    endpoint = _endpoint()
+    status = g.get('metrics_status', 500)
+    REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint, request.method, status)
+    REQUEST_SQL_STATEMENTS.observe(g.sql_statements, endpoint)
+    REQUEST_SQL_SECONDS.observe(g.sql_seconds, endpoint)
+
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('template_stack', []).append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    if has_request_context() and g.get('template_stack'):
+        elapsed = time.perf_counter() - g.template_stack.pop()
+        TEMPLATE_RENDER.observe(elapsed, template.name)
+        if not g.template_stack:  # Don't count nested renders twice
+            g.template_seconds = g.get('template_seconds', 0.0) + elapsed
+
+
+def instrument_engine(engine, slow_query_seconds):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        endpoint = None
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_statements += 1
+            g.sql_seconds += elapsed
+            endpoint = _endpoint()
+        if elapsed >= slow_query_seconds:
+            SLOW_QUERIES.observe(elapsed, endpoint or 'background')
+            # Statement only: parameters can hold password hashes and personal data
+            slow_query_logger.warning(
+                '%.1f ms in %s: %s', elapsed * 1000, endpoint or 'background', ' '.join(statement.split())[:2000])
+
+
+def expose():
+    return '\n'.join(histogram.expose() for histogram in REGISTRY) + '\n'
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        abort(401)
+    return Response(expose(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app, engine):
+    app.config.setdefault('SLOW_QUERY_MS', float(os.environ.get('SLOW_QUERY_MS', 100)))
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    instrument_engine(engine, app.config['SLOW_QUERY_MS'] / 1000)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
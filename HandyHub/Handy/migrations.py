@@ -0,0 +1,191 @@
+"""
+Versioned schema migrations.
+
+Each migration is a numbered function registered with @migration; the
+numbers already applied are recorded in schema_migrations. `upgrade()`
+runs the pending ones in order, each in its own transaction.
+
+Migrations are written to be re-runnable (add a column / index only if it
+is missing) because databases created before this module existed are at
+an unknown point: the baseline copy under instance/ predates the rating
+aggregates, row versions and coordinates, while newer ones got some of
+them from create_all().
+
+    flask db-upgrade        apply pending migrations
+    flask db-info           shows the current version too
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+
+from .extensions import db
+
+VERSION_TABLE = 'schema_migrations'
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return fn
+    return register
+
+
+def _columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def add_column(conn, column, server_default=None):
+    """ALTER TABLE ... ADD COLUMN for a model Column, unless it already exists."""
+    table = column.table.name
+    if column.name in _columns(conn, table):
+        return False
+    ddl = f'ALTER TABLE "{table}" ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}'
+    if server_default is not None:
+        ddl += f' DEFAULT {server_default}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    conn.exec_driver_sql(ddl)
+    return True
+
+
+def create_indexes(conn, model, names=None):
+    """Create the model's declared indexes (or just `names`) that are missing."""
+    # IF NOT EXISTS rather than reflection: the inspector can't see expression indexes
+    for index in model.__table__.indexes:
+        if names is None or index.name in names:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def recompute_ratings(conn):
+    """Rebuild provider rating aggregates from the feedback table in plain SQL."""
+    conn.exec_driver_sql(
+        "UPDATE provider SET "
+        "rating_sum = COALESCE((SELECT SUM(rating) FROM feedback f WHERE f.provider_id = provider.id), 0), "
+        "rating_count = (SELECT COUNT(*) FROM feedback f WHERE f.provider_id = provider.id)"
+    )
+    conn.exec_driver_sql(
+        "UPDATE provider SET rating = CASE WHEN rating_count > 0 "
+        "THEN rating_sum * 1.0 / rating_count ELSE 0 END"
+    )
+
+
+@migration(1, 'create missing tables')
+def create_tables(conn):
+    db.metadata.create_all(conn)
+
+
+@migration(2, 'provider rating aggregates, row versions and coordinates')
+def add_aggregates_and_coordinates(conn):
+    from .models import Provider, Booking, User
+
+    added_sum = add_column(conn, Provider.__table__.c.rating_sum, server_default=0)
+    add_column(conn, Provider.__table__.c.rating_count, server_default=0)
+    if added_sum:
+        recompute_ratings(conn)
+    for model in (Provider, Booking):
+        add_column(conn, model.__table__.c.updated_at)
+    for model in (Provider, User):
+        for name in ('latitude', 'longitude', 'geohash'):
+            add_column(conn, model.__table__.c[name])
+
+
+@migration(3, 'keyset pagination and proximity indexes')
+def add_listing_indexes(conn):
+    from .models import Provider, Booking
+
+    create_indexes(conn, Provider)
+    create_indexes(conn, Booking)
+
+
+@migration(4, 'feedback indexes, one feedback per booking')
+def add_feedback_indexes(conn):
+    from .models import Feedback
+
+    # Keep the first review of a booking, drop later duplicates, then fix the aggregates
+    removed = conn.exec_driver_sql(
+        "DELETE FROM feedback WHERE id NOT IN (SELECT MIN(id) FROM feedback GROUP BY booking_id)"
+    ).rowcount
+    if removed:
+        recompute_ratings(conn)
+    create_indexes(conn, Feedback)
+
+
+@migration(5, 'background job queue')
+def add_job_table(conn):
+    from .models import Job
+
+    db.metadata.create_all(conn, tables=[Job.__table__])
+
+
+@migration(6, 'provider dashboard rollups')
+def add_provider_rollups(conn):
+    from .models import ProviderDailyStats
+    from .rollups import rebuild_rollups
+
+    db.metadata.create_all(conn, tables=[ProviderDailyStats.__table__])
+    rebuild_rollups(conn)
+
+
+@migration(7, 'customer row versions')
+def add_user_updated_at(conn):
+    from .models import User
+
+    add_column(conn, User.__table__.c.updated_at)
+
+
+@migration(8, 'provider working hours configured flag')
+def add_hours_configured(conn):
+    from .models import Provider
+
+    if add_column(conn, Provider.__table__.c.hours_configured, server_default='FALSE'):
+        conn.exec_driver_sql(
+            "UPDATE provider SET hours_configured = TRUE "
+            "WHERE id IN (SELECT provider_id FROM provider_availability)"
+        )
+
+
+def _ensure_version_table(conn):
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    )
+
+
+def current_version(conn=None):
+    if conn is None:
+        with db.engine.connect() as conn:
+            return current_version(conn)
+    if not inspect(conn).has_table(VERSION_TABLE):
+        return 0
+    return conn.exec_driver_sql(f"SELECT MAX(version) FROM {VERSION_TABLE}").scalar() or 0
+
+
+def head_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def upgrade():
+    """Apply pending migrations. Returns [(version, description)] of those applied."""
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        version = current_version(conn)
+    if version >= head_version():
+        return []
+
+    applied = []
+    for number, description, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                db.text(f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) "
+                        "VALUES (:version, :description, :applied_at)"),
+                {'version': number, 'description': description, 'applied_at': datetime.utcnow()},
+            )
+        applied.append((number, description))
+    return applied
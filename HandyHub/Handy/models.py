@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from flask_login import UserMixin
 from .extensions import db
+from .passwords import hash_password
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -13,16 +14,23 @@ class User(db.Model, UserMixin):
     address = db.Column(db.String(500), nullable=False)
     role = db.Column(db.String(20), nullable=False)
     image = db.Column(db.String(255), nullable=True, default='default.png')
+    latitude = db.Column(db.Float, nullable=True)  # Geocoded from address, see geo.py
+    longitude = db.Column(db.Float, nullable=True)
+    geohash = db.Column(db.String(12), nullable=True)
     
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Row version for ETags
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)  # PASSWORD_HASH_METHOD, see passwords.py
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def get_id(self):
+        return f'customer:{self.id}'  # Flask-Login session id, see identity.py
+
     def __repr__(self):
         return f'<User {self.first_name} {self.last_name}>'
 
@@ -50,16 +58,46 @@ class Provider(db.Model, UserMixin):
     experience = db.Column(db.Integer, nullable=True)
     image = db.Column(db.String(255), nullable=True, default='default.png')
     location = db.Column(db.String(255), nullable=True)
-    rating = db.Column(db.Float, default=0.0)
+    latitude = db.Column(db.Float, nullable=True)  # Geocoded from location, see geo.py
+    longitude = db.Column(db.Float, nullable=True)
+    geohash = db.Column(db.String(12), nullable=True)
+    rating = db.Column(db.Float, default=0.0)  # Average rating, kept in sync with rating_sum / rating_count
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    # Set once the provider saves working hours, even none: no rows then means every day off
+    hours_configured = db.Column(db.Boolean, nullable=False, default=False)
     role = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Row version for ETags
+
+    __table_args__ = (
+        # Keyset pagination of the directory: (filter, sort column, id)
+        db.Index('ix_provider_rating_id', 'rating', 'id'),
+        db.Index('ix_provider_price_id', 'service_price', 'id'),
+        db.Index('ix_provider_experience_id', db.func.coalesce(db.text('experience'), 0), 'id'),
+        db.Index('ix_provider_created_id', 'created_at', 'id'),
+        db.Index('ix_provider_service_rating_id', 'service_id', 'rating', 'id'),
+        db.Index('ix_provider_service_price_id', 'service_id', 'service_price', 'id'),
+        db.Index('ix_provider_service_experience_id', 'service_id', db.func.coalesce(db.text('experience'), 0), 'id'),
+        db.Index('ix_provider_service_created_id', 'service_id', 'created_at', 'id'),
+        # Proximity search: prefix range scans on geohash, optionally within a service
+        db.Index('ix_provider_geohash', 'geohash'),
+        db.Index('ix_provider_service_geohash', 'service_id', 'geohash'),
+    )
+
+    @property
+    def average_rating(self):
+        return round(self.rating or 0, 2)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)  # PASSWORD_HASH_METHOD, see passwords.py
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def get_id(self):
+        return f'provider:{self.id}'  # Flask-Login session id, see identity.py
+
     def __repr__(self):
         return f'<Provider {self.first_name} {self.last_name}, Service: {self.service.name}>'
 
@@ -75,15 +113,65 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default="Pending")
     feedback = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Row version for ETags
 
     customer = db.relationship('User', backref=db.backref('bookings', lazy=True))
     provider = db.relationship('Provider', backref=db.backref('bookings', lazy=True))
     service = db.relationship('Service', backref=db.backref('bookings', lazy=True))
 
+    __table_args__ = (
+        # booking_history / provider_bookings page by (created_at, id) newest first
+        db.Index('ix_booking_customer_created_id', 'customer_id', 'created_at', 'id'),
+        db.Index('ix_booking_provider_created_id', 'provider_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f"<Booking {self.id} - {self.customer.first_name} booked {self.provider.first_name}>"
     
 
+class ProviderAvailability(db.Model):
+    """Weekly working hours; a provider who never set any uses DEFAULT_WORKING_HOURS (see availability.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('provider.id'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # Monday = 0
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=60)
+
+    provider = db.relationship('Provider', backref=db.backref('availability', lazy=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('provider_id', 'weekday', name='uq_availability_provider_weekday'),
+    )
+
+
+class ProviderBlackout(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('provider.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('provider_id', 'date', name='uq_blackout_provider_date'),
+    )
+
+
+class SlotReservation(db.Model):
+    """
+    One row per occupied slot. The unique constraint is what makes booking
+    race-free across workers: two inserts for the same slot can't both commit.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('provider.id'), nullable=False)
+    slot_date = db.Column(db.Date, nullable=False)
+    slot_time = db.Column(db.Time, nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False, unique=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('provider_id', 'slot_date', 'slot_time', name='uq_reservation_provider_slot'),
+    )
+
+
 class Feedback(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -97,6 +185,13 @@ class Feedback(db.Model):
     provider = db.relationship('Provider', backref='feedbacks', lazy=True)
     booking = db.relationship('Booking', backref='feedbacks', lazy=True)
 
+    __table_args__ = (
+        # One review per booking; also serves the "has feedback" EXISTS on booking_history
+        db.Index('uq_feedback_booking', 'booking_id', unique=True),
+        # Rating aggregates are GROUP BY provider_id over rating (see ratings.py)
+        db.Index('ix_feedback_provider_rating', 'provider_id', 'rating'),
+    )
+
     def __repr__(self):
         return f'<Feedback {self.rating} from User {self.user_id} to Provider {self.provider_id} for Booking {self.booking_id}>'
 
@@ -109,4 +204,57 @@ class ContactMessage(db.Model):
     message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     
-    
\ No newline at end of file
+    
+
+class Job(db.Model):
+    """A unit of background work, run by `flask jobs-worker` (see jobs.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON kwargs for the task
+    unique_key = db.Column(db.String(255), nullable=True)  # At most one queued job per key
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / done / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Workers claim the oldest due job: WHERE status = 'queued' AND run_at <= now ORDER BY run_at, id
+        db.Index('ix_job_status_run_at_id', 'status', 'run_at', 'id'),
+        db.Index('ix_job_unique_key_status', 'unique_key', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+
+class ProviderDailyStats(db.Model):
+    """
+    Per-provider, per-day dashboard rollup, kept up to date by the booking
+    transitions and reviews (see rollups.py). Status counts and revenue are
+    by booking_date, ratings by the day the review was left.
+    """
+    __tablename__ = 'provider_daily_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('provider.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    pending = db.Column(db.Integer, nullable=False, default=0)
+    confirmed = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)  # service_price of each completed job
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Upsert target, and the dashboard reads a provider's days in order
+        db.UniqueConstraint('provider_id', 'day', name='uq_provider_daily_stats_provider_day'),
+    )
+
+    def __repr__(self):
+        return f'<ProviderDailyStats {self.provider_id} {self.day}>'
@@ -0,0 +1,264 @@
+"""
+Bulk onboarding of providers and customers from partner files.
+
+`flask import-accounts catalog.csv --kind provider` streams a CSV file (with
+a header row) or NDJSON (one JSON object per line) and inserts the accounts
+in batches, instead of one signup request per row:
+
+  - every row is validated on its own: required columns, email and phone
+    format, numbers, and the service (by name or id);
+  - emails and phones are checked against sets loaded with one query up
+    front and extended with every accepted row, so duplicates within the
+    file are caught as well;
+  - passwords are hashed in a process pool (PASSWORD_HASH_METHOD), which
+    overlaps with inserting the previous batch;
+  - each batch goes in with one executemany, plus one for the search index,
+    in its own transaction.
+
+A bad row is reported with its line number and skipped; the rest of its
+batch still goes in. If the database rejects a batch anyway (a signup took
+one of the emails meanwhile, say) the batch is retried row by row.
+
+Columns are the model's: first_name, last_name, email, phone and, for
+providers, business_name, service (name or id), service_price, experience,
+location; for customers address. password is optional: rows without one
+get a hash nothing matches, and the owner sets a password through the
+forgot-password page.
+"""
+import csv
+import json
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from .extensions import db
+from .geo import geocode, geohash_encode
+from .models import Provider, Service, User
+
+KINDS = {'provider': Provider, 'customer': User}
+REQUIRED = {
+    'provider': ('first_name', 'last_name', 'business_name', 'email', 'phone', 'service'),
+    'customer': ('first_name', 'last_name', 'email', 'phone'),
+}
+UNUSABLE_PASSWORD = '!'  # Not a werkzeug hash, so check_password_hash is always False
+
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_PHONE = re.compile(r'^\+?[0-9][0-9 ()-]*$')
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(file, fmt):
+    """(line number, dict) for each record of a CSV or NDJSON file object, one at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f'invalid JSON: {exc}')
+            continue
+        yield line_number, record if isinstance(record, dict) else RowError('not a JSON object')
+
+
+def _text(record, key, max_length=None):
+    value = record.get(key)
+    value = '' if value is None else str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RowError(f'{key} longer than {max_length} characters')
+    return value
+
+
+def _number(record, key, cast, default):
+    value = _text(record, key)
+    if not value:
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        raise RowError(f'{key} is not a number: {value!r}') from None
+    if number < 0:
+        raise RowError(f'{key} is negative')
+    return number
+
+
+class _Validator:
+    """Turns records into insert rows, tracking the emails and phones already taken."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        model = KINDS[kind]
+        self.emails, self.phones = set(), set()
+        for email, phone in db.session.query(model.email, model.phone):
+            self.emails.add(email.lower())
+            self.phones.add(phone)
+        self.services = dict(db.session.query(Service.id, Service.name))
+        self.service_ids = {name.lower(): service_id for service_id, name in self.services.items()}
+
+    def _service_id(self, value):
+        if value.isdigit() and int(value) in self.services:
+            return int(value)
+        service_id = self.service_ids.get(value.lower())
+        if service_id is None:
+            raise RowError(f'unknown service {value!r}')
+        return service_id
+
+    def row(self, record):
+        """(insert row, plain password or None); raises RowError."""
+        missing = [key for key in REQUIRED[self.kind] if not _text(record, key)]
+        if missing:
+            raise RowError(f"missing {', '.join(missing)}")
+        email = _text(record, 'email', 120)
+        phone = _text(record, 'phone', 15)
+        if not _EMAIL.match(email):
+            raise RowError(f'invalid email {email!r}')
+        if not _PHONE.match(phone):
+            raise RowError(f'invalid phone {phone!r}')
+        if email.lower() in self.emails:
+            raise RowError(f'email {email} already exists')
+        if phone in self.phones:
+            raise RowError(f'phone {phone} already exists')
+
+        row = {
+            'first_name': _text(record, 'first_name', 100),
+            'last_name': _text(record, 'last_name', 100),
+            'email': email,
+            'phone': phone,
+            'role': self.kind,
+            'password_hash': UNUSABLE_PASSWORD,
+        }
+        if self.kind == 'provider':
+            row.update(
+                business_name=_text(record, 'business_name', 100),
+                service_id=self._service_id(_text(record, 'service')),
+                service_price=_number(record, 'service_price', float, 0.0),
+                experience=_number(record, 'experience', int, None),
+                location=_text(record, 'location', 255) or None,
+            )
+            place = row['location']
+        else:
+            row['address'] = _text(record, 'address', 500) or 'Not Provided'
+            place = row['address']
+        # Same offline geocoder signup uses (geo.set_coordinates)
+        coords = geocode(place)
+        row['latitude'], row['longitude'] = coords or (None, None)
+        row['geohash'] = geohash_encode(*coords) if coords else None
+
+        self.emails.add(email.lower())
+        self.phones.add(phone)
+        return row, _text(record, 'password') or None
+
+
+class _InlineExecutor:
+    def map(self, fn, iterable, chunksize=1):
+        return map(fn, iterable)
+
+    def shutdown(self):
+        pass
+
+
+def import_accounts(file, kind, fmt='csv', batch_size=1000, workers=None, dry_run=False, on_error=None):
+    """
+    Import accounts of `kind` ('provider' or 'customer') from an open file.
+    on_error(line, message) is called for each rejected row. Returns
+    {'read', 'inserted', 'errors', 'seconds', 'rows_per_s'}.
+    """
+    model = KINDS[kind]
+    if kind == 'provider':
+        from .search import ensure_search_index
+        ensure_search_index()
+    validator = _Validator(kind)
+    hasher = partial(generate_password_hash, method=current_app.config['PASSWORD_HASH_METHOD'])
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 0 and not dry_run else _InlineExecutor()
+    stats = {'read': 0, 'inserted': 0, 'errors': 0}
+    touched_services = set()
+
+    def reject(line, message):
+        stats['errors'] += 1
+        if on_error:
+            on_error(line, message)
+
+    def hash_batch(batch):
+        # Submits now, so the pool hashes while the previous batch is inserted
+        indexes = [i for i, (_, _, password) in enumerate(batch) if password]
+        return indexes, executor.map(hasher, [batch[i][2] for i in indexes], chunksize=16)
+
+    def insert_batch(batch, hashing):
+        indexes, hashes = hashing
+        for i, password_hash in zip(indexes, hashes):
+            batch[i][1]['password_hash'] = password_hash
+        rows = [row for _, row, _ in batch]
+        try:
+            _insert(model, kind, rows, validator.services)
+            db.session.commit()
+            stats['inserted'] += len(rows)
+        except IntegrityError:
+            db.session.rollback()
+            for line, row, _ in batch:  # One at a time, to find the row(s) at fault
+                try:
+                    with db.session.begin_nested():
+                        _insert(model, kind, [row], validator.services)
+                    stats['inserted'] += 1
+                except IntegrityError as exc:
+                    reject(line, f'rejected by the database: {exc.orig}')
+            db.session.commit()
+        touched_services.update(row['service_id'] for row in rows if 'service_id' in row)
+
+    started = time.perf_counter()
+    batch, pending = [], None
+    try:
+        for line, record in read_rows(file, fmt):
+            stats['read'] += 1
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                row, password = validator.row(record)
+            except RowError as exc:
+                reject(line, str(exc))
+                continue
+            batch.append((line, row, password))
+            if len(batch) >= batch_size:
+                if not dry_run:
+                    hashing = hash_batch(batch)
+                    if pending:
+                        insert_batch(*pending)
+                    pending = (batch, hashing)
+                batch = []
+        if batch and not dry_run:
+            hashing = hash_batch(batch)
+            if pending:
+                insert_batch(*pending)
+            pending = (batch, hashing)
+        if pending:
+            insert_batch(*pending)
+    finally:
+        executor.shutdown()
+
+    if touched_services:
+        from ..recommendation.recommendation_engine import notify_provider_changed
+        notify_provider_changed(*touched_services)
+    elapsed = time.perf_counter() - started
+    return {**stats, 'seconds': elapsed, 'rows_per_s': stats['read'] / elapsed if elapsed else 0.0}
+
+
+def _insert(model, kind, rows, services):
+    # Core insert on the table: a single executemany. The ORM variant splits a batch by which values
+    # are None, and RETURNING ordered ids makes SQLite insert row by row
+    db.session.execute(model.__table__.insert(), rows)
+    if kind == 'provider':
+        from .search import index_new_providers
+        ids = dict(db.session.query(model.email, model.id).filter(model.email.in_([row['email'] for row in rows])))
+        index_new_providers([SimpleNamespace(id=ids[row['email']], **row) for row in rows], services)
@@ -0,0 +1,97 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the (sort value, id) of its last row
+and the next page starts strictly after it, so with an index on
+(sort column, id) page N costs the same as page 1.
+"""
+import base64
+import json
+import math
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    raw = json.dumps([value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, value_type=None):
+    """
+    (value, id) from a cursor. With value_type float or datetime the value
+    must be a finite number / a datetime (or None, for a NULL sort value);
+    anything else raises InvalidCursor rather than reaching the query.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['dt'])
+        if isinstance(row_id, bool) or not isinstance(row_id, int):
+            raise TypeError(row_id)
+        if value_type is not None and value is not None:
+            value = _coerce(value, value_type)
+        return value, row_id
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def _coerce(value, value_type):
+    if value_type is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise TypeError(value)
+        return float(value)
+    if not isinstance(value, value_type):
+        raise TypeError(value)
+    return value
+
+
+class Page:
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_page(query, sort_column, id_column, cursor_key, descending=True, cursor=None, per_page=20,
+                value_type=None):
+    """
+    One page of `query` ordered by (sort_column, id_column), both ascending or
+    both descending. `cursor_key(row)` must return the row's
+    (sort value, id) so the next cursor can be built; value_type is the
+    sort value's type (float or datetime), checked when decoding a cursor.
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor, value_type)
+        key = tuple_(sort_column, id_column)
+        query = query.filter(key < (value, row_id) if descending else key > (value, row_id))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(*cursor_key(rows[-1]))
+    return Page(rows, next_cursor)
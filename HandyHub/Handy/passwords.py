@@ -0,0 +1,27 @@
+"""
+Password hashing with a configurable cost.
+
+PASSWORD_HASH_METHOD is a werkzeug method string: the default
+"scrypt:32768:8:1" (n, r, p), a cheaper or dearer scrypt, or e.g.
+"pbkdf2:sha256:600000". Changing it only affects new hashes; existing ones
+are redone on the account's next successful login (needs_rehash), the one
+time the plain password is at hand.
+"""
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # Werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1"), so hash once to see them
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
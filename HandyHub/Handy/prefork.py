@@ -0,0 +1,41 @@
+"""
+Hooks for running under a preforking server (gunicorn with preload_app,
+see gunicorn.conf.py).
+
+The master loads the app once, warms the read-only data every worker needs
+and then forks; workers share those pages copy-on-write until they write to
+them. Database connections are the exception: a socket opened in the
+master must never be used by two processes, so pools are reset after fork.
+"""
+import gc
+
+from .extensions import db
+
+
+def warm_shared_state(app):
+    """Run in the master before workers are forked."""
+    from .assets import build_assets, manifest
+    from .queries import all_services
+    from ..recommendation.recommendation_engine import preload
+
+    with app.app_context():
+        if app.config['STATIC_FINGERPRINT']:
+            build_assets()  # Only writes what a previous build didn't
+            manifest()
+        all_services()
+        preload()
+        # Don't hand the master's open connections down to the workers
+        db.engine.dispose()
+
+    # Objects still alive now are long lived; freezing them keeps the cyclic
+    # GC in the workers from touching (and therefore copying) their pages
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork(app):
+    """Run in each worker right after fork."""
+    with app.app_context():
+        # close=False: leave any inherited connections to the parent, just
+        # stop this process from checking them out of the pool
+        db.engine.dispose(close=False)
@@ -0,0 +1,131 @@
+"""
+Read queries used by the listing and booking pages.
+
+Every function here loads the relationships its template touches up front
+(joinedload for many-to-one), so rendering a page costs a fixed number of
+statements no matter how many rows it shows.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import exists, func, literal_column
+from sqlalchemy.orm import joinedload
+
+from .extensions import db
+from .models import Provider, Service, Booking, Feedback
+from .pagination import keyset_page
+
+DIRECTORY_PAGE_SIZE = 24
+BOOKINGS_PAGE_SIZE = 20
+
+# sort name -> (column, descending, value of a row for the cursor, type of that value)
+DIRECTORY_SORTS = {
+    'rating': (Provider.rating, True, lambda p: p.rating, float),
+    'price': (Provider.service_price, False, lambda p: p.service_price, float),
+    # Literal 0, not a bound parameter, so SQLite matches ix_provider_experience_id
+    'experience': (func.coalesce(Provider.experience, literal_column('0')), True, lambda p: p.experience or 0,
+                   float),
+    'newest': (Provider.created_at, True, lambda p: p.created_at, datetime),
+}
+
+
+# Services only change with a deploy (add_services.py), so the catalog is read
+# once per process; under a preloaded gunicorn that's once in the master and
+# the workers share it copy-on-write.
+CatalogEntry = namedtuple('CatalogEntry', 'id name description')
+_service_catalog = None
+_catalog_version = 0
+
+
+def all_services():
+    global _service_catalog
+    if _service_catalog is None:
+        _service_catalog = tuple(
+            CatalogEntry(*row)
+            for row in db.session.query(Service.id, Service.name, Service.description).order_by(Service.id)
+        )
+    return _service_catalog
+
+
+def reset_service_catalog():
+    global _service_catalog, _catalog_version
+    _service_catalog = None
+    _catalog_version += 1
+
+
+def catalog_version():
+    """Changes whenever the catalog is reloaded; for fragment cache keys."""
+    return _catalog_version
+
+
+def directory_page(service_id=None, sort='rating', min_price=None, max_price=None,
+                   cursor=None, per_page=DIRECTORY_PAGE_SIZE):
+    """One keyset page of the provider directory, filtered and sorted in SQL."""
+    column, descending, value, value_type = DIRECTORY_SORTS.get(sort, DIRECTORY_SORTS['rating'])
+    query = Provider.query.options(joinedload(Provider.service))
+    if service_id:
+        query = query.filter(Provider.service_id == service_id)
+    if min_price is not None:
+        query = query.filter(Provider.service_price >= min_price)
+    if max_price is not None:
+        query = query.filter(Provider.service_price <= max_price)
+    return keyset_page(
+        query, column, Provider.id, lambda p: (value(p), p.id),
+        descending=descending, cursor=cursor, per_page=per_page, value_type=value_type,
+    )
+
+
+def providers_by_ids(provider_ids):
+    """Load providers (with their service) keeping the order of provider_ids."""
+    if not provider_ids:
+        return []
+    providers = (
+        Provider.query
+        .options(joinedload(Provider.service))
+        .filter(Provider.id.in_(provider_ids))
+        .all()
+    )
+    by_id = {provider.id: provider for provider in providers}
+    return [by_id[pid] for pid in provider_ids if pid in by_id]
+
+
+def provider_with_service(provider_id):
+    return (
+        Provider.query
+        .options(joinedload(Provider.service))
+        .filter(Provider.id == provider_id)
+        .first_or_404()
+    )
+
+
+def customer_bookings(customer_id, cursor=None, per_page=BOOKINGS_PAGE_SIZE):
+    """
+    One page of a customer's bookings (newest first) with provider loaded,
+    plus a {booking_id: has_feedback} dict, all in one statement.
+    """
+    has_feedback = exists().where(Feedback.booking_id == Booking.id)
+    query = (
+        db.session.query(Booking, has_feedback.label('has_feedback'))
+        .options(joinedload(Booking.provider))
+        .filter(Booking.customer_id == customer_id)
+    )
+    page = keyset_page(
+        query, Booking.created_at, Booking.id, lambda row: (row[0].created_at, row[0].id),
+        cursor=cursor, per_page=per_page, value_type=datetime,
+    )
+    feedback_status = {booking.id: bool(flag) for booking, flag in page.items}
+    page.items = [booking for booking, _ in page.items]
+    return page, feedback_status
+
+
+def provider_bookings(provider_id, cursor=None, per_page=BOOKINGS_PAGE_SIZE):
+    """One page of a provider's bookings (newest first) with customer and service loaded."""
+    query = (
+        Booking.query
+        .options(joinedload(Booking.customer), joinedload(Booking.service))
+        .filter(Booking.provider_id == provider_id)
+    )
+    return keyset_page(
+        query, Booking.created_at, Booking.id, lambda b: (b.created_at, b.id),
+        cursor=cursor, per_page=per_page, value_type=datetime,
+    )
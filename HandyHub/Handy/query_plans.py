@@ -0,0 +1,121 @@
+"""
+Query-plan regression check for the hot read paths.
+
+Runs the real query functions (directory, booking lists, search, proximity,
+slots, recommendations), captures the SQL they emit and asks SQLite for
+EXPLAIN QUERY PLAN on each statement. A plan step that reads a whole table
+(`SCAN <table>` without an index) is a failure, so a dropped index or a
+query rewritten into an unindexable shape shows up here rather than as a
+slow page in production.
+
+    flask check-query-plans     exits 1 if any hot query full-scans
+"""
+import re
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from .extensions import db
+
+# A bare SCAN reads every row. SCAN ... USING INDEX is fine when the index
+# delivers the ORDER BY (the LIMIT stops it early), but not when the rows
+# still go through a temp b-tree sort: then the whole index is read.
+_SCAN = re.compile(r'^SCAN (\w+)\b( USING (?:COVERING )?INDEX| VIRTUAL TABLE)?')
+_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+# Tables small and bounded enough that a scan is the right plan
+ALLOWED_SCANS = {'service'}
+
+
+@contextmanager
+def capture_statements(engine):
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def _sample_ids():
+    from .models import Provider, Service, User
+
+    provider = Provider.query.order_by(Provider.id).first()
+    return {
+        'service_id': db.session.query(db.func.min(Service.id)).scalar() or 1,
+        'provider_id': provider.id if provider else 1,
+        'customer_id': db.session.query(db.func.min(User.id)).scalar() or 1,
+    }
+
+
+def hot_queries():
+    """(name, callable) pairs exercising the indexed read paths."""
+    from . import queries, geo
+    from .availability import free_slots
+    from .rollups import provider_dashboard
+    from .search import search_provider_ids
+    from ..recommendation.recommendation_engine import get_top_rated_providers
+
+    ids = _sample_ids()
+    today = date.today()
+    cases = []
+    for sort in queries.DIRECTORY_SORTS:
+        cases.append((f'directory sort={sort}', lambda sort=sort: queries.directory_page(sort=sort)))
+        cases.append((f'directory sort={sort} by service',
+                      lambda sort=sort: queries.directory_page(ids['service_id'], sort=sort)))
+    cases += [
+        ('directory next page', lambda: queries.directory_page(
+            cursor=queries.directory_page(per_page=1).next_cursor, per_page=1)),
+        ('booking history', lambda: queries.customer_bookings(ids['customer_id'])),
+        ('provider bookings', lambda: queries.provider_bookings(ids['provider_id'])),
+        ('providers by ids', lambda: queries.providers_by_ids([ids['provider_id']])),
+        ('search', lambda: search_provider_ids('plumb', ids['service_id'])),
+        ('nearby providers', lambda: geo.nearby_providers(17.385, 78.4867, ids['service_id'])),
+        ('nearby providers by price', lambda: geo.nearby_providers(17.385, 78.4867, ids['service_id'],
+                                                                  min_price=20, max_price=80)),
+        ('free slots', lambda: free_slots(ids['provider_id'], today, today + timedelta(days=13))),
+        ('top rated', lambda: get_top_rated_providers(ids['service_id'])),
+        ('provider dashboard', lambda: provider_dashboard(ids['provider_id'])),
+    ]
+    return cases
+
+
+def full_scans(plan_rows):
+    details = [row[-1] for row in plan_rows]
+    sorted_after = _SORT in details
+    scans = []
+    for detail in details:
+        match = _SCAN.match(detail)
+        if not match or match.group(1) in ALLOWED_SCANS:
+            continue
+        access = match.group(2)
+        if access is None or (sorted_after and 'INDEX' in access):
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans():
+    """
+    Returns [(name, statement, plan details, full scans)] for every captured
+    statement. Only SQLite is checked; other backends return [].
+    """
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return []
+
+    results = []
+    for name, run in hot_queries():
+        with capture_statements(engine) as captured:
+            run()
+        with engine.connect() as conn:
+            for statement, parameters in captured:
+                rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+                details = [row[-1] for row in rows]
+                results.append((name, statement, details, full_scans(rows)))
+    return results
@@ -0,0 +1,137 @@
+"""
+Token-bucket rate limiting for the password forms.
+
+Checking or making a password hash is deliberately expensive (scrypt, tens
+of ms of CPU), so a credential-stuffing burst against login or signup can
+keep every worker busy hashing. Those routes take a token per client IP
+and, for logins, per account email before touching a hash; an empty
+bucket answers 429 with Retry-After straight away.
+
+Limits are "N/period" strings (second, minute, hour or day): a bucket holds
+N tokens and refills continuously at N per period, so a burst of typos is
+fine and sustained guessing isn't.
+
+Buckets are per process unless RATELIMIT_URL points at Redis, which shares
+them between all workers and hosts (needs the `redis` package).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, flash, render_template, request
+
+from .metrics import RATE_LIMITED
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(text):
+    """'10/minute' -> (capacity 10, refill rate in tokens per second)."""
+    count, _, period = text.partition('/')
+    return int(count), int(count) / PERIODS[period.strip().rstrip('s')]
+
+
+class LocalBucketBackend:
+    """Per-process buckets; the least recently used are dropped (i.e. refilled) past max_keys."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take a token. Returns 0 if there was one, else seconds until there is."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketBackend:
+    """Buckets shared by every worker; the refill and take run atomically in Redis."""
+
+    SCRIPT = """
+    local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed = tokens >= 1
+    if allowed then tokens = tokens - 1 end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    if allowed then return '0' end
+    return tostring((1 - tokens) / rate)
+    """
+
+    def __init__(self, url, prefix='handyhub:rl:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('RATELIMIT_URL is set but the redis package is not installed') from exc
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._prefix = prefix
+
+    def take(self, key, capacity, rate):
+        return float(self._script(keys=[self._prefix + ':'.join(key)], args=[capacity, rate, time.time()]))
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        url = current_app.config['RATELIMIT_URL']
+        _backend = RedisBucketBackend(url) if url else LocalBucketBackend()
+    return _backend
+
+
+def client_ip():
+    # Behind RATELIMIT_TRUSTED_PROXIES proxies the client is that far from the end of X-Forwarded-For
+    proxies = current_app.config['RATELIMIT_TRUSTED_PROXIES']
+    route = request.access_route
+    if proxies and len(route) >= proxies:
+        return route[-proxies]
+    return request.remote_addr or 'unknown'
+
+
+def throttle(*rules):
+    """
+    Take a token for each (config key, bucket key) rule, e.g.
+    ('RATELIMIT_LOGIN_IP', client_ip()). Returns 0 when allowed, otherwise
+    the seconds to wait.
+    """
+    config = current_app.config
+    if not config['RATELIMIT_ENABLED']:
+        return 0
+    backend = get_backend()
+    for rule, key in rules:
+        capacity, rate = parse_rate(config[rule])
+        wait = backend.take((rule, str(key).lower()), capacity, rate)
+        if wait:
+            RATE_LIMITED.inc(rule)
+            return wait
+    return 0
+
+
+def too_many_attempts(template, wait, **context):
+    """The form again with status 429, before any password work."""
+    flash('Too many attempts. Please wait a moment and try again.', category='error')
+    return render_template(template, **context), 429, {'Retry-After': str(int(wait) + 1)}
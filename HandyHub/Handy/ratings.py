@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from .extensions import db
+from .identity import invalidate_all_accounts
+from .models import Provider, Feedback
+
+
+def record_rating(provider_id, rating):
+    """
+    Fold a new rating into the provider's stored aggregates.
+
+    Runs as a single UPDATE in the caller's transaction, so it commits (or
+    rolls back) together with the Feedback row and concurrent writers can't
+    lose each other's increments.
+    """
+    db.session.query(Provider).filter(Provider.id == provider_id).update(
+        {
+            Provider.rating_sum: Provider.rating_sum + rating,
+            Provider.rating_count: Provider.rating_count + 1,
+            # SET expressions see the old row values, hence the +rating / +1 here too
+            Provider.rating: (Provider.rating_sum + rating) * 1.0 / (Provider.rating_count + 1),
+        },
+        synchronize_session=False,
+    )
+
+
+def rebuild_provider_ratings():
+    """
+    Recompute rating_sum, rating_count and rating for every provider from the
+    feedback table. Used as a backfill and to repair drifted aggregates.
+    Returns the number of providers whose aggregates changed.
+    """
+    totals = dict(
+        (provider_id, (rating_sum, rating_count))
+        for provider_id, rating_sum, rating_count in db.session.query(
+            Feedback.provider_id,
+            func.sum(Feedback.rating),
+            func.count(Feedback.id),
+        ).group_by(Feedback.provider_id)
+    )
+
+    now = datetime.utcnow()
+    rows = []
+    current = db.session.query(Provider.id, Provider.rating_sum, Provider.rating_count, Provider.rating)
+    for provider_id, old_sum, old_count, old_rating in current:
+        rating_sum, rating_count = totals.get(provider_id, (0, 0))
+        rating = (rating_sum / rating_count) if rating_count else 0.0
+        if (old_sum, old_count) == (rating_sum, rating_count) and old_rating is not None \
+                and abs(old_rating - rating) < 1e-9:
+            continue  # Leave untouched rows (and their updated_at version) alone
+        rows.append({
+            'id': provider_id,
+            'rating_sum': int(rating_sum or 0),
+            'rating_count': rating_count,
+            'rating': rating,
+            'updated_at': now,
+        })
+
+    if rows:
+        db.session.execute(db.update(Provider), rows)
+    db.session.commit()
+    if rows:
+        invalidate_all_accounts()
+    return len(rows)
@@ -0,0 +1,179 @@
+"""
+Provider dashboard rollups.
+
+provider_daily_stats holds, per provider and day, how many bookings are in
+each status, the revenue of the completed ones and the sum / count of the
+ratings received. The dashboard reads a provider's rows and nothing else,
+so it costs the same however many bookings they have.
+
+The rows are updated in the same transaction as the change they count:
+
+  - book_slot adds a Pending booking (record_booking);
+  - confirm / reject / complete / cancel go through change_status, which
+    only moves a booking that still has the expected status, so a double
+    submit is counted once;
+  - submit_feedback adds the rating (record_feedback).
+
+Each is one INSERT ... ON CONFLICT DO UPDATE SET x = x + delta, so
+concurrent writers can't lose each other's increments (as in ratings.py).
+Status counts and revenue go on the booking_date, ratings on the day the
+review was left. Revenue is the provider's service_price at completion.
+
+`flask rebuild-rollups` recomputes everything from bookings and feedback,
+as a backfill or to repair drift. It prices completed jobs at today's
+service_price, since bookings don't record one.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .extensions import db
+from .models import Booking, Feedback, Provider, ProviderDailyStats
+
+STATUS_COLUMNS = {
+    'Pending': 'pending', 'Confirmed': 'confirmed', 'Completed': 'completed',
+    'Rejected': 'rejected', 'Cancelled': 'cancelled',
+}
+COUNTERS = tuple(STATUS_COLUMNS.values()) + ('revenue', 'rating_sum', 'rating_count')
+DASHBOARD_DAYS = 30
+
+Totals = namedtuple('Totals', COUNTERS + ('bookings', 'average_rating'))
+
+
+def _add(provider_id, day, **deltas):
+    """Add `deltas` to a provider's row for `day`, creating it if needed."""
+    table = ProviderDailyStats.__table__
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    insert = dialect.insert(table).values(provider_id=provider_id, day=day, **deltas)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['provider_id', 'day'],
+        set_={name: table.c[name] + insert.excluded[name] for name in deltas},
+    ))
+
+
+def record_booking(booking):
+    """Count a new Pending booking; part of the caller's transaction."""
+    _add(booking.provider_id, booking.booking_date, pending=1)
+
+
+def change_status(booking, expected, status):
+    """
+    Move `booking` from status `expected` to `status` and its count with it,
+    in the caller's transaction. Returns False, changing nothing, if the
+    booking's status isn't `expected` (any more).
+    """
+    changed = (
+        Booking.query
+        .filter(Booking.id == booking.id, Booking.status == expected)
+        .update({Booking.status: status})
+    )
+    if not changed:
+        return False
+    deltas = {STATUS_COLUMNS[expected]: -1, STATUS_COLUMNS[status]: 1}
+    if status == 'Completed':
+        deltas['revenue'] = (
+            select(Provider.service_price).where(Provider.id == booking.provider_id).scalar_subquery()
+        )
+    _add(booking.provider_id, booking.booking_date, **deltas)
+    return True
+
+
+def record_feedback(feedback):
+    """Add a (flushed) review's rating; part of the caller's transaction."""
+    _add(feedback.provider_id, feedback.created_at.date(), rating_sum=feedback.rating, rating_count=1)
+
+
+def _totals(counters):
+    counters = {name: counters.get(name) or 0 for name in COUNTERS}
+    bookings = sum(counters[name] for name in STATUS_COLUMNS.values())
+    average = counters['rating_sum'] / counters['rating_count'] if counters['rating_count'] else None
+    return Totals(bookings=bookings, average_rating=average, **counters)
+
+
+def provider_dashboard(provider_id, days=DASHBOARD_DAYS, today=None):
+    """
+    The provider's rollup rows from `days` ago onwards (upcoming bookings
+    included), newest first, as (day, Totals) pairs, plus the totals over
+    them and over all time. Two queries, on provider_daily_stats only.
+    """
+    since = (today or date.today()) - timedelta(days=days - 1)
+    table = ProviderDailyStats.__table__
+    rows = db.session.execute(
+        select(table.c.day, *(table.c[name] for name in COUNTERS))
+        .where(table.c.provider_id == provider_id, table.c.day >= since)
+        .order_by(table.c.day.desc())
+    ).all()
+    lifetime = db.session.execute(
+        select(*(func.sum(table.c[name]).label(name) for name in COUNTERS))
+        .where(table.c.provider_id == provider_id)
+    ).one()
+    recent = {name: sum(getattr(row, name) for row in rows) for name in COUNTERS}
+    return {
+        'since': since,
+        'days': [(row.day, _totals(row._asdict())) for row in rows],
+        'recent': _totals(recent),
+        'lifetime': _totals(lifetime._asdict()),
+    }
+
+
+def _computed_rows(conn):
+    """{(provider_id, day): {counter: value}} straight from bookings and feedback."""
+    statuses = [
+        func.sum(case((Booking.status == status, 1), else_=0)).label(column)
+        for status, column in STATUS_COLUMNS.items()
+    ]
+    revenue = func.sum(case((Booking.status == 'Completed', Provider.service_price), else_=0.0))
+    bookings = (
+        select(Booking.provider_id, Booking.booking_date, *statuses, revenue.label('revenue'))
+        .join(Provider, Provider.id == Booking.provider_id)
+        .group_by(Booking.provider_id, Booking.booking_date)
+    )
+    review_day = func.date(Feedback.created_at, type_=db.Date)
+    ratings = (
+        select(Feedback.provider_id, review_day, func.sum(Feedback.rating), func.count(Feedback.id))
+        .where(Feedback.created_at.is_not(None))
+        .group_by(Feedback.provider_id, review_day)
+    )
+
+    rows = {}
+    for row in conn.execute(bookings):
+        rows[row.provider_id, row.booking_date] = {
+            **{column: getattr(row, column) for column in STATUS_COLUMNS.values()},
+            'revenue': row.revenue or 0.0,
+        }
+    for provider_id, day, rating_sum, rating_count in conn.execute(ratings):
+        rows.setdefault((provider_id, day), {}).update(rating_sum=rating_sum, rating_count=rating_count)
+    return rows
+
+
+def _values(counters):
+    return tuple(round(counters.get(name) or 0, 6) for name in COUNTERS)
+
+
+def rebuild_rollups(conn):
+    """
+    Recompute provider_daily_stats from bookings and feedback, in the
+    transaction of `conn`. Returns (rows written, rows that were missing,
+    stale or extra).
+    """
+    table = ProviderDailyStats.__table__
+    if conn.dialect.name == 'postgresql':
+        # A transition committing meanwhile waits on its upsert, then lands on the rebuilt rows
+        conn.exec_driver_sql('LOCK TABLE provider_daily_stats IN EXCLUSIVE MODE')
+    # On SQLite the DELETE takes the write lock first, which has the same effect
+    old = {
+        (row.provider_id, row.day): _values(row._asdict())
+        for row in conn.execute(table.delete().returning(table.c.provider_id, table.c.day,
+                                                         *(table.c[name] for name in COUNTERS)))
+    }
+    rows = _computed_rows(conn)
+    if rows:
+        conn.execute(table.insert(), [
+            {'provider_id': provider_id, 'day': day, **{name: counters.get(name) or 0 for name in COUNTERS}}
+            for (provider_id, day), counters in rows.items()
+        ])
+    changed = sum(1 for key in old.keys() | rows.keys()
+                  if key not in old or key not in rows or old[key] != _values(rows[key]))
+    return len(rows), changed
@@ -0,0 +1,168 @@
+"""
+Full-text provider search backed by an SQLite FTS5 table.
+
+provider_search holds one row per provider (rowid = provider.id) with the
+searchable text. It is written in the same transaction as the provider row
+(signup / profile update), so it never drifts; `flask rebuild-search-index`
+repopulates it from scratch. On other databases search falls back to a
+plain prefix LIKE.
+"""
+import re
+
+from sqlalchemy import or_
+
+from .extensions import db
+from .models import Provider, Service
+
+SEARCH_TABLE = 'provider_search'
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE = 10
+
+# bm25 column weights: name, business_name, service, location
+_WEIGHTS = '2.0, 3.0, 1.5, 1.0'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index():
+    """Create the FTS table if needed; fills it when it was just created."""
+    if not _is_sqlite():
+        return
+    with db.engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (SEARCH_TABLE,)
+        ).first()
+        if exists:
+            return
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "name, business_name, service, location, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+    rebuild_search_index()
+
+
+def _document(provider, service_name):
+    return {
+        'id': provider.id,
+        'name': f'{provider.first_name} {provider.last_name}',
+        'business_name': provider.business_name or '',
+        'service': service_name or '',
+        'location': provider.location or '',
+    }
+
+
+def index_provider(provider):
+    """
+    (Re)index one provider in the current transaction. The provider must
+    have an id, so call it after a flush for new rows.
+    """
+    if not _is_sqlite():
+        return
+    service = db.session.get(Service, int(provider.service_id)) if provider.service_id else None
+    doc = _document(provider, service.name if service else '')
+    db.session.execute(db.text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {'id': doc['id']})
+    db.session.execute(
+        db.text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, business_name, service, location) "
+            "VALUES (:id, :name, :business_name, :service, :location)"
+        ),
+        doc,
+    )
+
+
+def index_new_providers(providers, services):
+    """
+    Index a batch of just-inserted providers (anything with the provider
+    columns as attributes) in one executemany; services is {id: name}.
+    """
+    if not _is_sqlite() or not providers:
+        return
+    db.session.execute(
+        db.text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, business_name, service, location) "
+            "VALUES (:id, :name, :business_name, :service, :location)"
+        ),
+        [_document(provider, services.get(provider.service_id)) for provider in providers],
+    )
+
+
+def rebuild_search_index(batch_size=1000):
+    """Repopulate the FTS table from the provider table. Returns rows indexed."""
+    if not _is_sqlite():
+        return 0
+    services = dict(db.session.query(Service.id, Service.name))
+    db.session.execute(db.text(f"DELETE FROM {SEARCH_TABLE}"))
+    insert = db.text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, business_name, service, location) "
+        "VALUES (:id, :name, :business_name, :service, :location)"
+    )
+    count = 0
+    batch = []
+    for provider in Provider.query.order_by(Provider.id).yield_per(batch_size):
+        batch.append(_document(provider, services.get(provider.service_id)))
+        if len(batch) >= batch_size:
+            db.session.execute(insert, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+        count += len(batch)
+    db.session.execute(db.text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+    return count
+
+
+def fts_query(text):
+    """
+    Turn free text into a safe FTS5 MATCH expression: every word is quoted
+    (so user input can't inject FTS syntax) and prefix-matched for typeahead.
+    """
+    tokens = _TOKEN.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens[:8])
+
+
+def search_provider_ids(text, service_id=None, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    Ranked provider ids matching `text`, best first. Returns
+    (ids, has_next). Pages are capped at MAX_SEARCH_PAGE since
+    relevance-ranked results past that are rarely useful.
+    """
+    page = max(1, min(page, MAX_SEARCH_PAGE))
+    match = fts_query(text)
+    if not match:
+        return [], False
+    offset = (page - 1) * per_page
+
+    if _is_sqlite():
+        sql = (
+            f"SELECT s.rowid FROM {SEARCH_TABLE} s "
+            + ("JOIN provider p ON p.id = s.rowid " if service_id else "")
+            + f"WHERE {SEARCH_TABLE} MATCH :match "
+            + ("AND p.service_id = :service_id " if service_id else "")
+            + f"ORDER BY bm25({SEARCH_TABLE}, {_WEIGHTS}), s.rowid LIMIT :limit OFFSET :offset"
+        )
+        rows = db.session.execute(
+            db.text(sql),
+            {'match': match, 'service_id': service_id, 'limit': per_page + 1, 'offset': offset},
+        )
+        ids = [row[0] for row in rows]
+    else:
+        query = db.session.query(Provider.id).join(Service)
+        for token in _TOKEN.findall(text)[:8]:
+            pattern = f'{token}%'
+            query = query.filter(or_(
+                Provider.first_name.ilike(pattern), Provider.last_name.ilike(pattern),
+                Provider.business_name.ilike(pattern), Provider.location.ilike(pattern),
+                Service.name.ilike(pattern),
+            ))
+        if service_id:
+            query = query.filter(Provider.service_id == service_id)
+        ids = [pid for (pid,) in query.order_by(Provider.rating.desc(), Provider.id).limit(per_page + 1).offset(offset)]
+
+    has_next = len(ids) > per_page and page < MAX_SEARCH_PAGE
+    return ids[:per_page], has_next
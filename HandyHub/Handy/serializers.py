@@ -0,0 +1,63 @@
+"""
+Compact JSON shapes for the API. Only what a client needs to render a card
+or row; contact details are left to the detail view, and only for signed-in
+users.
+"""
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def row_version(row):
+    """updated_at for rows written since it existed, created_at otherwise."""
+    return getattr(row, 'updated_at', None) or row.created_at
+
+
+def provider_summary(provider):
+    return {
+        'id': provider.id,
+        'name': f'{provider.first_name} {provider.last_name}',
+        'business_name': provider.business_name,
+        'service': {'id': provider.service_id, 'name': provider.service.name},
+        'price': provider.service_price,
+        'experience': provider.experience or 0,
+        'rating': provider.average_rating,
+        'rating_count': provider.rating_count,
+        'image': provider.image,
+    }
+
+
+def provider_detail(provider, contact=False):
+    data = provider_summary(provider)
+    data.update({
+        'location': provider.location,
+        'created_at': _iso(provider.created_at),
+    })
+    if contact:
+        data.update({'phone': provider.phone, 'email': provider.email})
+    return data
+
+
+def booking(booking, counterpart=None):
+    """A booking row; `counterpart` is the provider (for customers) or customer (for providers)."""
+    data = {
+        'id': booking.id,
+        'service_id': booking.service_id,
+        'date': booking.booking_date.isoformat(),
+        'time': booking.booking_time.strftime('%H:%M'),
+        'status': booking.status,
+        'created_at': _iso(booking.created_at),
+    }
+    if counterpart == 'provider':
+        data['provider'] = {
+            'id': booking.provider_id,
+            'name': booking.provider.first_name,
+            'business_name': booking.provider.business_name,
+        }
+    elif counterpart == 'customer':
+        data['customer'] = {
+            'id': booking.customer_id,
+            'name': f'{booking.customer.first_name} {booking.customer.last_name}',
+        }
+    return data
@@ -0,0 +1,153 @@
+"""
+Server-side sessions.
+
+With SESSION_TYPE = "filesystem" (the default) the session cookie only
+carries a signed random id; the data lives in one small file per session
+under SESSION_FILE_DIR (instance/sessions). Files are written only when the
+session changes, so most requests just read one file. SESSION_TYPE=cookie
+goes back to Flask's signed-cookie sessions.
+
+Every gunicorn worker on the host reads the same directory; with several
+hosts, point SESSION_FILE_DIR at shared storage or use sticky sessions.
+
+The id is replaced whenever the logged-in account changes (login, logout),
+so an id planted before login is worthless afterwards. Files untouched for
+PERMANENT_SESSION_LIFETIME are dropped by `flask prune-sessions`.
+"""
+import os
+import secrets
+import tempfile
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+TOUCH_EVERY = 24 * 3600  # Seconds between mtime refreshes of a session that's only read
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.loaded_user = self.get('_user_id')
+
+
+class FileSystemSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()  # Same as Flask's cookies: keeps tuples, datetimes, Markup
+    salt = 'handyhub-session'
+
+    def __init__(self, directory, lifetime):
+        self.directory = directory
+        self.lifetime = lifetime
+        os.makedirs(directory, exist_ok=True)
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def _read(self, sid):
+        path = self._path(sid)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.lifetime:
+                return None
+            with open(path, encoding='utf-8') as f:
+                data = self.serializer.loads(f.read())
+            if age > TOUCH_EVERY:
+                os.utime(path)  # Still in use; keep prune-sessions away from it
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, sid, session):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self.serializer.dumps(dict(session)))
+        os.replace(tmp_path, self._path(sid))
+
+    def _remove(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self._read(sid) if sid else None
+            if data is not None:
+                return ServerSession(data, sid)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if not session:
+            if session.sid is not None and session.modified:  # Emptied
+                self._remove(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        if session.sid is not None and session.get('_user_id') != session.loaded_user:
+            # Logged in or out: carry the data over to a fresh id
+            self._remove(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            session.modified = True
+
+        if not self.should_set_cookie(app, session):
+            return
+        self._write(session.sid, session)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add('Cookie')
+
+    def prune(self):
+        """Delete session files older than the lifetime. Returns how many."""
+        cutoff = time.time() - self.lifetime
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass  # Another worker got there first
+        return removed
+
+
+def init_sessions(app):
+    app.config.setdefault('SESSION_FILE_DIR', os.environ.get(
+        'SESSION_FILE_DIR', os.path.join(app.instance_path, 'sessions')))
+    if app.config['SESSION_TYPE'] == 'filesystem':
+        app.session_interface = FileSystemSessionInterface(
+            app.config['SESSION_FILE_DIR'], app.permanent_session_lifetime.total_seconds())
@@ -0,0 +1,70 @@
+"""
+Background tasks run by `flask jobs-worker`. Enqueue with jobs.enqueue(name, ...).
+"""
+import os
+from datetime import datetime
+
+from flask import current_app
+
+from .extensions import db
+from .identity import invalidate_provider
+from .jobs import task
+from .models import Provider
+
+
+@task('rebuild-ratings')
+def rebuild_ratings():
+    from .ratings import rebuild_provider_ratings
+    rebuild_provider_ratings()
+
+
+@task('rebuild-search-index')
+def rebuild_search_index():
+    from .search import ensure_search_index, rebuild_search_index
+    ensure_search_index()
+    rebuild_search_index()
+
+
+@task('geocode-backfill')
+def geocode_backfill():
+    from .geo import backfill_coordinates
+    backfill_coordinates()
+
+
+@task('backfill-reservations')
+def backfill_reservations():
+    from .availability import backfill_reservations
+    backfill_reservations()
+
+
+@task('rebuild-recommender')
+def rebuild_recommender():
+    """Rebuild the rating model and save the snapshot web workers start from."""
+    from ..recommendation.recommendation_engine import write_snapshot
+    write_snapshot()
+
+
+@task('process-image')
+def process_image(filename, replaced=None, folder=None):
+    """Render thumbnails for a new profile picture and drop the one it replaced."""
+    from .images import make_variants, remove_image, PROVIDER_UPLOADS
+
+    folder = folder or PROVIDER_UPLOADS
+    if os.path.exists(os.path.join(current_app.root_path, folder, filename)) and make_variants(filename, folder):
+        # New row version, so cached directory cards pick up the thumbnail
+        provider_ids = [provider_id for (provider_id,) in db.session.query(Provider.id)
+                        .filter(Provider.image == filename)]
+        Provider.query.filter(Provider.id.in_(provider_ids)).update(
+            {Provider.updated_at: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        for provider_id in provider_ids:
+            invalidate_provider(provider_id)
+    if replaced and replaced != filename:
+        remove_image(replaced, folder)
+
+
+@task('backfill-thumbnails')
+def backfill_thumbnails():
+    """Thumbnails for pictures uploaded before the image pipeline existed."""
+    from .images import backfill_variants
+    backfill_variants()
@@ -0,0 +1,47 @@
+"""
+Helpers for tests that need to keep an eye on database round-trips.
+
+    with assert_max_queries(4):
+        client.get('/booking-history')
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from .extensions import db
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Record every SQL statement executed on the engine inside the block."""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_max_queries(max_count, engine=None):
+    """Fail if the block runs more than max_count SQL statements."""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > max_count:
+        listing = '\n'.join(f'  {i + 1}. {sql}' for i, sql in enumerate(counter.statements))
+        raise AssertionError(
+            f'Expected at most {max_count} queries, got {counter.count}:\n{listing}'
+        )
@@ -1,128 +1,121 @@
 from datetime import datetime
-from flask import Blueprint, render_template, request, flash, jsonify, redirect, url_for
+from flask import Blueprint, render_template, request, flash, jsonify, redirect, url_for, abort, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-import os
+from sqlalchemy.exc import IntegrityError
 import json
-import uuid
+import logging
 
-from sqlalchemy.sql import func
-from ..recommendation.recommendation_engine import get_recommendations, get_top_rated_providers
+from ..recommendation.recommendation_engine import (
+    get_recommendations, get_top_rated_providers, get_cache, notify_feedback, notify_provider_changed,
+)
 from .extensions import db
-
-from .models import Provider, Service, User, Booking, Feedback
+from .ratings import record_rating
+from .rollups import change_status, record_feedback, provider_dashboard, DASHBOARD_DAYS
+from . import queries
+from .pagination import InvalidCursor, Page
+from .search import index_provider
+from . import geo
+from .geo import set_coordinates
+from .jobs import enqueue
+from .images import allowed_file, store_upload, InvalidImage
+from .fragments import cached_page, get_fragment_cache
+from .identity import invalidate_account, invalidate_provider
+from .ratelimit import client_ip, throttle, too_many_attempts
+from .availability import book_slot, release_slot, SlotUnavailable, weekly_schedule, DEFAULT_SLOT_MINUTES
+
+from .models import Provider, User, Booking, Feedback, ProviderAvailability, ProviderBlackout
 
 views = Blueprint('views', __name__)
-
-UPLOAD_FOLDER = 'static/uploads/providers'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+logger = logging.getLogger(__name__)
 
 @views.route('/')
+@cached_page
 def home():
     return render_template("index.html")
 
 @views.route('/about')
+@cached_page
 def about():
     return render_template("about.html")
 
 @views.route('/services', endpoint='services')
+@cached_page
 def services_route():
     return render_template("services.html")
 
 
-# ➡️ Helper function to calculate average ratings
-def add_average_ratings(providers):
-    for provider in providers:
-        feedbacks = Feedback.query.filter_by(provider_id=provider.id).all()
-        if feedbacks:
-            average_rating = sum([f.rating for f in feedbacks]) / len(feedbacks)
-            provider.average_rating = round(average_rating, 2)  # rounded to 2 decimal places
-        else:
-            provider.average_rating = 0
-    return providers
-
 @views.route('/handyman')
 @login_required
 def handyman():
     selected_service = request.args.get('serviceCategory')  # ❌ remove the 1 here
+    sort = request.args.get('sort', 'rating')
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    cursor = request.args.get('cursor')
 
     # Fetch all services for dropdown
-    services = Service.query.all()
+    services = queries.all_services()
 
     recommended_providers = []
-    providers = []
-
-    if selected_service:
-        # If user selected a service, show filtered providers
-        providers = Provider.query.filter_by(service_id=selected_service).all()
-        providers = add_average_ratings(providers)
 
+    # Customers with a geocoded address can sort by distance
+    origin = None
+    if getattr(current_user, 'latitude', None) is not None:
+        origin = (current_user.latitude, current_user.longitude)
+
+    if sort == 'distance' and origin:
+        # Pages go outwards by (distance, id); within a page rating is blended in
+        try:
+            nearest = geo.nearest_page(*origin, selected_service, min_price, max_price, cursor,
+                                       per_page=queries.DIRECTORY_PAGE_SIZE)
+        except InvalidCursor:
+            abort(400)
+        providers = []
+        for provider, distance in geo.rank_by_distance_and_rating(nearest.items):
+            provider.distance_km = distance
+            providers.append(provider)
+        providers = Page(providers, nearest.next_cursor)
+    else:
+        if sort == 'distance':
+            flash("Add your address to your profile to sort by distance.", "warning")
+            sort = 'rating'
+        try:
+            providers = queries.directory_page(selected_service, sort, min_price, max_price, cursor)
+        except InvalidCursor:
+            abort(400)
+
+    if selected_service and not cursor:
+        # Recommendations only on the first page of a selected service
         if current_user.is_authenticated:
             recommended_provider_ids = get_recommendations(current_user.id, selected_service)
-            recommended_providers = Provider.query.filter(Provider.id.in_(recommended_provider_ids)).all()
-            recommended_providers = add_average_ratings(recommended_providers)
+            recommended_providers = queries.providers_by_ids(recommended_provider_ids)
 
         if not recommended_providers:
-            recommended_providers = get_top_rated_providers(selected_service)
-            recommended_providers = add_average_ratings(recommended_providers)
-    else:
-        # When no service selected → show all providers
-        providers = Provider.query.all()
-        providers = add_average_ratings(providers)
-        recommended_providers = []  # ❌ no recommendations if no service selected
+            recommended_providers = queries.providers_by_ids(get_top_rated_providers(selected_service, top_n=4))
+
+        if origin:
+            recommended_providers = geo.rerank_recommendations(recommended_providers, *origin)
 
     return render_template(
         'handyman.html',
         services=services,
         providers=providers,
         recommended_providers=recommended_providers,
-        selected_service=selected_service
+        selected_service=selected_service,
+        sort=sort,
+        min_price=min_price,
+        max_price=max_price,
     )
 
 
-def get_top_rated_providers(service_id):
-    results = (
-        db.session.query(
-            Provider,
-            func.avg(Feedback.rating).label('avg_rating'),
-            func.count(Feedback.id).label('rating_count')
-        )
-        .join(Feedback, Feedback.provider_id == Provider.id)
-        .filter(Provider.service_id == service_id)
-        .group_by(Provider.id)
-        .order_by(func.avg(Feedback.rating).desc())
-        .limit(4)
-        .all()
-    )
-
-    # Prepare a list of providers with extra fields
-    providers = []
-    for provider, avg_rating, rating_count in results:
-        provider.avg_rating = round(avg_rating, 2) if avg_rating else 0
-        provider.rating_count = rating_count or 0
-        providers.append(provider)
-    return providers
-
-
-# Ensure correct path to static folder
-# Ensure correct path to static folder
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))  # Get project root
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads', 'providers')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-# Ensure the upload folder exists
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 @views.route('/profile-provider', methods=['GET', 'POST'])
 @login_required
 def provider_profile():
     provider = Provider.query.filter_by(id=current_user.id).first()
 
     if request.method == 'POST':
+        old_service_id = provider.service_id
         provider.first_name = request.form.get('first_name')
         provider.last_name = request.form.get('last_name')
         provider.business_name = request.form.get('business_name')
@@ -130,36 +123,112 @@ def provider_profile():
         provider.service_price = request.form.get('service_price')
         provider.experience = request.form.get('experience')
         provider.location = request.form.get('location')
+        set_coordinates(provider, provider.location)
 
         # Handle image upload
         if 'image' in request.files and request.files['image'].filename != '':
             file = request.files['image']
             if file and allowed_file(file.filename):
-                # Generate a unique filename
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{uuid.uuid4().hex}.{ext}"  # Unique filename
-                
-                # Delete old image if it exists
-                if provider.image:
-                    old_image_path = os.path.join(UPLOAD_FOLDER, provider.image)
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
-
-                # Save the new file
-                file_path = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(file_path)
-                
-                # Store only the filename in DB
-                provider.image = filename  
-
+                # Streamed to disk under its content hash, so identical uploads share a file
+                try:
+                    filename = store_upload(file)
+                except InvalidImage:
+                    db.session.rollback()
+                    flash('That picture is too large or not a supported image.', 'danger')
+                    return redirect(url_for('views.provider_profile'))
+                if filename != provider.image:
+                    # Thumbnails, and removing the old picture, happen in a background job after this commit
+                    enqueue('process-image', filename=filename, replaced=provider.image)
+                    provider.image = filename  # Store only the filename in DB
+
+        index_provider(provider)  # Keep the search index in the same transaction
         db.session.commit()
+        invalidate_account(provider)
+        notify_provider_changed(old_service_id, int(provider.service_id))
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('views.provider_profile'))
 
-    services = Service.query.all()  # Get all services for dropdown
+    services = queries.all_services()  # For the dropdown
     return render_template('provider_profile.html', provider=provider, services=services)
 
 
+@views.route('/recommendations/cache-stats')
+@login_required
+def recommendation_cache_stats():
+    return jsonify(get_cache().stats())
+
+
+@views.route('/page-cache/stats')
+@login_required
+def page_cache_stats():
+    return jsonify(get_fragment_cache().stats())
+
+
+@views.route('/availability', methods=['GET', 'POST'])
+@login_required
+def provider_availability():
+    if not isinstance(current_user, Provider):
+        flash("Only providers can manage availability.", "danger")
+        return redirect(url_for('views.home'))
+
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'hours':
+            ProviderAvailability.query.filter_by(provider_id=current_user.id).delete()
+            for weekday in range(7):
+                if not request.form.get(f'enabled_{weekday}'):
+                    continue
+                try:
+                    start = datetime.strptime(request.form.get(f'start_{weekday}', ''), "%H:%M").time()
+                    end = datetime.strptime(request.form.get(f'end_{weekday}', ''), "%H:%M").time()
+                    slot_minutes = int(request.form.get(f'slot_{weekday}', DEFAULT_SLOT_MINUTES))
+                except ValueError:
+                    db.session.rollback()
+                    flash("Please enter valid working hours.", "danger")
+                    return redirect(url_for('views.provider_availability'))
+                if start >= end or slot_minutes < 15:
+                    db.session.rollback()
+                    flash("Working hours must end after they start, with slots of at least 15 minutes.", "danger")
+                    return redirect(url_for('views.provider_availability'))
+                db.session.add(ProviderAvailability(
+                    provider_id=current_user.id, weekday=weekday,
+                    start_time=start, end_time=end, slot_minutes=slot_minutes,
+                ))
+            current_user.hours_configured = True
+            db.session.commit()
+            flash("Working hours updated.", "success")
+        elif action == 'add_blackout':
+            try:
+                day = datetime.strptime(request.form.get('blackout_date', ''), "%Y-%m-%d").date()
+            except ValueError:
+                flash("Please pick a valid date.", "danger")
+                return redirect(url_for('views.provider_availability'))
+            if not ProviderBlackout.query.filter_by(provider_id=current_user.id, date=day).first():
+                db.session.add(ProviderBlackout(provider_id=current_user.id, date=day, reason=request.form.get('reason')))
+                db.session.commit()
+            flash("Day off added.", "success")
+        elif action == 'remove_blackout':
+            ProviderBlackout.query.filter_by(
+                provider_id=current_user.id, id=request.form.get('blackout_id', type=int)
+            ).delete()
+            db.session.commit()
+            flash("Day off removed.", "success")
+        return redirect(url_for('views.provider_availability'))
+
+    blackouts = (
+        ProviderBlackout.query
+        .filter(ProviderBlackout.provider_id == current_user.id, ProviderBlackout.date >= datetime.now().date())
+        .order_by(ProviderBlackout.date)
+        .all()
+    )
+    return render_template(
+        'provider_availability.html',
+        schedule=weekly_schedule(current_user.id),
+        blackouts=blackouts,
+        weekdays=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+    )
+
+
 @views.route('/submit_feedback', methods=['GET', 'POST'])
 @login_required
 def submit_feedback():
@@ -175,11 +244,15 @@ def submit_feedback():
         flash("Booking not found!", "danger")
         return redirect(url_for("views.booking_history"))
 
+    if Feedback.query.filter_by(booking_id=booking.id).first():
+        flash("You have already reviewed this booking.", "info")
+        return redirect(url_for("views.booking_history"))
+
     if request.method == 'POST':
-        rating = request.form.get('rating')
+        rating = request.form.get('rating', type=int)
         comment = request.form.get('comment')
 
-        if not rating:
+        if rating is None or not 1 <= rating <= 5:
             flash("Rating is required!", "danger")
             return redirect(url_for("views.submit_feedback", booking_id=booking_id))
 
@@ -193,7 +266,21 @@ def submit_feedback():
         )
 
         db.session.add(feedback)
-        db.session.commit()
+        record_rating(booking.provider_id, rating)  # Same transaction as the feedback insert
+        db.session.flush()
+        record_feedback(feedback)  # Dashboard rollup, same transaction again
+        if feedback.id % current_app.config['RECOMMENDER_SNAPSHOT_EVERY'] == 0:
+            # Refresh the snapshot new workers start from, off the request path
+            enqueue('rebuild-recommender', unique_key='rebuild-recommender')
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A second submit raced us past the check above; uq_feedback_booking kept one
+            db.session.rollback()
+            flash("You have already reviewed this booking.", "info")
+            return redirect(url_for("views.booking_history"))
+        invalidate_provider(booking.provider_id)  # Their rating changed
+        notify_feedback(feedback, booking.service_id)  # Update the recommender and drop stale cached results
 
         flash("Feedback submitted successfully!", "success")
         return redirect(url_for("views.booking_history"))
@@ -212,29 +299,26 @@ def customer_profile():
         current_user.email = request.form.get('email')
         current_user.phone = request.form.get('phone')
         current_user.address = request.form.get('address')
+        set_coordinates(current_user, current_user.address)
 
         # Handle Profile Picture Upload
         if 'image' in request.files and request.files['image'].filename != '':
             file = request.files['image']
             if file and allowed_file(file.filename):
-                # Generate a unique filename
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{uuid.uuid4().hex}.{ext}"  # Unique filename
-                
-                # Delete old image if it exists
-                if current_user.image and current_user.image != "default.png":
-                    old_image_path = os.path.join(UPLOAD_FOLDER, current_user.image)
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
-
-                # Save the new file
-                file_path = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(file_path)
-
-                # Store only the filename in DB
-                current_user.image = filename
+                # Streamed to disk under its content hash, so identical uploads share a file
+                try:
+                    filename = store_upload(file)
+                except InvalidImage:
+                    db.session.rollback()
+                    flash('That picture is too large or not a supported image.', 'danger')
+                    return redirect(url_for('views.customer_profile'))
+                if filename != current_user.image:
+                    # Thumbnails, and removing the old picture, happen in a background job after this commit
+                    enqueue('process-image', filename=filename, replaced=current_user.image)
+                    current_user.image = filename  # Store only the filename in DB
 
         db.session.commit()
+        invalidate_account(current_user)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('views.customer_profile'))  # Fix function reference
 
@@ -243,7 +327,7 @@ def customer_profile():
 @views.route('/provider/<int:provider_id>', methods=['GET'])
 @login_required
 def provider_details(provider_id):
-    provider = Provider.query.get_or_404(provider_id)
+    provider = queries.provider_with_service(provider_id)
     return render_template('provider_details.html', provider=provider)
 
 @views.route('/book/<int:provider_id>', methods=['GET','POST'])
@@ -257,20 +341,20 @@ def book_provider(provider_id):
         flash("Please select both date and time.", "danger")
         return redirect(url_for('views.provider_details', provider_id=provider.id))
 
-    # Save to database
-    new_booking = Booking(
-        customer_id=current_user.id,
-        provider_id=provider.id,
-        service_id=provider.service_id,
-        booking_date=datetime.strptime(booking_date, "%Y-%m-%d"),
-        booking_time=datetime.strptime(booking_time, "%H:%M").time(),
-        status="Pending"
-    )
+    try:
+        booking_date = datetime.strptime(booking_date, "%Y-%m-%d").date()
+        booking_time = datetime.strptime(booking_time, "%H:%M").time()
+    except ValueError:
+        flash("Please select a valid date and time.", "danger")
+        return redirect(url_for('views.provider_details', provider_id=provider.id))
 
-    db.session.add(new_booking)
-    db.session.commit()
-    print("Booking successful! Your request is pending confirmation.")
-    
+    # Creates the booking and reserves the slot atomically
+    try:
+        book_slot(current_user.id, provider, booking_date, booking_time)
+    except SlotUnavailable as exc:
+        flash(str(exc), "danger")
+        return redirect(url_for('views.provider_details', provider_id=provider.id))
+    logger.info('customer %s booked provider %s for %s %s', current_user.id, provider.id, booking_date, booking_time)
     flash("Booking successful! Your request is pending confirmation.", "success")
     return redirect(url_for('views.booking_history'))
 
@@ -278,10 +362,11 @@ def book_provider(provider_id):
 @views.route('/booking-history')
 @login_required
 def booking_history():
-    bookings = Booking.query.filter_by(customer_id=current_user.id).order_by(Booking.created_at.desc()).all()
-    
-    # Create a dictionary to store feedback status for each booking
-    feedback_status = {booking.id: Feedback.query.filter_by(booking_id=booking.id).first() is not None for booking in bookings}
+    # Bookings with their provider and feedback status come back in one query
+    try:
+        bookings, feedback_status = queries.customer_bookings(current_user.id, request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
 
     return render_template('booking_history.html', bookings=bookings, feedback_status=feedback_status)
 
@@ -294,8 +379,9 @@ def cancel_booking(booking_id):
         flash('Unauthorized access!', 'danger')
         return redirect(url_for('booking_history'))
 
-    if booking.status == 'Pending':
-        booking.status = 'Cancelled'
+    # Only if still Pending when the UPDATE runs, so the rollups count it once
+    if change_status(booking, 'Pending', 'Cancelled'):
+        release_slot(booking)
         db.session.commit()
         flash('Booking has been cancelled successfully.', 'success')
     else:
@@ -307,12 +393,26 @@ def cancel_booking(booking_id):
 @views.route('/provider-bookings')
 @login_required
 def provider_bookings():
+    try:
+        bookings = queries.provider_bookings(current_user.id, request.args.get('cursor'))
+    except InvalidCursor:
+        abort(400)
 
-    bookings = Booking.query.filter_by(provider_id=current_user.id).order_by(Booking.created_at.desc()).all()
-    
     return render_template('provider_bookings.html', bookings=bookings)
 
 
+@views.route('/provider-dashboard', endpoint='provider_dashboard')
+@login_required
+def provider_dashboard_route():
+    if not isinstance(current_user, Provider):
+        flash("Only providers have a dashboard.", "danger")
+        return redirect(url_for('views.home'))
+
+    # Rollup rows only (see rollups.py), never the bookings themselves
+    days = min(max(request.args.get('days', DASHBOARD_DAYS, type=int), 1), 366)
+    return render_template('provider_dashboard.html', dashboard=provider_dashboard(current_user.id, days), days=days)
+
+
 @views.route('/confirm-booking/<int:booking_id>', methods=['POST'])
 @login_required
 def confirm_booking(booking_id):
@@ -323,8 +423,7 @@ def confirm_booking(booking_id):
         flash("Unauthorized access!", "danger")
         return redirect(url_for('views.provider_bookings'))
 
-    if booking.status == "Pending":
-        booking.status = "Confirmed"
+    if change_status(booking, "Pending", "Confirmed"):
         db.session.commit()
         flash("Booking confirmed successfully!", "success")
     else:
@@ -343,8 +442,8 @@ def reject_booking(booking_id):
         flash("Unauthorized access!", "danger")
         return redirect(url_for('views.provider_bookings'))
 
-    if booking.status == "Pending":
-        booking.status = "Rejected"
+    if change_status(booking, "Pending", "Rejected"):
+        release_slot(booking)
         db.session.commit()
         flash("Booking rejected successfully!", "success")
     else:
@@ -363,8 +462,7 @@ def complete_booking(booking_id):
         flash("Unauthorized access!", "danger")
         return redirect(url_for('views.provider_bookings'))
 
-    if booking.status == "Confirmed":
-        booking.status = "Completed"
+    if change_status(booking, "Confirmed", "Completed"):
         db.session.commit()
         flash("Booking marked as completed!", "success")
     else:
@@ -402,11 +500,16 @@ def customer_forget_password():
         email = request.form.get('email')
         new_password = request.form.get('new_password')
 
+        wait = throttle(('RATELIMIT_LOGIN_IP', client_ip()), ('RATELIMIT_LOGIN_ACCOUNT', email))
+        if wait:
+            return too_many_attempts('customer-forget-password.html', wait)
+
         user = User.query.filter_by(email=email, role='customer').first()
 
         if user:
             user.set_password(new_password)  # calling your model's set_password function
             db.session.commit()
+            invalidate_account(user)
             flash('Password updated successfully!', 'success')
             return redirect(url_for('auth.customer_login'))  # your login page route
         else:
@@ -421,11 +524,16 @@ def provider_forget_password():
         email = request.form.get('email')
         new_password = request.form.get('new_password')
 
+        wait = throttle(('RATELIMIT_LOGIN_IP', client_ip()), ('RATELIMIT_LOGIN_ACCOUNT', email))
+        if wait:
+            return too_many_attempts('provider-forget-password.html', wait)
+
         provider = Provider.query.filter_by(email=email).first()
 
         if provider:
             provider.set_password(new_password)   # Assuming your Provider model also has set_password method
             db.session.commit()
+            invalidate_account(provider)
             flash('Password updated successfully!', 'success')
             return redirect(url_for('auth.provider_login'))
         else:
@@ -435,10 +543,12 @@ def provider_forget_password():
     return render_template('provider-forget-password.html')
 
 @views.route('/terms_of_service')
+@cached_page
 def terms_of_service():
     return render_template('terms_of_service.html')
 
 @views.route('/privacy_policy')
+@cached_page
 def privacy_policy():
     return render_template('privacy_policy.html')
 
@@ -0,0 +1,55 @@
+"""
+gunicorn settings. Defaults are picked from the CPU count; everything can
+be overridden from the environment:
+
+    PORT                    listen port (default 8000)
+    GUNICORN_WORKER_CLASS   sync / gthread (default gthread on <= 2 CPUs, else sync)
+    WEB_CONCURRENCY         worker processes
+    GUNICORN_THREADS        threads per gthread worker (default 4)
+    GUNICORN_PRELOAD        1/0, load the app once in the master (default 1)
+
+Requests here mostly wait on the database, so on small machines a couple
+of processes with a few threads each beat one sync process per core; on
+bigger ones sync workers avoid contention on the GIL.
+"""
+import multiprocessing
+import os
+
+# main.py imports HandyHub.Handy, so the directory above this one must be importable
+pythonpath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or ('gthread' if cpu_count <= 2 else 'sync')
+if worker_class == 'gthread':
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+else:
+    workers = int(os.environ.get('WEB_CONCURRENCY', 2 * cpu_count + 1))
+
+# Load the app (service catalog, recommendation matrices) once in the master
+# and fork; workers share it copy-on-write. See Handy/prefork.py.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then; with preload they fork from the warm master
+max_requests = 2000
+max_requests_jitter = 200
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'  # Heartbeat file off the (possibly slow) disk
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker forks
+    if preload_app:
+        from HandyHub.Handy.prefork import warm_shared_state
+        warm_shared_state(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from HandyHub.Handy.prefork import after_fork
+        after_fork(worker.app.wsgi())
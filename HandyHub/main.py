@@ -1,8 +1,6 @@
 from HandyHub.Handy import create_app
-from flask import Flask
 
-app = Flask(__name__)
-# your other setup like routes, configs, etc.
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,204 @@
+"""
+Cache for recommendation results keyed by (user, service).
+
+Invalidation is generation based: every entry remembers the generation of
+its service and its user when it was stored, and submitting feedback just
+bumps those two counters. That makes invalidation O(1) and works the same
+for the in-process backend and a shared one (where counters are visible to
+every gunicorn worker). Stale entries are dropped when next read or pushed
+out by LRU.
+"""
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _sizeof(key, value):
+    # Rough footprint: container overhead plus one small int/str per item
+    size = sys.getsizeof(key) + sys.getsizeof(value) + 64
+    if isinstance(value, (list, tuple)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class LocalCacheBackend:
+    """
+    Per-process LRU store with TTL and a cap on entries and bytes.
+
+    Generation counters are capped too (max_counters, least recently bumped
+    dropped first). A dropped counter can't simply restart at 0, or an old
+    entry could match it again after a few bumps. So a missing counter reads
+    as the highest generation ever dropped, and a bump starts from there.
+    Every counter only ever goes up, and dropping one costs at most some
+    extra misses.
+    """
+
+    shared = False
+
+    def __init__(self, max_entries=10000, max_bytes=8 * 1024 * 1024, max_counters=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_counters = max_counters or max_entries
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._counters = OrderedDict()  # key -> generation, least recently bumped first
+        self._counter_floor = 0  # Highest generation dropped so far
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        size = _sizeof(key, value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters.pop(key, self._counter_floor) + 1
+            self._counters[key] = value
+            while len(self._counters) > self.max_counters:
+                _, dropped = self._counters.popitem(last=False)
+                self._counter_floor = max(self._counter_floor, dropped)
+            return value
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, self._counter_floor)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'counters': len(self._counters),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class RedisCacheBackend:
+    """
+    Shared backend so all workers see the same entries and invalidations.
+    Needs the `redis` package; eviction is left to Redis' maxmemory policy.
+    """
+
+    shared = True
+
+    def __init__(self, url, prefix='handyhub:rec:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('A Redis cache URL is set but the redis package is not installed') from exc
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, key):
+        return self._prefix + ':'.join(str(part) for part in key)
+
+    def get(self, key):
+        raw = self._client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self._key(key), json.dumps(value), ex=max(1, int(ttl)))
+
+    def incr(self, key):
+        return self._client.incr(self._key(key))
+
+    def counter(self, key):
+        return int(self._client.get(self._key(key)) or 0)
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+    def stats(self):
+        return {}
+
+
+class RecommendationCache:
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend or LocalCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _generations(self, user_id, service_id):
+        return [
+            self.backend.counter(('gen', 'service', int(service_id))),
+            self.backend.counter(('gen', 'user', user_id)) if user_id is not None else 0,
+        ]
+
+    def get_or_compute(self, kind, user_id, service_id, compute):
+        """
+        Return the cached value for (kind, user_id, service_id) or compute,
+        store and return it. user_id may be None for per-service values.
+        """
+        key = (kind, user_id, int(service_id))
+        generations = self._generations(user_id, service_id)
+        cached = self.backend.get(key)
+        if cached is not None:
+            if list(cached[0]) == generations:
+                self.hits += 1
+                return cached[1]
+            self.stale += 1
+        self.misses += 1
+
+        value = compute()
+        self.backend.set(key, [generations, value], self.ttl)
+        return value
+
+    def invalidate_feedback(self, user_id, service_id):
+        """
+        New feedback from user_id for a provider in service_id. Other users'
+        results in other services can shift slightly through similarity
+        changes too; those are left to the TTL.
+        """
+        self.invalidate_service(service_id)
+        self.backend.incr(('gen', 'user', user_id))
+
+    def invalidate_service(self, service_id):
+        if service_id is not None:
+            self.backend.incr(('gen', 'service', int(service_id)))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            **self.backend.stats(),
+        }
@@ -0,0 +1,346 @@
+import os
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+
+class RatingModel:
+    """
+    Long-lived user x provider rating matrix for collaborative filtering.
+
+    Ratings live in a CSR matrix (plus a CSC copy for column access) with the
+    per-user norms precomputed. New feedback doesn't rebuild anything: it goes
+    into a small pending dict that queries overlay on top of the base matrix,
+    and is folded in (compact()) once it grows past `compact_threshold`.
+
+    A (user, provider) pair rated more than once keeps the mean rating, same
+    as the old pivot_table(...).mean() behaviour.
+
+    Feedback ids are handed out at insert time, so rows can commit out of id
+    order (and on PostgreSQL a rolled-back insert leaves a hole). An id
+    skipped below the newest applied one is kept as a gap, and applied_through
+    stays below it so refreshes look for it again, until gap_timeout seconds
+    have passed.
+    """
+
+    compact_threshold = 1000
+    gap_timeout = 60.0
+    max_gaps = 1000
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._user_rows = {}       # user_id -> row
+        self._provider_cols = {}   # provider_id -> column
+        self._col_providers = []   # column -> provider_id
+        self._base = sparse.csr_matrix((0, 0))
+        self._base_csc = self._base.tocsc()
+        self._base_counts = sparse.csr_matrix((0, 0))
+        self._pending = {}         # (row, col) -> (mean, count), overrides base
+        self._delta = None         # cached (csr, csc) of pending - base
+        self._norms_sq = np.zeros(0)
+        self.last_feedback_id = 0  # Newest feedback applied
+        self._gaps = {}            # Missing feedback id below it -> when it was first missed
+
+    # ------------------------------------------------------------------ build
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (feedback_id, user_id, provider_id, rating) rows."""
+        model = cls()
+        model.load(rows)
+        return model
+
+    def load(self, rows):
+        user_rows, provider_cols, col_providers = {}, {}, []
+        r_idx, c_idx, values = [], [], []
+        last_id = 0
+        for feedback_id, user_id, provider_id, rating in rows:
+            row = user_rows.setdefault(user_id, len(user_rows))
+            col = provider_cols.get(provider_id)
+            if col is None:
+                col = provider_cols[provider_id] = len(col_providers)
+                col_providers.append(provider_id)
+            r_idx.append(row)
+            c_idx.append(col)
+            values.append(float(rating))
+            last_id = max(last_id, feedback_id)
+
+        shape = (len(user_rows), len(col_providers))
+        # COO -> CSR sums duplicates, so sum ratings and counts then divide
+        sums = sparse.csr_matrix((values, (r_idx, c_idx)), shape=shape)
+        counts = sparse.csr_matrix((np.ones(len(values)), (r_idx, c_idx)), shape=shape)
+        sums.sort_indices()
+        counts.sort_indices()
+        means = sums.copy()
+        if counts.nnz:
+            means.data = sums.data / counts.data
+
+        with self._lock:
+            self._user_rows = user_rows
+            self._provider_cols = provider_cols
+            self._col_providers = col_providers
+            self._set_base(means, counts)
+            self.last_feedback_id = last_id
+            self._gaps = {}
+
+    def save(self, path):
+        """Write the model to an .npz file (atomically, via a temp file)."""
+        with self._lock:
+            self.compact()
+            means, counts = self._base, self._base_counts
+            user_ids = np.zeros(len(self._user_rows), dtype=np.int64)
+            for user_id, row in self._user_rows.items():
+                user_ids[row] = user_id
+            arrays = {
+                'means_data': means.data, 'means_indices': means.indices, 'means_indptr': means.indptr,
+                'counts_data': counts.data, 'counts_indices': counts.indices, 'counts_indptr': counts.indptr,
+                'shape': np.array(means.shape, dtype=np.int64),
+                'user_ids': user_ids,
+                'provider_ids': np.array(self._col_providers, dtype=np.int64),
+                'last_feedback_id': np.array(self.last_feedback_id, dtype=np.int64),
+            }
+        tmp = f'{path}.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a model written by save(); apply newer feedback with add_rating."""
+        with np.load(path) as data:
+            shape = tuple(data['shape'])
+            means = sparse.csr_matrix((data['means_data'], data['means_indices'], data['means_indptr']), shape=shape)
+            counts = sparse.csr_matrix((data['counts_data'], data['counts_indices'], data['counts_indptr']), shape=shape)
+            user_ids = data['user_ids'].tolist()
+            provider_ids = data['provider_ids'].tolist()
+            last_feedback_id = int(data['last_feedback_id'])
+        model = cls()
+        with model._lock:
+            model._user_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+            model._provider_cols = {provider_id: col for col, provider_id in enumerate(provider_ids)}
+            model._col_providers = provider_ids
+            model._set_base(means, counts)
+            model.last_feedback_id = last_feedback_id
+        return model
+
+    def _set_base(self, means, counts):
+        self._base = means
+        self._base_csc = means.tocsc()
+        self._base_counts = counts
+        self._pending = {}
+        self._delta = None
+        self._norms_sq = np.asarray(means.multiply(means).sum(axis=1)).ravel()
+
+    # ---------------------------------------------------------------- updates
+
+    @property
+    def applied_through(self):
+        """Every feedback id up to this one is applied (or given up on); refresh from here."""
+        with self._lock:
+            if self._gaps:
+                expired = time.monotonic() - self.gap_timeout
+                self._gaps = {gap: missed_at for gap, missed_at in self._gaps.items() if missed_at > expired}
+            return min(self._gaps) - 1 if self._gaps else self.last_feedback_id
+
+    def add_rating(self, user_id, provider_id, rating, feedback_id=None):
+        with self._lock:
+            if feedback_id is not None:
+                if feedback_id <= self.last_feedback_id:
+                    if self._gaps.pop(feedback_id, None) is None:
+                        return  # Already applied (e.g. by an earlier refresh)
+                elif self.last_feedback_id:
+                    now = time.monotonic()
+                    for missing in range(max(self.last_feedback_id + 1, feedback_id - self.max_gaps), feedback_id):
+                        self._gaps[missing] = now
+            row = self._user_rows.get(user_id)
+            if row is None:
+                row = self._user_rows[user_id] = len(self._user_rows)
+            col = self._provider_cols.get(provider_id)
+            if col is None:
+                col = self._provider_cols[provider_id] = len(self._col_providers)
+                self._col_providers.append(provider_id)
+            self._grow()
+
+            old_mean, old_count = self._entry(row, col)
+            count = old_count + 1
+            mean = (old_mean * old_count + float(rating)) / count
+            self._pending[(row, col)] = (mean, count)
+            self._norms_sq[row] += mean * mean - old_mean * old_mean
+            self._delta = None
+
+            if feedback_id is not None:
+                self.last_feedback_id = max(self.last_feedback_id, feedback_id)
+
+    @property
+    def needs_compaction(self):
+        # Left to the caller so the fold-in can run off the request thread
+        return len(self._pending) >= self.compact_threshold
+
+    def compact(self):
+        """Fold pending updates into the base matrices."""
+        with self._lock:
+            if not self._pending:
+                return
+            delta_csr, _ = self._delta_matrices()
+            keys = list(self._pending.keys())
+            rows = [r for r, _ in keys]
+            cols = [c for _, c in keys]
+            new_counts = np.array([self._pending[k][1] for k in keys], dtype=float)
+            base_counts = np.asarray(self._base_counts[rows, cols]).ravel()
+            count_delta = sparse.csr_matrix(
+                (new_counts - base_counts, (rows, cols)), shape=self._base.shape,
+            )
+            means = (self._base + delta_csr).tocsr()
+            means.eliminate_zeros()
+            counts = (self._base_counts + count_delta).tocsr()
+            counts.eliminate_zeros()
+            means.sort_indices()
+            counts.sort_indices()
+            self._set_base(means, counts)
+
+    def _grow(self):
+        shape = (len(self._user_rows), len(self._col_providers))
+        if shape == self._base.shape:
+            return
+        self._base.resize(shape)
+        self._base_csc.resize(shape)
+        self._base_counts.resize(shape)
+        if len(self._norms_sq) < shape[0]:
+            self._norms_sq = np.concatenate([self._norms_sq, np.zeros(shape[0] - len(self._norms_sq))])
+        self._delta = None
+
+    def _entry(self, row, col):
+        if (row, col) in self._pending:
+            return self._pending[(row, col)]
+        return float(self._base[row, col]), int(self._base_counts[row, col])
+
+    def _delta_matrices(self):
+        if self._delta is None:
+            shape = self._base.shape
+            if self._pending:
+                keys = list(self._pending.keys())
+                rows = [r for r, _ in keys]
+                cols = [c for _, c in keys]
+                base_vals = np.asarray(self._base[rows, cols]).ravel()
+                new_vals = np.array([self._pending[k][0] for k in keys])
+                delta = sparse.csr_matrix((new_vals - base_vals, (rows, cols)), shape=shape)
+            else:
+                delta = sparse.csr_matrix(shape)
+            self._delta = (delta, delta.tocsc())
+        return self._delta
+
+    # ---------------------------------------------------------------- queries
+
+    def has_user(self, user_id):
+        return user_id in self._user_rows
+
+    def user_ratings(self, user_id):
+        """{provider_id: mean rating} for one user."""
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return {}
+            vec = self._row(row)
+            return {self._col_providers[c]: v for c, v in zip(vec.indices, vec.data) if v}
+
+    def _row(self, row):
+        delta_csr, _ = self._delta_matrices()
+        return (self._base[row] + delta_csr[row]).tocsr()
+
+    def user_similarities(self, row, vec=None):
+        """Cosine similarity of one user row against all users (self set to 0)."""
+        delta_csr, delta_csc = self._delta_matrices()
+        vec = self._row(row) if vec is None else vec
+        if not vec.nnz:
+            return np.zeros(self._base.shape[0])
+        cols, vals = vec.indices, vec.data
+        # Only users who rated one of this user's providers get a non-zero dot
+        dots = self._base_csc[:, cols] @ vals + delta_csc[:, cols] @ vals
+        norms = np.sqrt(np.maximum(self._norms_sq, 0))
+        denom = norms * norms[row]
+        sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+        sims[row] = 0.0
+        return sims
+
+    def recommend(self, user_id, candidate_provider_ids, top_n=5):
+        """
+        Rank candidate providers (e.g. the selected service's providers) for
+        user_id by similarity-weighted ratings of other users, skipping
+        providers the user already rated.
+        """
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return []
+            vec = self._row(row)
+            cols = self._candidate_cols(vec, candidate_provider_ids)
+            if not len(cols):
+                return []
+
+            sims = self.user_similarities(row, vec)
+            neighbours = np.flatnonzero(sims)
+            return self._score(neighbours, sims[neighbours], cols, top_n)
+
+    def recommend_from_neighbours(self, user_id, candidate_provider_ids, neighbours, top_n=5):
+        """
+        Same scoring as recommend(), but only over a precomputed list of
+        (user_id, similarity) neighbours instead of every user.
+        """
+        with self._lock:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                return []
+            cols = self._candidate_cols(self._row(row), candidate_provider_ids)
+            pairs = [(self._user_rows[uid], sim) for uid, sim in neighbours if uid in self._user_rows]
+            if not len(cols) or not pairs:
+                return []
+            rows = np.array([r for r, _ in pairs], dtype=np.int64)
+            sims = np.array([s for _, s in pairs], dtype=np.float64)
+            return self._score(rows, sims, cols, top_n)
+
+    def recommend_by_items(self, user_id, candidate_provider_ids, provider_index, top_n=5):
+        """
+        Item-item scoring: each candidate gets the similarity-weighted sum of
+        the user's ratings of its top-K neighbouring providers.
+        """
+        ratings = self.user_ratings(user_id)
+        candidates = set(candidate_provider_ids) - set(ratings)
+        scores = {}
+        for provider_id, rating in ratings.items():
+            for other_id, sim in provider_index.lookup(provider_id):
+                if other_id in candidates:
+                    scores[other_id] = scores.get(other_id, 0.0) + sim * rating
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [provider_id for provider_id, _ in ranked[:top_n]]
+
+    def snapshot(self):
+        """
+        Consistent copy of the current ratings for offline work such as
+        building neighbour indexes: (csr matrix, user id per row,
+        provider id per column, last_feedback_id).
+        """
+        with self._lock:
+            delta_csr, _ = self._delta_matrices()
+            matrix = (self._base + delta_csr).tocsr()
+            user_ids = np.zeros(len(self._user_rows), dtype=np.int64)
+            for user_id, row in self._user_rows.items():
+                user_ids[row] = user_id
+            return matrix, user_ids, np.array(self._col_providers, dtype=np.int64), self.last_feedback_id
+
+    def _candidate_cols(self, vec, candidate_provider_ids):
+        rated = set(vec.indices[vec.data != 0].tolist())
+        return np.array(
+            [c for c in (self._provider_cols.get(pid) for pid in candidate_provider_ids)
+             if c is not None and c not in rated],
+            dtype=np.int64,
+        )
+
+    def _score(self, rows, sims, cols, top_n):
+        if not len(rows):
+            return []
+        delta_csr, _ = self._delta_matrices()
+        block = self._base[rows][:, cols] + delta_csr[rows][:, cols]
+        scores = block.T @ sims
+        order = np.argsort(-scores, kind='stable')
+        return [self._col_providers[cols[i]] for i in order[:top_n] if scores[i] > 0]
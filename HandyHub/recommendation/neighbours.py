@@ -0,0 +1,75 @@
+import numpy as np
+from scipy import sparse
+
+
+def top_k_neighbours(matrix, k, block_elements=4_000_000):
+    """
+    For every row of a sparse matrix, the k other rows with the highest cosine
+    similarity.
+
+    Similarities are computed one block of rows at a time (block size chosen
+    so a dense block stays around `block_elements` floats) and reduced with
+    argpartition, so memory stays O(n * k) instead of O(n^2).
+
+    Returns (neighbours, scores), both shaped (n, k) and sorted best first.
+    Rows with fewer than k similar rows are padded with score 0.
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+    n = matrix.shape[0]
+    k = min(k, max(n - 1, 0))
+    neighbours = np.zeros((n, k), dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normed = sparse.diags(inv_norms) @ matrix
+    normed_t = normed.T.tocsr()
+
+    block = max(1, block_elements // n)
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        sims = (normed[start:stop] @ normed_t).toarray()
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # not your own neighbour
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbours[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.maximum(np.take_along_axis(top_scores, order, axis=1), 0)
+
+    return neighbours, scores
+
+
+class NeighbourIndex:
+    """Precomputed top-K similar ids for each id (users or providers)."""
+
+    def __init__(self, ids, neighbours, scores, built_at_feedback_id=0):
+        self.ids = np.asarray(ids)
+        self.positions = {int(item_id): pos for pos, item_id in enumerate(self.ids)}
+        self.neighbours = neighbours
+        self.scores = scores
+        self.built_at_feedback_id = built_at_feedback_id
+
+    @classmethod
+    def build(cls, matrix, ids, k, built_at_feedback_id=0):
+        neighbours, scores = top_k_neighbours(matrix, k)
+        return cls(ids, neighbours, scores, built_at_feedback_id)
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def __contains__(self, item_id):
+        return item_id in self.positions
+
+    def lookup(self, item_id):
+        """[(neighbour_id, similarity), ...] best first, zero similarities dropped."""
+        pos = self.positions.get(item_id)
+        if pos is None:
+            return []
+        return [
+            (int(self.ids[n]), float(s))
+            for n, s in zip(self.neighbours[pos], self.scores[pos]) if s > 0
+        ]
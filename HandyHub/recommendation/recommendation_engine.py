@@ -1,82 +1,322 @@
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+import random
+import threading
+import time
+
+from flask import current_app
+
 from HandyHub.Handy import db
-from HandyHub.Handy.models import Provider, Feedback
+from HandyHub.Handy.metrics import RECOMMENDER
+from HandyHub.Handy.models import Provider, Feedback, Service
+from HandyHub.recommendation.cache import RecommendationCache, LocalCacheBackend, RedisCacheBackend
 
-def get_recommendations(user_id, selected_service_id, top_n=5):
+# model.py / neighbours.py pull in numpy and scipy; they're imported on first
+# use so a worker that never serves a recommendation doesn't pay for them
+
+# One model per process, built on first use and then kept up to date
+_model = None
+_model_lock = threading.Lock()
+
+# (user_index, provider_index), swapped in whole by build_indexes
+_indexes = None
+_index_lock = threading.Lock()
+_index_thread = None
+
+_compact_thread = None
+
+_cache = None
+
+
+def _feedback_rows(after_id=0):
+    return (
+        db.session.query(Feedback.id, Feedback.user_id, Feedback.provider_id, Feedback.rating)
+        .filter(Feedback.id > after_id)
+        .order_by(Feedback.id)
+        .yield_per(10000)
+    )
+
+
+def _load_model():
     """
-    Collaborative Filtering Based Recommendation
+    Start from the snapshot written by the rebuild-recommender job when there
+    is one (much cheaper than reading every feedback row), then apply the
+    feedback committed since.
     """
+    from HandyHub.recommendation.model import RatingModel
 
-    # Load Feedback data
-    feedback_data = pd.read_sql('SELECT user_id, provider_id, rating FROM feedback', db.engine)
+    path = current_app.config.get('RECOMMENDER_SNAPSHOT')
+    if path and os.path.exists(path):
+        try:
+            model = RatingModel.from_file(path)
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable snapshot, build from the table instead
+        else:
+            for feedback_id, user_id, provider_id, rating in _feedback_rows(model.last_feedback_id):
+                model.add_rating(user_id, provider_id, rating, feedback_id=feedback_id)
+            model.compact()
+            return model
+    return RatingModel.from_rows(_feedback_rows())
 
-    if feedback_data.empty:
-        return []
 
-    # Create user-provider matrix
-    rating_matrix = feedback_data.pivot_table(index='user_id', columns='provider_id', values='rating').fillna(0)
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _load_model()
+    return _model
 
-    if user_id not in rating_matrix.index:
-        return []
 
-    # Compute similarity between users
-    user_similarity = cosine_similarity(rating_matrix)
-    user_similarity_df = pd.DataFrame(user_similarity, index=rating_matrix.index, columns=rating_matrix.index)
+def rebuild_model():
+    """Throw away the in-memory model and rebuild it from the feedback table."""
+    global _model
+    from HandyHub.recommendation.model import RatingModel
 
-    similar_users = user_similarity_df[user_id].sort_values(ascending=False)[1:]
+    model = RatingModel.from_rows(_feedback_rows())
+    with _model_lock:
+        _model = model
+    return model
 
-    weighted_ratings = pd.Series(dtype=float)
-    for sim_user_id, sim_score in similar_users.items():
-        user_ratings = rating_matrix.loc[sim_user_id]
-        weighted_ratings = weighted_ratings.add(user_ratings * sim_score, fill_value=0)
 
-    user_rated = rating_matrix.loc[user_id][rating_matrix.loc[user_id] > 0].index.tolist()
-    weighted_ratings = weighted_ratings.drop(user_rated, errors='ignore')
+def reset():
+    """Forget the model, indexes and cache, e.g. after switching databases in a benchmark."""
+    global _model, _indexes, _cache
+    with _model_lock:
+        _model = None
+    _indexes = None
+    _cache = None
 
-    provider_data = pd.read_sql('SELECT id, service_id FROM provider', db.engine)
-    provider_data = provider_data.set_index('id')
 
-    filtered_providers = provider_data[provider_data['service_id'] == int(selected_service_id)].index.tolist()
+def write_snapshot(path=None):
+    """Build the model from the feedback table and save it where workers load it from."""
+    from HandyHub.recommendation.model import RatingModel
 
-    weighted_ratings = weighted_ratings[weighted_ratings.index.isin(filtered_providers)]
+    path = path or current_app.config['RECOMMENDER_SNAPSHOT']
+    model = RatingModel.from_rows(_feedback_rows())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    model.save(path)
+    return model.last_feedback_id
 
-    recommended_provider_ids = weighted_ratings.sort_values(ascending=False).head(top_n).index.tolist()
 
-    # ❌ WRONG (remove this)
-    # recommended_providers = Provider.query.filter(Provider.id.in_(recommended_provider_ids)).all()
-    # return recommended_providers
+def _compact_async(model):
+    """Fold pending ratings into the base matrices on a background thread."""
+    global _compact_thread
+    if not model.needs_compaction:
+        return
+    with _model_lock:
+        if _compact_thread is None or not _compact_thread.is_alive():
+            _compact_thread = threading.Thread(target=model.compact, name='recommender-compact', daemon=True)
+            _compact_thread.start()
 
-    # ✅ CORRECT (return only IDs)
-    return recommended_provider_ids
 
+def get_cache():
+    global _cache
+    if _cache is None:
+        config = current_app.config
+        if config.get('RECOMMENDATION_CACHE_URL'):
+            backend = RedisCacheBackend(config['RECOMMENDATION_CACHE_URL'])
+        else:
+            backend = LocalCacheBackend(
+                max_entries=config['RECOMMENDATION_CACHE_SIZE'],
+                max_bytes=config['RECOMMENDATION_CACHE_MAX_BYTES'],
+            )
+        _cache = RecommendationCache(backend, ttl=config['RECOMMENDATION_CACHE_TTL'])
+    return _cache
 
-def get_top_rated_providers(selected_service_id, top_n=5):
+
+def refresh_model():
     """
-    Top Rated Providers Based Recommendation
+    Apply feedback written since the model was last updated. Picks up rows
+    committed by other workers too, at the cost of one primary-key range query,
+    and invalidates this worker's cached results for them.
     """
+    model = get_model()
+    applied = []
+    for feedback_id, user_id, provider_id, rating in _feedback_rows(model.applied_through):
+        model.add_rating(user_id, provider_id, rating, feedback_id=feedback_id)
+        applied.append((user_id, provider_id))
+    _compact_async(model)
 
-    # Load Provider and Feedback data
-    feedback_data = pd.read_sql('SELECT provider_id, rating FROM feedback', db.engine)
-    provider_data = pd.read_sql('SELECT id, service_id FROM provider', db.engine)
+    cache = get_cache()
+    if applied and not cache.backend.shared:
+        # A shared backend was already invalidated by the worker that took the write
+        services = dict(
+            db.session.query(Provider.id, Provider.service_id)
+            .filter(Provider.id.in_({provider_id for _, provider_id in applied}))
+        )
+        for user_id, provider_id in applied:
+            cache.invalidate_feedback(user_id, services.get(provider_id))
+    return len(applied)
 
-    if feedback_data.empty or provider_data.empty:
-        return []
 
-    # Filter providers by selected service category
-    provider_data = provider_data.set_index('id')
-    filtered_providers = provider_data[provider_data['service_id'] == int(selected_service_id)].index.tolist()
+def notify_feedback(feedback, service_id):
+    """Called after a Feedback row is committed."""
+    if _model is not None:
+        # Every row past the watermark in id order, not just this one: applying only ours
+        # would move the watermark past rows other workers committed meanwhile
+        refresh_model()
+    get_cache().invalidate_feedback(feedback.user_id, service_id)
+
+
+def notify_provider_changed(*service_ids):
+    """A provider's profile changed; drop cached results for its service(s)."""
+    cache = get_cache()
+    for service_id in set(service_ids):
+        cache.invalidate_service(service_id)
+
+
+def build_indexes(model=None, k=50):
+    """Build the top-K user-user and provider-provider neighbour indexes."""
+    global _indexes
+    from HandyHub.recommendation.neighbours import NeighbourIndex
+
+    model = model or get_model()
+    matrix, user_ids, provider_ids, last_feedback_id = model.snapshot()
+    user_index = NeighbourIndex.build(matrix, user_ids, k, last_feedback_id)
+    provider_index = NeighbourIndex.build(matrix.T, provider_ids, k, last_feedback_id)
+    _indexes = (user_index, provider_index)
+    return _indexes
+
+
+def rebuild_indexes_async(k=50):
+    """Rebuild the neighbour indexes on a background thread (one at a time)."""
+    global _index_thread
+    model = get_model()
+    with _index_lock:
+        if _index_thread is None or not _index_thread.is_alive():
+            _index_thread = threading.Thread(
+                target=build_indexes, args=(model, k), name='recommender-index', daemon=True
+            )
+            _index_thread.start()
+        return _index_thread
+
+
+def preload():
+    """
+    Build the model (and, in indexed mode, the neighbour indexes) up front.
+    Called in the gunicorn master so forked workers share the matrices
+    copy-on-write instead of each building its own.
+    """
+    model = get_model()
+    if current_app.config.get('RECOMMENDER_MODE') == 'indexed':
+        build_indexes(model, current_app.config['RECOMMENDER_NEIGHBOURS'])
+    return model
+
 
-    if not filtered_providers:
+def _service_provider_ids(service_id):
+    return [
+        provider_id for (provider_id,) in
+        db.session.query(Provider.id).filter(Provider.service_id == int(service_id))
+    ]
+
+
+def _score_with_indexes(model, indexes, user_id, candidate_ids, top_n):
+    user_index, provider_index = indexes
+    return (
+        model.recommend_from_neighbours(user_id, candidate_ids, user_index.lookup(user_id), top_n)
+        or model.recommend_by_items(user_id, candidate_ids, provider_index, top_n)
+    )
+
+
+def _recommend_indexed(model, user_id, candidate_ids, top_n):
+    """
+    Score using only the user's K precomputed neighbours (falling back to
+    item-item neighbours). Returns None when the index can't answer yet, so
+    the caller uses the exact path instead.
+    """
+    config = current_app.config
+    indexes = _indexes
+    if indexes is None or (
+        model.last_feedback_id - indexes[0].built_at_feedback_id >= config['RECOMMENDER_INDEX_REBUILD_EVERY']
+    ):
+        rebuild_indexes_async(config['RECOMMENDER_NEIGHBOURS'])
+    if indexes is None:
+        return None
+
+    if user_id not in indexes[0]:
+        return None
+    return _score_with_indexes(model, indexes, user_id, candidate_ids, top_n)
+
+
+@RECOMMENDER.time('get_recommendations')
+def get_recommendations(user_id, selected_service_id, top_n=5):
+    """
+    Collaborative Filtering Based Recommendation
+    """
+    refresh_model()
+    return get_cache().get_or_compute(
+        f'rec:{top_n}', user_id, selected_service_id,
+        lambda: _compute_recommendations(user_id, selected_service_id, top_n),
+    )
+
+
+def _compute_recommendations(user_id, selected_service_id, top_n):
+    model = get_model()
+
+    if not model.has_user(user_id):
         return []
 
-    # Calculate average rating for each provider
-    avg_ratings = feedback_data.groupby('provider_id')['rating'].mean()
+    candidate_ids = _service_provider_ids(selected_service_id)
+
+    # Returns provider IDs only, callers load the Provider rows
+    if current_app.config.get('RECOMMENDER_MODE') == 'indexed':
+        recommended = _recommend_indexed(model, user_id, candidate_ids, top_n)
+        if recommended is not None:
+            return recommended
+    return model.recommend(user_id, candidate_ids, top_n)
+
+
+def compare_recommenders(sample_size=200, top_n=5, k=None, seed=0):
+    """
+    Run the exact and indexed paths side by side on a sample of users and
+    report recall@top_n of the indexed results against exact, plus mean
+    latency of each path in milliseconds.
+    """
+    k = k or current_app.config['RECOMMENDER_NEIGHBOURS']
+    model = get_model()
+    indexes = build_indexes(model, k)
+
+    candidates = {service_id: _service_provider_ids(service_id) for (service_id,) in db.session.query(Service.id)}
+    user_ids = [int(uid) for uid in indexes[0].ids]
+    random.Random(seed).shuffle(user_ids)
+
+    hits = expected = runs = 0
+    exact_time = indexed_time = 0.0
+    for user_id in user_ids[:sample_size]:
+        for candidate_ids in candidates.values():
+            start = time.perf_counter()
+            exact = model.recommend(user_id, candidate_ids, top_n)
+            exact_time += time.perf_counter() - start
 
-    # Keep only providers in the selected service
-    avg_ratings = avg_ratings[avg_ratings.index.isin(filtered_providers)]
+            start = time.perf_counter()
+            indexed = _score_with_indexes(model, indexes, user_id, candidate_ids, top_n)
+            indexed_time += time.perf_counter() - start
 
-    # Sort and select top N providers
-    top_provider_ids = avg_ratings.sort_values(ascending=False).head(top_n).index.tolist()
+            hits += len(set(exact) & set(indexed))
+            expected += len(exact)
+            runs += 1
+
+    return {
+        'queries': runs,
+        'k': k,
+        'recall': hits / expected if expected else 1.0,
+        'exact_ms': exact_time * 1000 / runs if runs else 0.0,
+        'indexed_ms': indexed_time * 1000 / runs if runs else 0.0,
+    }
+
+
+@RECOMMENDER.time('get_top_rated_providers')
+def get_top_rated_providers(selected_service_id, top_n=5):
+    """
+    Top Rated Providers Based Recommendation
+    """
+    def compute():
+        rows = (
+            db.session.query(Provider.id)
+            .filter(Provider.service_id == int(selected_service_id), Provider.rating_count > 0)
+            .order_by(Provider.rating.desc(), Provider.rating_count.desc())
+            .limit(top_n)
+        )
+        return [provider_id for (provider_id,) in rows]
 
-    return top_provider_ids
+    return get_cache().get_or_compute(f'top:{top_n}', None, selected_service_id, compute)
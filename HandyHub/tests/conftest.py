@@ -0,0 +1,70 @@
+"""
+Shared fixtures: one app on a throwaway SQLite database, migrated to head
+and filled with a small seeded data set from benchmarks/data.py.
+"""
+import pytest
+from sqlalchemy import func
+
+from HandyHub.Handy import create_app
+from HandyHub.Handy.benchmarks.data import DEFAULT_PASSWORD, generate
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.migrations import upgrade
+from HandyHub.Handy.models import Booking, Provider, User
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    base = tmp_path_factory.mktemp('handyhub')
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('DATABASE_URL', f'sqlite:///{base / "test.db"}')
+        env.setenv('RECOMMENDER_SNAPSHOT', str(base / 'recommender.npz'))
+        env.setenv('SESSION_FILE_DIR', str(base / 'sessions'))
+        env.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1')  # Hashing cost isn't what's tested
+        env.setenv('RATELIMIT_ENABLED', '0')
+        app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        upgrade()
+        generate(users=60, providers=12, bookings=600, seed=1)
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+def busiest(app, model, column):
+    """Email of the customer or provider with the most bookings."""
+    with app.app_context():
+        return (
+            db.session.query(model.email).join(Booking, column == model.id)
+            .group_by(model.id).order_by(func.count(Booking.id).desc()).limit(1).scalar()
+        )
+
+
+def log_in(client, email, kind='customer', password=DEFAULT_PASSWORD):
+    response = client.post(f'/auth/{kind}-login', data={'email': email, 'password': password})
+    assert response.status_code == 302 and 'login' not in response.location, f'could not log in as {email}'
+    return client
+
+
+@pytest.fixture
+def login():
+    return log_in
+
+
+@pytest.fixture
+def customer_email(app):
+    return busiest(app, User, Booking.customer_id)
+
+
+@pytest.fixture
+def customer_client(app, customer_email):
+    return log_in(app.test_client(), customer_email, 'customer')
+
+
+@pytest.fixture
+def provider_client(app):
+    return log_in(app.test_client(), busiest(app, Provider, Booking.provider_id), 'provider')
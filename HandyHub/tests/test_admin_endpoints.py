@@ -0,0 +1,20 @@
+"""/metrics and the exports: off without a token, and only for the right bearer token."""
+import pytest
+
+ENDPOINTS = [('/metrics', 'METRICS_TOKEN'), ('/admin/export/bookings', 'EXPORT_TOKEN')]
+
+
+@pytest.mark.parametrize('url, setting', ENDPOINTS)
+def test_not_served_without_a_token(app, monkeypatch, url, setting):
+    monkeypatch.setitem(app.config, setting, None)
+    assert app.test_client().get(url, headers={'Authorization': 'Bearer '}).status_code == 404
+
+
+@pytest.mark.parametrize('url, setting', ENDPOINTS)
+def test_bearer_token_required(app, monkeypatch, url, setting):
+    monkeypatch.setitem(app.config, setting, 's3cret')
+    client = app.test_client()
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(url, headers={'Authorization': 'Bearer s3crét'}).status_code == 401
+    assert client.get(url, headers={'Authorization': 'Bearer s3cret'}).status_code == 200
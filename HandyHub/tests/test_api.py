@@ -0,0 +1,49 @@
+"""JSON API: what anonymous clients see, and ETags that follow the payload."""
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.models import Provider, User
+
+
+def _provider_id(app):
+    with app.app_context():
+        return db.session.query(Provider.id).order_by(Provider.id).limit(1).scalar()
+
+
+def test_provider_detail_hides_contact_details_from_anonymous_clients(app):
+    response = app.test_client().get(f'/api/v1/providers/{_provider_id(app)}')
+    assert response.status_code == 200
+    assert 'phone' not in response.json and 'email' not in response.json
+    assert response.cache_control.public
+
+
+def test_provider_detail_contact_details_are_private(app, customer_client):
+    response = customer_client.get(f'/api/v1/providers/{_provider_id(app)}')
+    assert response.json['phone'] and response.json['email']
+    assert response.cache_control.private and not response.cache_control.public
+    assert 'Cookie' in response.vary
+
+
+def test_booking_etag_follows_the_embedded_names(app, provider_client):
+    first = provider_client.get('/api/v1/bookings')
+    assert provider_client.get('/api/v1/bookings', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    with app.app_context():
+        customer = db.session.get(User, first.json['items'][0]['customer']['id'])
+        customer.first_name = customer.first_name + 'x'
+        db.session.commit()
+
+    second = provider_client.get('/api/v1/bookings', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.json['items'][0]['customer']['name'].split()[0].endswith('x')
+
+
+def test_only_single_resources_are_validated_by_date(app):
+    client = app.test_client()
+    future = {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}
+
+    listing = client.get('/api/v1/providers', headers=future)
+    assert listing.status_code == 200  # A date can't tell that the set of rows changed
+    assert 'Last-Modified' not in listing.headers and listing.headers['ETag']
+
+    detail = client.get(f'/api/v1/providers/{_provider_id(app)}')
+    assert detail.headers['Last-Modified']
+    assert client.get(f'/api/v1/providers/{_provider_id(app)}', headers=future).status_code == 304
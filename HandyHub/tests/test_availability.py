@@ -0,0 +1,26 @@
+"""Working hours: the defaults only apply until a provider saves their own."""
+from datetime import date, timedelta
+
+from HandyHub.Handy.availability import DEFAULT_WORKING_HOURS, free_slots, weekly_schedule
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.models import Provider
+
+
+def test_saving_every_day_off_keeps_every_day_off(app, login):
+    with app.app_context():
+        provider = Provider.query.filter_by(hours_configured=False).order_by(Provider.id.desc()).first()
+        email = provider.email
+        assert set(weekly_schedule(provider.id)) == set(DEFAULT_WORKING_HOURS)
+
+    client = login(app.test_client(), email, 'provider')
+    assert client.post('/availability', data={'action': 'hours'}).status_code == 302
+    assert client.get('/availability').status_code == 200
+
+    with app.app_context():
+        provider = Provider.query.filter_by(email=email).one()
+        assert provider.hours_configured
+        assert weekly_schedule(provider.id) == {}
+        start = date.today() + timedelta(days=1)
+        assert free_slots(provider.id, start, start + timedelta(days=13)) == {}
+        provider.hours_configured = False
+        db.session.commit()
@@ -0,0 +1,25 @@
+"""The in-process cache backend stays bounded, generation counters included."""
+from HandyHub.recommendation.cache import LocalCacheBackend
+
+
+def test_counters_are_bounded():
+    backend = LocalCacheBackend(max_entries=10, max_counters=10)
+    for user_id in range(1000):
+        backend.incr(('gen', 'user', user_id))
+    assert backend.stats()['counters'] == 10
+
+
+def test_dropped_counter_never_goes_back():
+    # Entries compare their stored generation for equality, so a counter
+    # that returned to an earlier value would revive stale entries
+    backend = LocalCacheBackend(max_entries=10, max_counters=2)
+    key = ('gen', 'user', 1)
+    seen = [backend.counter(key)]
+    for _ in range(3):
+        bumped = backend.incr(key)
+        assert bumped > max(seen)
+        seen.append(bumped)
+        for other in range(2, 5):  # Pushes key's counter out
+            backend.incr(('gen', 'user', other))
+        assert backend.counter(key) >= bumped
+        seen.append(backend.counter(key))
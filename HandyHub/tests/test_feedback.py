@@ -0,0 +1,25 @@
+"""Feedback form: only a 1-5 star rating is recorded."""
+import pytest
+
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.models import Booking, Feedback, User
+
+
+@pytest.fixture
+def unreviewed_booking(app, customer_email):
+    with app.app_context():
+        return (
+            db.session.query(Booking.id).join(User, Booking.customer_id == User.id)
+            .outerjoin(Feedback, Feedback.booking_id == Booking.id)
+            .filter(User.email == customer_email, Feedback.id.is_(None))
+            .order_by(Booking.id).limit(1).scalar()
+        )
+
+
+@pytest.mark.parametrize('rating', ['0', '6', '99', '-1', '4.5', 'five', ''])
+def test_out_of_range_rating_is_rejected(app, customer_client, unreviewed_booking, rating):
+    response = customer_client.post(f'/submit_feedback?booking_id={unreviewed_booking}',
+                                    data={'rating': rating, 'comment': ''})
+    assert response.status_code == 302 and '/submit_feedback' in response.location
+    with app.app_context():
+        assert Feedback.query.filter_by(booking_id=unreviewed_booking).count() == 0
@@ -0,0 +1,54 @@
+"""Distance-sorted directory: the price range is part of the nearest search, pages follow (distance, id)."""
+import base64
+import json
+
+import pytest
+
+from HandyHub.Handy import geo
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.models import Provider
+from HandyHub.Handy.pagination import InvalidCursor
+
+ORIGIN = (17.385, 78.4867)
+
+
+@pytest.fixture
+def placed(app_context):
+    """Providers roughly 1 km apart going north from ORIGIN; undone afterwards."""
+    providers = Provider.query.order_by(Provider.id).all()
+    for step, provider in enumerate(providers):
+        geo.set_coordinates(provider, f'{ORIGIN[0] + 0.01 * step}, {ORIGIN[1]}')
+    db.session.flush()
+    yield providers
+    db.session.rollback()
+
+
+def test_price_filter_does_not_shrink_the_page(placed):
+    prices = sorted(provider.service_price for provider in placed)
+    max_price = prices[len(prices) // 2]
+    expected = [
+        provider.id for provider, _ in geo.nearby_providers(*ORIGIN, radius_km=geo.MAX_RADIUS_KM)
+        if provider.service_price <= max_price
+    ]
+
+    seen, cursor = [], None
+    while True:
+        page = geo.nearest_page(*ORIGIN, max_price=max_price, cursor=cursor, per_page=3)
+        assert len(page) == 3 or not page.has_next
+        seen += [provider.id for provider, _ in page]
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert seen == expected
+
+
+def test_bad_cursor_is_rejected(placed):
+    with pytest.raises(InvalidCursor):
+        geo.nearest_page(*ORIGIN, cursor='not-a-cursor')
+
+
+@pytest.mark.parametrize('value', ['x', [1], None, -1, True])
+def test_cursor_distance_must_be_a_non_negative_number(placed, value):
+    cursor = base64.urlsafe_b64encode(json.dumps([value, 2]).encode()).decode()
+    with pytest.raises(InvalidCursor):
+        geo.nearest_page(*ORIGIN, cursor=cursor)
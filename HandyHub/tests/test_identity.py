@@ -0,0 +1,32 @@
+"""Cached logins: hits run no query, and invalidations reach every worker sharing the counters."""
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.identity import IdentityCache, get_identity_cache, load_account
+from HandyHub.Handy.models import User
+from HandyHub.Handy.testing import assert_max_queries
+from HandyHub.recommendation.cache import LocalCacheBackend
+
+
+def test_warm_account_is_loaded_without_a_query(app, customer_email):
+    with app.app_context():
+        account_id = User.query.filter_by(email=customer_email).one().get_id()
+        get_identity_cache().clear()
+        db.session.remove()
+        assert load_account(account_id) is not None  # Miss: loads and caches the row
+        db.session.remove()
+        with assert_max_queries(0):
+            account = load_account(account_id)
+        assert account.email == customer_email
+
+
+def test_invalidation_through_shared_counters_reaches_other_workers():
+    shared = LocalCacheBackend()  # Stands in for Redis
+    ours, theirs = IdentityCache(versions=shared), IdentityCache(versions=shared)
+    ours.set('customer', 7, ours.generation('customer', 7), {'id': 7})
+    assert ours.get('customer', 7) == {'id': 7}
+
+    theirs.invalidate('customer', 7)
+    assert ours.get('customer', 7) is None
+
+    ours.set('customer', 7, ours.generation('customer', 7), {'id': 7})
+    theirs.invalidate_all()
+    assert ours.get('customer', 7) is None
@@ -0,0 +1,49 @@
+"""Keyset cursors: anything but a well-typed (value, id) is a 400, never a query error."""
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from HandyHub.Handy.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def _cursor(value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode().rstrip('=')
+
+
+def test_round_trip_keeps_the_type():
+    at = datetime(2024, 5, 1, 12, 30)
+    assert decode_cursor(encode_cursor(at, 7), datetime) == (at, 7)
+    assert decode_cursor(encode_cursor(4, 7), float) == (4.0, 7)
+
+
+@pytest.mark.parametrize('cursor, value_type', [
+    (_cursor([1, 2], 3), float),
+    (_cursor('4.5', 3), float),
+    (_cursor(True, 3), float),
+    (_cursor(4.5, 3), datetime),
+    (_cursor(4.5, '3'), float),
+    (_cursor(4.5, [3]), None),
+    ('not-base64!', None),
+])
+def test_malformed_cursors_are_rejected(cursor, value_type):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, value_type)
+
+
+@pytest.mark.parametrize('path, value, status', [
+    ('/handyman?sort=rating', [1, 2], 400),
+    ('/handyman?sort=rating', 'x', 400),
+    ('/handyman?sort=rating', 3.5, 200),
+    ('/handyman?sort=newest', 3.5, 400),
+    ('/api/v1/providers?sort=experience', [1], 400),
+    ('/booking-history', 'x', 400),
+])
+def test_customer_pages_check_the_cursor(customer_client, path, value, status):
+    separator = '&' if '?' in path else '?'
+    assert customer_client.get(f'{path}{separator}cursor={_cursor(value, 3)}').status_code == status
+
+
+def test_provider_bookings_answer_400(provider_client):
+    assert provider_client.get(f'/provider-bookings?cursor={_cursor([1, 2], 3)}').status_code == 400
@@ -0,0 +1,128 @@
+"""
+The PostgreSQL-only code paths: the migrations, the rollups' ON CONFLICT
+upserts and rebuild_rollups' LOCK TABLE. Runs in a throwaway schema of the
+database in TEST_DATABASE_URL (or DATABASE_URL, if that is PostgreSQL) and
+is skipped without one.
+"""
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+from HandyHub.Handy import create_app, fragments, identity, queries
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.migrations import MIGRATIONS, current_version, head_version, upgrade
+from HandyHub.Handy.models import Booking, Feedback, Provider, ProviderDailyStats, Service, User
+from HandyHub.Handy.passwords import hash_password
+from HandyHub.Handy.rollups import provider_dashboard, rebuild_rollups
+from HandyHub.recommendation import recommendation_engine
+
+PASSWORD = 'password'
+URL = os.environ.get('TEST_DATABASE_URL') or os.environ.get('DATABASE_URL') or ''
+if URL.startswith('postgres://'):
+    URL = 'postgresql://' + URL[len('postgres://'):]
+
+pytestmark = pytest.mark.skipif(not URL.startswith('postgresql'),
+                                reason='needs TEST_DATABASE_URL pointing at PostgreSQL')
+
+# Process-wide caches that would otherwise mix this app's rows with the SQLite app's
+PROCESS_STATE = [
+    (identity, '_cache'), (fragments, '_cache'), (queries, '_service_catalog'),
+    (recommendation_engine, '_model'), (recommendation_engine, '_indexes'), (recommendation_engine, '_cache'),
+]
+
+
+@pytest.fixture(scope='module')
+def pg_app(tmp_path_factory):
+    pytest.importorskip('psycopg2')
+    schema = f'handyhub_test_{uuid.uuid4().hex[:12]}'
+    admin = create_engine(URL)
+    with admin.begin() as conn:
+        conn.exec_driver_sql(f'CREATE SCHEMA {schema}')
+    scoped = make_url(URL).update_query_dict({'options': f'-csearch_path={schema}'})
+    base = tmp_path_factory.mktemp('handyhub-pg')
+    try:
+        with pytest.MonkeyPatch.context() as env:
+            env.setenv('DATABASE_URL', scoped.render_as_string(hide_password=False))
+            env.setenv('RECOMMENDER_SNAPSHOT', str(base / 'recommender.npz'))
+            env.setenv('SESSION_FILE_DIR', str(base / 'sessions'))
+            env.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1')
+            env.setenv('RATELIMIT_ENABLED', '0')
+            for module, name in PROCESS_STATE:
+                env.setattr(module, name, None)
+            app = create_app()
+            app.config['TESTING'] = True
+            yield app
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+    finally:
+        with admin.begin() as conn:
+            conn.exec_driver_sql(f'DROP SCHEMA {schema} CASCADE')
+        admin.dispose()
+
+
+def _log_in(app, kind, email):
+    client = app.test_client()
+    response = client.post(f'/auth/{kind}-login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302 and 'login' not in response.location
+    return client
+
+
+def test_migrations_apply_and_rerun(pg_app):
+    with pg_app.app_context():
+        applied = upgrade()
+        assert [version for version, _ in applied] == [version for version, _, _ in MIGRATIONS]
+        assert current_version() == head_version()
+        assert upgrade() == []
+
+
+def test_booking_and_feedback_round_trip(pg_app):
+    with pg_app.app_context():
+        upgrade()
+        service = Service(name='Plumbing')
+        db.session.add(service)
+        db.session.flush()
+        password_hash = hash_password(PASSWORD)
+        customer = User(first_name='Pat', last_name='Kim', email='pat@pg.handyhub.test', phone='10000000001',
+                        address='Hyderabad', role='customer', password_hash=password_hash)
+        provider = Provider(first_name='Sam', last_name='Khan', business_name='Khan Plumbing',
+                            email='sam@pg.handyhub.test', phone='20000000001', password_hash=password_hash,
+                            service_id=service.id, service_price=80.0, role='provider')
+        db.session.add_all([customer, provider])
+        db.session.commit()
+        provider_id = provider.id
+
+    day = date.today() + timedelta(days=1)
+    if day.weekday() == 6:
+        day += timedelta(days=1)
+    customer_client = _log_in(pg_app, 'customer', 'pat@pg.handyhub.test')
+    for at in ('10:00', '11:00'):  # The second lands on the first's rollup row: ON CONFLICT DO UPDATE
+        response = customer_client.post(f'/book/{provider_id}', data={'booking_date': day.isoformat(),
+                                                                       'booking_time': at})
+        assert response.location.endswith('/booking-history')
+
+    with pg_app.app_context():
+        done, rejected = [booking.id for booking in Booking.query.order_by(Booking.booking_time)]
+    provider_client = _log_in(pg_app, 'provider', 'sam@pg.handyhub.test')
+    provider_client.post(f'/confirm-booking/{done}')
+    provider_client.post(f'/complete-booking/{done}')
+    provider_client.post(f'/reject-booking/{rejected}')
+    customer_client.post(f'/submit_feedback?booking_id={done}', data={'rating': '4', 'comment': ''})
+
+    with pg_app.app_context():
+        assert Feedback.query.filter_by(booking_id=done).count() == 1
+        assert db.session.get(Provider, provider_id).rating == 4.0
+        stats = ProviderDailyStats.query.filter_by(provider_id=provider_id, day=day).one()
+        assert (stats.pending, stats.confirmed, stats.completed, stats.rejected) == (0, 0, 1, 1)
+        assert stats.revenue == 80.0
+        lifetime = provider_dashboard(provider_id)['lifetime']
+        assert (lifetime.bookings, lifetime.rating_count, lifetime.average_rating) == (2, 1, 4.0)
+
+        # Takes the table lock; the incremental rows must match a full recompute
+        with db.engine.begin() as conn:
+            written, changed = rebuild_rollups(conn)
+        assert written == 2 and changed == 0
@@ -0,0 +1,53 @@
+"""
+Statement counts for the listing pages. Each loads what its template needs
+up front (see queries.py), so the count stays fixed however many rows the
+page shows; an N+1 creeping back in fails here.
+
+Caches are emptied first, so the bounds are for a cold request. No app
+context is held around the requests: each gets its own database session,
+as in production.
+"""
+import pytest
+
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.fragments import get_fragment_cache
+from HandyHub.Handy.identity import get_identity_cache
+from HandyHub.Handy.queries import BOOKINGS_PAGE_SIZE
+from HandyHub.Handy.testing import assert_max_queries
+from HandyHub.recommendation.recommendation_engine import get_cache
+
+
+@pytest.fixture
+def engine(app, customer_client, provider_client):
+    # After logging in, so only the measured request starts cold
+    with app.app_context():
+        get_identity_cache().clear()
+        get_fragment_cache().clear()
+        get_cache().clear()
+        return db.engine
+
+
+@pytest.mark.parametrize('path, max_queries', [
+    ('/handyman', 3),
+    ('/handyman?sort=price', 3),
+    ('/handyman?serviceCategory=1', 7),  # Plus the recommender catching up, and the picks
+])
+def test_directory(engine, customer_client, path, max_queries):
+    with assert_max_queries(max_queries, engine):
+        response = customer_client.get(path)
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('/book/') >= 3  # Several cards, each with its service
+
+
+def test_booking_history(engine, customer_client):
+    with assert_max_queries(2, engine):
+        response = customer_client.get('/booking-history')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('<tr>') > BOOKINGS_PAGE_SIZE // 2
+
+
+def test_provider_bookings(engine, provider_client):
+    with assert_max_queries(2, engine):
+        response = provider_client.get('/provider-bookings')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('<tr>') > BOOKINGS_PAGE_SIZE // 2
@@ -0,0 +1,16 @@
+"""The hot read paths keep their indexes (see query_plans.py) on a freshly migrated database."""
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.query_plans import check_query_plans, full_scans
+
+
+def test_hot_queries_do_not_scan_whole_tables(app_context):
+    results = check_query_plans()
+    assert results
+    scans = {f'{name}: {statement}': scans for name, statement, details, scans in results if scans}
+    assert not scans
+
+
+def test_unindexed_lookup_is_reported(app_context):
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN SELECT id FROM provider WHERE business_name = 'x'").fetchall()
+    assert full_scans(plan) == ['SCAN provider']
@@ -0,0 +1,55 @@
+"""The in-memory recommender model keeps up with feedback from every worker."""
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.models import Booking, Feedback
+from HandyHub.recommendation import recommendation_engine as engine
+from HandyHub.recommendation.model import RatingModel
+
+
+def _rating(model, user_id, provider_id):
+    matrix, user_ids, provider_ids, _ = model.snapshot()
+    row = list(user_ids).index(user_id)
+    col = list(provider_ids).index(provider_id)
+    return matrix[row, col]
+
+
+def _review(booking, rating):
+    feedback = Feedback(booking_id=booking.id, provider_id=booking.provider_id, user_id=booking.customer_id,
+                        rating=rating)
+    db.session.add(feedback)
+    db.session.commit()
+    return feedback
+
+
+def test_notify_applies_rows_committed_elsewhere(app_context):
+    model = engine.get_model()
+    engine.refresh_model()
+    unreviewed = (
+        Booking.query.outerjoin(Feedback, Feedback.booking_id == Booking.id)
+        .filter(Feedback.id.is_(None)).order_by(Booking.id).limit(2).all()
+    )
+    other_worker = _review(unreviewed[0], 5)  # Committed by another worker, which notified itself only
+    ours = _review(unreviewed[1], 1)
+    engine.notify_feedback(ours, None)
+
+    assert model.applied_through == ours.id
+    assert _rating(model, other_worker.user_id, other_worker.provider_id) > 0
+
+
+def test_out_of_order_commit_is_picked_up_later():
+    model = RatingModel.from_rows([(1, 10, 20, 4.0)])
+    model.add_rating(11, 21, 3.0, feedback_id=3)  # Id 2 is still in flight
+    assert model.applied_through == 1
+
+    model.add_rating(12, 20, 5.0, feedback_id=2)
+    assert model.applied_through == 3
+    assert _rating(model, 12, 20) == 5.0
+
+    model.add_rating(12, 20, 1.0, feedback_id=2)  # Seen again by a later refresh: no double count
+    assert _rating(model, 12, 20) == 5.0
+
+
+def test_gap_is_given_up_after_the_timeout():
+    model = RatingModel.from_rows([(1, 10, 20, 4.0)])
+    model.gap_timeout = 0.0
+    model.add_rating(11, 21, 3.0, feedback_id=3)  # Id 2 was rolled back
+    assert model.applied_through == 3
@@ -0,0 +1,56 @@
+"""Profile pictures: a rejected upload is a flash message, not a 500, and changes nothing."""
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from HandyHub.Handy import images
+from HandyHub.Handy.extensions import db
+from HandyHub.Handy.models import User
+
+
+def _customer(app, email):
+    with app.app_context():
+        return db.session.execute(db.select(User.first_name, User.image).where(User.email == email)).one()
+
+
+def test_oversized_picture_is_refused_without_saving_the_form(app, customer_client, customer_email, monkeypatch):
+    monkeypatch.setattr(images, 'MAX_UPLOAD_BYTES', 1024)
+    before = _customer(app, customer_email)
+
+    response = customer_client.post('/profile-customer', data={
+        'first_name': 'Changed', 'image': (BytesIO(b'x' * 4096), 'big.png'),
+    })
+    assert response.status_code == 302 and response.location.endswith('/profile-customer')
+    assert _customer(app, customer_email) == before
+    with customer_client.session_transaction() as session:
+        assert session['_flashes'][-1][0] == 'danger'
+
+
+def test_request_body_over_the_limit_is_413(app, customer_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    response = customer_client.post('/profile-customer', data={'image': (BytesIO(b'x' * 4096), 'big.png')})
+    assert response.status_code == 413
+
+
+def test_non_image_with_an_image_extension_is_refused(app, customer_client, customer_email):
+    before = _customer(app, customer_email)
+    response = customer_client.post('/profile-customer', data={
+        'first_name': 'Changed', 'image': (BytesIO(b'<html><script>alert(1)</script></html>'), 'evil.png'),
+    })
+    assert response.status_code == 302
+    assert _customer(app, customer_email) == before
+    with app.app_context():
+        assert not [name for name in os.listdir(images.upload_dir()) if name.endswith('.upload')]
+
+
+@pytest.mark.parametrize('fmt, ext, ok', [('PNG', 'png', True), ('JPEG', 'jpg', True), ('PNG', 'jpg', False)])
+def test_content_has_to_match_the_extension(tmp_path, fmt, ext, ok):
+    path = tmp_path / f'picture.{ext}'
+    Image.new('RGB', (8, 8)).save(path, fmt)
+    if ok:
+        images.check_image(path, ext)
+    else:
+        with pytest.raises(images.InvalidImage):
+            images.check_image(path, ext)